@@ -0,0 +1,201 @@
+import io
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+MP4_EPOCH = datetime(1904, 1, 1)
+START_DATE = datetime(2023, 6, 1, 8, 30)
+PLACEHOLDER_DATE = '2000:01:01 00:00:00'
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Cameras start a new DCIM folder every few hundred shots
+FILES_PER_FOLDER = 500
+
+# Share of the corpus for each kind of file; bursts are drawn from 'jpeg'
+KIND_WEIGHTS = {
+    'jpeg': 0.76,
+    'jpeg_no_exif': 0.04,
+    'mp4': 0.10,
+    'mov': 0.08,
+    'corrupt': 0.02,
+}
+BURST_CHANCE = 0.02
+BURST_LENGTH = (3, 12)
+
+# Seconds between shots in a session, and hours between sessions
+SHOT_GAP = (5, 600)
+SESSION_GAP_HOURS = (3, 48)
+SHOTS_PER_SESSION = (20, 400)
+
+
+def _jpeg_template():
+    # One small JPEG with placeholder dates; each file is a copy with the
+    # dates patched in, which keeps 100k-file corpora quick to write
+    exif = Image.Exif()
+    exif[0x0132] = PLACEHOLDER_DATE
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0x9003] = PLACEHOLDER_DATE
+    exif_ifd[0x9291] = '000'
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 12), (90, 120, 160)).save(buffer, 'JPEG', exif=exif.tobytes(), quality=70)
+    data = buffer.getvalue()
+
+    placeholder = PLACEHOLDER_DATE.encode('ascii')
+    date_offsets = []
+    offset = data.find(placeholder)
+    while offset != -1:
+        date_offsets.append(offset)
+        offset = data.find(placeholder, offset + 1)
+
+    # SubSecTimeOriginal ('000' plus NUL) fits in its IFD entry's value field
+    tiff_start = data.find(b'Exif\x00\x00') + 6
+    order = '<' if data[tiff_start:tiff_start + 2] == b'II' else '>'
+    entry = data.find(struct.pack(order + 'HHI', 0x9291, 2, 4), tiff_start)
+    return data, date_offsets, entry + 8
+
+
+def _plain_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 12), (160, 120, 90)).save(buffer, 'JPEG', quality=70)
+    return buffer.getvalue()
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _mvhd(dt):
+    seconds = int((dt - MP4_EPOCH).total_seconds()) if dt is not None else 0
+    payload = struct.pack('>4xIIII', seconds, seconds, 1000, 10000)
+    return _box(b'mvhd', payload.ljust(100, b'\x00'))
+
+
+def _mp4(dt, padding):
+    # GoPro style: moov up front, creation time in mvhd and udta
+    day = dt.strftime('%Y-%m-%dT%H:%M:%SZ').encode('ascii')
+    udta = _box(b'udta', _box(b'\xa9day', struct.pack('>HH', len(day), 0x55c4) + day))
+    return (_box(b'ftyp', b'mp42\x00\x00\x00\x00mp42isom') + _box(b'moov', _mvhd(dt) + udta)
+            + _box(b'mdat', bytes(padding)))
+
+
+def _mov(dt, padding):
+    # iPhone style: moov after the media data, no mvhd time, and the local
+    # creation date under moov/meta keys
+    key = b'com.apple.quicktime.creationdate'
+    value = (dt.strftime('%Y-%m-%dT%H:%M:%S') + '+0200').encode('ascii')
+    keys = _box(b'keys', struct.pack('>4xI', 1) + struct.pack('>I4s', 8 + len(key), b'mdta') + key)
+    ilst = _box(b'ilst', _box(struct.pack('>I', 1), _box(b'data', struct.pack('>II', 1, 0) + value)))
+    meta = _box(b'meta', keys + ilst)
+    return (_box(b'ftyp', b'qt  \x00\x00\x00\x00qt  ') + _box(b'mdat', bytes(padding))
+            + _box(b'moov', _mvhd(None) + meta))
+
+
+def _corrupt(rng, jpeg):
+    choice = rng.randrange(3)
+    if choice == 0:
+        # Cut off part way through the EXIF block
+        return '.JPG', jpeg[:rng.randrange(24, 100)]
+    if choice == 1:
+        # Box headers that claim more data than the file has
+        return '.MP4', struct.pack('>I4s', 0x7fffffff, b'ftyp') + rng.randbytes(200)
+    return rng.choice(['.JPG', '.MP4']), b''
+
+
+def _shot_times(rng, count):
+    # Sessions of shots a few seconds to minutes apart, hours between sessions
+    dt = START_DATE
+    remaining_in_session = rng.randint(*SHOTS_PER_SESSION)
+    for _ in range(count):
+        yield dt
+        remaining_in_session -= 1
+        if remaining_in_session <= 0:
+            dt += timedelta(hours=rng.uniform(*SESSION_GAP_HOURS))
+            remaining_in_session = rng.randint(*SHOTS_PER_SESSION)
+        else:
+            dt += timedelta(seconds=rng.randint(*SHOT_GAP))
+
+
+def generate_corpus(root, count, seed=0, video_bytes=4096):
+    """Write count camera-like files under root/DCIM and describe them.
+
+    The same seed always gives the same names, contents and timestamps.
+    Files are spread over numbered DCIM folders like a memory card, frame
+    numbers wrap at 9999 so names repeat across folders, bursts put several
+    JPEGs in the same second (told apart by SubSecTimeOriginal), and a few
+    files are empty, truncated or not what their extension says.
+    """
+    rng = random.Random(seed)
+    jpeg, date_offsets, subsec_offset = _jpeg_template()
+    plain_jpeg = _plain_jpeg()
+    kinds = list(KIND_WEIGHTS)
+    weights = list(KIND_WEIGHTS.values())
+
+    counts = dict.fromkeys(kinds + ['burst'], 0)
+    total_bytes = 0
+    folders = set()
+    frame = 0
+    burst_left = 0
+    burst_subsec = 0
+    burst_dt = None
+    times = _shot_times(rng, count)
+    for i in range(count):
+        dt = next(times)
+        frame = frame % 9999 + 1
+        folder = os.path.join(root, 'DCIM', f"{100 + i // FILES_PER_FOLDER}PAVO")
+        if folder not in folders:
+            os.makedirs(folder, exist_ok=True)
+            folders.add(folder)
+
+        if burst_left:
+            kind = 'burst'
+            burst_left -= 1
+            burst_subsec += rng.randint(40, 200)
+            dt = burst_dt
+        else:
+            kind = rng.choices(kinds, weights)[0]
+            if kind == 'jpeg' and rng.random() < BURST_CHANCE:
+                kind = 'burst'
+                burst_left = rng.randint(*BURST_LENGTH) - 1
+                burst_subsec = rng.randint(0, 200)
+                burst_dt = dt
+        counts[kind] += 1
+
+        if kind in ('jpeg', 'burst'):
+            data = bytearray(jpeg)
+            stamp = dt.strftime(EXIF_DATE_FORMAT).encode('ascii')
+            for offset in date_offsets:
+                data[offset:offset + len(stamp)] = stamp
+            subsec = burst_subsec if kind == 'burst' else rng.randrange(1000)
+            data[subsec_offset:subsec_offset + 3] = f"{min(subsec, 999):03d}".encode('ascii')
+            name = f"IMG_{frame:04d}.JPG"
+        elif kind == 'jpeg_no_exif':
+            data = plain_jpeg
+            name = f"IMG_{frame:04d}.JPG"
+        elif kind == 'mp4':
+            data = _mp4(dt, video_bytes)
+            name = f"GX01{frame:04d}.MP4"
+        elif kind == 'mov':
+            data = _mov(dt, video_bytes)
+            name = f"IMG_{frame:04d}.MOV"
+        else:
+            suffix, data = _corrupt(rng, jpeg)
+            name = f"IMG_{frame:04d}{suffix}"
+
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        # Modification times a little after the shot, as cameras write them
+        mtime_ns = int((dt.timestamp() + rng.uniform(0.5, 3)) * 1e9)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        total_bytes += len(data)
+
+    return {
+        'files': count,
+        'seed': seed,
+        'bytes': total_bytes,
+        'folders': len(folders),
+        'kinds': counts,
+    }
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from pavo import core
+from pavo.cache import MetadataCache
+from pavo.engine import ExtractionEngine
+from pavo.filetable import FileTable
+from pavo.journal import Journal
+from pavo.layout import READ_ORDERS, is_rotational
+from pavo.mover import MoveScheduler
+from pavo.stats import RunStats
+
+# Results format version, bumped when stage names or fields change meaning
+RESULTS_VERSION = 2
+
+DEFAULT_SIZES = ['1k', '10k']
+CUSTOM_NAME = 'Bench'
+
+# Stage changes smaller than this, or in stages quicker than
+# COMPARE_MIN_SECONDS, are treated as noise by --compare
+COMPARE_TOLERANCE = 0.10
+COMPARE_MIN_SECONDS = 0.05
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('m'):
+        multiplier, text = 1_000_000, text[:-1]
+    return int(float(text) * multiplier)
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def evict_pages(paths):
+    """Drop files' pages from the OS page cache, so the next read comes
+    from the disk; False where that can't be done (not POSIX).
+
+    Only the file data goes: directories and inodes stay cached, so cold
+    numbers still flatter a real first read of a memory card.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            # Dirty pages aren't dropped, and a fresh corpus is still dirty
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return True
+
+
+class Stages:
+    # Wall and CPU time of each stage of one run, in the order they ran
+    def __init__(self):
+        self.results = {}
+
+    def time(self, name, func, count=None):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        if count is None:
+            count = len(result)
+        self.results[name] = {
+            'seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'files': count,
+            'files_per_sec': round(count / wall, 1) if wall > 0 else None,
+        }
+        return result
+
+
+def run_pipeline(root, engine_options, stages):
+    entries = stages.time('scan', lambda: list(core.iter_media_files(root, recursive=True)))
+
+    # No session index, so the second pass is answered by the persistent cache
+    extraction_stats = RunStats('benchmark')
+    engine = ExtractionEngine(cache=MetadataCache(Path(root).parent / 'metadata.sqlite3'), stats=extraction_stats,
+                              **engine_options)
+    try:
+        extracted = stages.time('extract', lambda: list(core.extract_datetimes(entries, engine)))
+        stages.time('extract_cached', lambda: list(core.extract_datetimes(entries, engine)))
+    finally:
+        engine.shutdown()
+
+    # Reads from the disk rather than the page cache, in name order and then
+    # in the order the files sit on the disk; no metadata cache
+    cold = {'device_rotational': is_rotational(os.stat(root).st_dev)}
+    for read_order in ('name', 'physical'):
+        if not evict_pages(entry.path for entry in entries):
+            break
+        engine = ExtractionEngine(**dict(engine_options, read_order=read_order))
+        try:
+            stages.time(f"extract_cold_{read_order}", lambda: list(core.extract_datetimes(entries, engine)))
+        finally:
+            engine.shutdown()
+
+    table = stages.time('index', lambda: FileTable.from_extracted(extracted))
+    options = core.OrganizeOptions()
+
+    def sort_and_group():
+        table.sort_by_capture()
+        return core.group_files_for_organization(table, options)
+    stages.time('grouping', sort_and_group, count=len(table))
+    new_names = stages.time('naming', lambda: core.plan_renames(table, CUSTOM_NAME))
+
+    def apply_renames():
+        journal = Journal.create('rename', root)
+        return [(i, new_path) for i, new_path, error in core.apply_renames(table, new_names, journal) if not error]
+    renamed = stages.time('rename_apply', apply_renames)
+
+    # Organize what the rename left behind, as a user would next
+    renamed_files = FileTable.from_extracted((new_path, table.datetime(i), table.dt_source(i))
+                                             for i, new_path in renamed)
+    renamed_files.sort_by_capture()
+    organization_plan = stages.time('organize_plan',
+                                    lambda: list(core.plan_organization(renamed_files, root, options)))
+
+    def apply_organization():
+        journal = Journal.create('organize', root)
+        return [item for item, _, error in core.apply_organization(organization_plan, journal, MoveScheduler())
+                if not error]
+    stages.time('organize_apply', apply_organization)
+
+    # Per-extractor counts and latencies from the cold pass (and the cache
+    # hits of the second one)
+    details = extraction_stats.to_dict()
+    extraction = {key: details[key] for key in ('bytes_read', 'lookups', 'sources', 'extractors', 'latency', 'slowest')}
+    memory = {'index_bytes': table.memory_usage(),
+              'bytes_per_file': round(table.memory_usage() / len(table), 1) if len(table) else None}
+    return extraction, memory, cold
+
+
+def run_benchmark(count, seed=0, video_bytes=4096, engine_options=None, keep=False):
+    """Generate a corpus of count files in a temp dir and time each stage."""
+    temp_dir = tempfile.mkdtemp(prefix='pavo-bench-')
+    previous_cache_dir = os.environ.get('PAVO_CACHE_DIR')
+    # Journals and the metadata cache stay inside the temp dir
+    os.environ['PAVO_CACHE_DIR'] = os.path.join(temp_dir, 'cache')
+    try:
+        root = os.path.join(temp_dir, 'corpus')
+        started = time.perf_counter()
+        corpus = generate_corpus(root, count, seed, video_bytes)
+        corpus['generate_seconds'] = round(time.perf_counter() - started, 3)
+
+        stages = Stages()
+        extraction, memory, cold = run_pipeline(root, engine_options or {}, stages)
+        return {'files': count, 'corpus': corpus, 'stages': stages.results, 'extraction': extraction,
+                'memory': memory, 'cold': cold}
+    finally:
+        if previous_cache_dir is None:
+            os.environ.pop('PAVO_CACHE_DIR', None)
+        else:
+            os.environ['PAVO_CACHE_DIR'] = previous_cache_dir
+        if keep:
+            print(f"Corpus kept in {temp_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def print_summary(run):
+    print(f"{run['files']} files ({run['corpus']['bytes'] / 1e6:.1f} MB, "
+          f"generated in {run['corpus']['generate_seconds']:.1f}s)", file=sys.stderr)
+    for name, stage in run['stages'].items():
+        print(f"  {name:<22}{stage['seconds']:>9.3f}s {stage['cpu_seconds']:>9.3f}s cpu "
+              f"{stage['files_per_sec'] or 0:>12.0f} files/s", file=sys.stderr)
+    memory = run.get('memory')
+    if memory and memory['bytes_per_file'] is not None:
+        print(f"  {'file index':<22}{memory['index_bytes'] / 1e6:>9.2f} MB "
+              f"{memory['bytes_per_file']:>13.0f} bytes/file", file=sys.stderr)
+    name, physical = run['stages'].get('extract_cold_name'), run['stages'].get('extract_cold_physical')
+    if name and physical and physical['seconds']:
+        device = {True: 'rotational', False: 'solid-state'}.get(run['cold']['device_rotational'], 'unknown')
+        print(f"  {'cold, disk order':<22}{name['seconds'] / physical['seconds']:>9.2f}x name order "
+              f"({device} device)", file=sys.stderr)
+
+
+def compare(results, baseline):
+    """Print each stage's time against a previous results file."""
+    previous = {run['files']: run for run in baseline.get('runs', [])}
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')}):", file=sys.stderr)
+    regressions = 0
+    for run in results['runs']:
+        old_run = previous.get(run['files'])
+        if old_run is None:
+            continue
+        print(f"{run['files']} files", file=sys.stderr)
+        for name, stage in run['stages'].items():
+            old_stage = old_run['stages'].get(name)
+            if not old_stage or not old_stage['seconds']:
+                continue
+            ratio = stage['seconds'] / old_stage['seconds']
+            verdict = ''
+            if max(stage['seconds'], old_stage['seconds']) < COMPARE_MIN_SECONDS:
+                pass
+            elif ratio > 1 + COMPARE_TOLERANCE:
+                verdict = 'slower'
+                regressions += 1
+            elif ratio < 1 - COMPARE_TOLERANCE:
+                verdict = 'faster'
+            print(f"  {name:<22}{old_stage['seconds']:>9.3f}s -> {stage['seconds']:>9.3f}s "
+                  f"({ratio:.2f}x) {verdict}", file=sys.stderr)
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Time each PAVO stage on generated photo/video corpora.")
+    parser.add_argument('sizes', nargs='*', default=DEFAULT_SIZES,
+                        help="corpus sizes, e.g. 1k 10k 100k (default: 1k 10k)")
+    parser.add_argument('--seed', type=int, default=0, help="corpus seed (default: 0)")
+    parser.add_argument('--video-bytes', type=int, default=4096,
+                        help="media data per video file (default: 4096)")
+    parser.add_argument('--threads', type=int, default=None, help="extraction threads")
+    parser.add_argument('--processes', type=int, default=None, help="extraction processes for images")
+    parser.add_argument('--read-order', choices=READ_ORDERS, default='name',
+                        help="read order of the extract stages (default: name)")
+    parser.add_argument('-o', '--output', help="write results JSON here instead of stdout")
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help="compare with an earlier results JSON; exits 1 if any stage got slower")
+    parser.add_argument('--keep', action='store_true', help="keep the generated corpus")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    engine_options = {'max_threads': args.threads, 'max_processes': args.processes, 'read_order': args.read_order}
+
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'runs': [],
+    }
+    for size in args.sizes:
+        run = run_benchmark(parse_size(size), args.seed, args.video_bytes, engine_options, args.keep)
+        print_summary(run)
+        results['runs'].append(run)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            if compare(results, json.load(f)):
+                return 1
+    return 0
@@ -2,15 +2,84 @@ import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
-from datetime import datetime, timedelta
-import re
-from PIL import Image
-from PIL.ExifTags import TAGS
-import subprocess
-import json
-from collections import defaultdict
-import shutil
+import multiprocessing
+import queue
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
 
+import numpy as np
+
+from pavo import core
+from pavo.cache import MetadataCache
+from pavo.dedupe import DuplicateFinder
+from pavo.engine import ExtractionEngine
+from pavo.file_index import FileIndex
+from pavo.filetable import FileTable
+from pavo.journal import Journal, incomplete_journals, latest_undoable_journal
+from pavo.library import LibraryCatalog, SessionIndex, catalog_library, parse_date
+from pavo.mover import MoveScheduler
+from pavo.planfile import PlanFile
+from pavo.quarantine import Quarantine, describe_failures
+from pavo.metadata import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, SUPPORTED_EXTENSIONS, metadata_policy
+from pavo.sessions import TYPE_FOLDERS, GapIndex
+from pavo.stats import RunStats
+from pavo.thumbnails import THUMBNAIL_SIZE, ThumbnailCache, ThumbnailLoader
+from pavo.virtual_table import VirtualTable
+
+# Choices for the 'Show:' filter under each preview table
+SOURCE_FILTERS = ['All files', 'EXIF', 'Metadata', 'Filename', 'Sidecar', 'File System', 'Current Time']
+
+# Choices for the 'Duplicates:' option on the Organize tab
+DUPLICATE_CHOICES = {'Keep all': 'keep', 'Skip duplicates': 'skip', 'Hard-link duplicates': 'link'}
+
+GAP_CANVAS_WIDTH = 240
+GAP_CANVAS_HEIGHT = 36
+
+# Thumbnails kept as Tk images, most recently shown first to stay
+MAX_THUMBNAIL_IMAGES = 500
+
+class RenameRows(Sequence):
+    # Rename table rows, formatted only when the table asks for them
+    def __init__(self, table, new_names):
+        self.table = table
+        self.new_names = new_names
+        
+    def __len__(self):
+        return len(self.table)
+        
+    def __getitem__(self, i):
+        # Files that already have their new name keep it
+        return (self.table.name(i), self.new_names[i] or self.table.name(i), self.table.dt_source(i))
+        
+class OrganizationRows(Sequence):
+    # Organize table rows, formatted only when the table asks for them
+    def __init__(self, table, grouping, renamed, custom_name=None, duplicates=None, duplicate_action='keep'):
+        self.table = table
+        self.grouping = grouping
+        self.renamed = renamed
+        self.custom_name = custom_name
+        self.duplicates = duplicates or {}
+        self.duplicate_action = duplicate_action
+        
+    def __len__(self):
+        return len(self.table)
+        
+    def __getitem__(self, i):
+        table = self.table
+        group_name = self.grouping.key(i)
+        final_name = self.renamed.get(i) or core.target_name(table, i, self.custom_name)
+        destination = final_name if group_name == 'All_Files' else str(Path(group_name) / final_name)
+        original = self.duplicates.get(i)
+        if original is not None:
+            if self.duplicate_action == 'skip':
+                destination = f"Skipped: duplicate of {Path(original).name}"
+            elif self.duplicate_action == 'link':
+                destination += f" (link to {Path(original).name})"
+            else:
+                destination += f" (duplicate of {Path(original).name})"
+        return (table.name(i), table.datetime(i).strftime('%d-%m-%y %H:%M:%S'), destination, table.dt_source(i))
+        
 class FileOrganizer:
     def __init__(self, root):
         self.root = root
@@ -21,15 +90,58 @@ class FileOrganizer:
         self.source_folder = tk.StringVar()
         self.custom_name = tk.StringVar()
         self.files_to_rename = []
-        self.preview_data = []
+        self.preview_table = None
+        self.preview_names = None
+        self.preview_files = None
         self.time_gap_threshold = tk.IntVar(value=120)
+        self.rename_recursive = tk.BooleanVar(value=True)
+        self.organize_recursive = tk.BooleanVar(value=False)
         
         # Supported file extensions
-        self.image_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.bmp', '.gif'}
-        self.video_extensions = {'.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm'}
-        self.supported_extensions = self.image_extensions | self.video_extensions
+        self.image_extensions = IMAGE_EXTENSIONS
+        self.video_extensions = VIDEO_EXTENSIONS
+        self.supported_extensions = SUPPORTED_EXTENSIONS
+        
+        # Background metadata extraction shared by both tabs. Results are kept
+        # in a per-session index by file identity, in front of the persistent
+        # metadata cache when it can be opened.
+        try:
+            self.metadata_cache = MetadataCache()
+        except Exception:
+            self.metadata_cache = None
+        self.file_index = FileIndex()
+        # Every organized or imported file, so imports join the library's
+        # existing sessions and the library can be searched by date
+        try:
+            self.library_catalog = LibraryCatalog()
+        except Exception:
+            self.library_catalog = None
+        self.library_window = None
+        # Files whose dates couldn't be read twice aren't read again
+        try:
+            quarantine = Quarantine()
+        except Exception:
+            quarantine = None
+        self.engine = ExtractionEngine(cache=self.metadata_cache, index=self.file_index, quarantine=quarantine)
+        self.engine_handlers = {}
+        
+        # Instrumentation: the run being measured, the last finished one, and
+        # the stats window when it's open
+        self.run_stats = None
+        self.last_stats = None
+        self.stats_window = None
+        self.profile_runs = tk.BooleanVar(value=False)
+        
+        # Thumbnail column, shared by both tabs. The loader is only started
+        # once it's first switched on; images are by path, '' for none.
+        self.show_thumbnails = tk.BooleanVar(value=False)
+        self.thumbnail_loader = None
+        self.thumbnail_images = OrderedDict()
         
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(50, self.poll_engine)
+        self.root.after(200, self.check_interrupted_runs)
         
     def create_widgets(self):
         # Create notebook for tabs
@@ -62,6 +174,7 @@ class FileOrganizer:
         # Custom name input
         ttk.Label(main_frame, text="Custom Name:").grid(row=1, column=0, sticky=tk.W, pady=5)
         ttk.Entry(main_frame, textvariable=self.custom_name, width=50).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
+        ttk.Checkbutton(main_frame, text="Include subfolders", variable=self.rename_recursive).grid(row=1, column=2, sticky=tk.W, padx=5)
         
         # Buttons
         buttons_frame = ttk.Frame(main_frame)
@@ -70,7 +183,14 @@ class FileOrganizer:
         ttk.Button(buttons_frame, text="Scan Files", command=self.scan_files).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Preview Changes", command=self.preview_changes).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Apply Changes", command=self.apply_changes).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Save Plan...", command=self.save_rename_plan).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Apply Plan...", command=self.apply_saved_plan).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Clear", command=self.clear_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Undo Last", command=self.undo_last_apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Stats", command=self.show_stats).pack(side=tk.LEFT, padx=5)
+        self.pause_button = ttk.Button(buttons_frame, text="Pause", command=self.toggle_pause)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Cancel", command=self.cancel_extraction).pack(side=tk.LEFT, padx=5)
         
         # Progress bar
         self.progress = ttk.Progressbar(main_frame, mode='determinate')
@@ -87,22 +207,18 @@ class FileOrganizer:
         tree_frame.rowconfigure(0, weight=1)
         main_frame.rowconfigure(5, weight=1)
         
-        self.tree = ttk.Treeview(tree_frame, columns=('original', 'new', 'date_time'), show='headings')
-        self.tree.heading('original', text='Original Name')
-        self.tree.heading('new', text='New Name')
-        self.tree.heading('date_time', text='Date/Time Source')
-        
-        self.tree.column('original', width=250)
-        self.tree.column('new', width=250)
-        self.tree.column('date_time', width=150)
-        
-        v_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        h_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL, command=self.tree.xview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-        
+        self.tree = VirtualTable(tree_frame, columns=[
+            ('original', 'Original Name', 250),
+            ('new', 'New Name', 250),
+            ('date_time', 'Date/Time Source', 150)
+        ])
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        self.rename_filter = self.create_source_filter(main_frame, self.tree, 2)
+        self.rename_filter.grid(row=6, column=0, columnspan=3, sticky=tk.W)
+        ttk.Checkbutton(main_frame, text="Show thumbnails", variable=self.show_thumbnails,
+                        command=self.toggle_thumbnails).grid(row=6, column=2, sticky=tk.E)
+        self.tree.bind('<<TableRefreshed>>', self.request_thumbnails, add='+')
         
     def create_organize_tab(self):
         org_main_frame = ttk.Frame(self.organize_frame, padding="10")
@@ -134,6 +250,11 @@ class FileOrganizer:
         self.threshold_label = ttk.Label(threshold_frame, text="120")
         self.threshold_label.pack(side=tk.LEFT)
         
+        # Distribution of gaps between consecutive files, to help pick a threshold
+        self.gap_canvas = tk.Canvas(threshold_frame, width=GAP_CANVAS_WIDTH, height=GAP_CANVAS_HEIGHT,
+                                    highlightthickness=0)
+        self.gap_canvas.pack(side=tk.LEFT, padx=10)
+        
         self.time_gap_threshold.trace('w', self.update_threshold_label)
         
         # Organization options
@@ -147,6 +268,36 @@ class FileOrganizer:
         ttk.Checkbutton(options_frame, text="Separate by date", variable=self.separate_by_date).grid(row=0, column=0, sticky=tk.W)
         ttk.Checkbutton(options_frame, text="Separate by session (time gaps)", variable=self.separate_by_session).grid(row=0, column=1, sticky=tk.W, padx=20)
         ttk.Checkbutton(options_frame, text="Separate photos and videos", variable=self.separate_by_type).grid(row=0, column=2, sticky=tk.W, padx=20)
+        ttk.Checkbutton(options_frame, text="Include subfolders", variable=self.organize_recursive).grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        # Renamed files are dated by their names; a sample is checked against their metadata
+        self.verify_names = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Check dates from file names", variable=self.verify_names).grid(row=1, column=2, sticky=tk.W, padx=20, pady=(5, 0))
+        
+        # Files whose content is already planned, or already in the target folder
+        self.duplicate_choice = tk.StringVar(value='Keep all')
+        duplicates_frame = ttk.Frame(options_frame)
+        duplicates_frame.grid(row=1, column=1, sticky=tk.W, padx=20, pady=(5, 0))
+        ttk.Label(duplicates_frame, text="Duplicates:").pack(side=tk.LEFT)
+        ttk.Combobox(duplicates_frame, textvariable=self.duplicate_choice, values=list(DUPLICATE_CHOICES),
+                     state='readonly', width=20).pack(side=tk.LEFT, padx=5)
+        
+        # Import mode: copy into a separate library folder instead of moving in place
+        self.import_mode = tk.BooleanVar(value=False)
+        self.import_folder = tk.StringVar()
+        self.import_name = tk.StringVar()
+        self.delete_originals = tk.BooleanVar(value=False)
+        
+        ttk.Checkbutton(options_frame, text="Copy into library folder:", variable=self.import_mode).grid(row=2, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Entry(options_frame, textvariable=self.import_folder, width=40).grid(row=2, column=1, sticky=(tk.W, tk.E), padx=20, pady=(5, 0))
+        ttk.Button(options_frame, text="Browse", command=self.browse_import_folder).grid(row=2, column=2, sticky=tk.W, padx=20, pady=(5, 0))
+        ttk.Label(options_frame, text="Rename copies to (optional):").grid(row=3, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Entry(options_frame, textvariable=self.import_name, width=40).grid(row=3, column=1, sticky=(tk.W, tk.E), padx=20, pady=(5, 0))
+        ttk.Checkbutton(options_frame, text="Delete originals once copies are verified", variable=self.delete_originals).grid(row=3, column=2, sticky=tk.W, padx=20, pady=(5, 0))
+        
+        # The organization preview follows option changes live
+        for variable in (self.separate_by_date, self.separate_by_session, self.separate_by_type,
+                         self.import_mode, self.import_folder, self.import_name, self.duplicate_choice):
+            variable.trace('w', self.schedule_organization_preview)
         
         # Organization buttons
         org_buttons_frame = ttk.Frame(org_main_frame)
@@ -155,6 +306,14 @@ class FileOrganizer:
         ttk.Button(org_buttons_frame, text="Analyze Files", command=self.analyze_files).pack(side=tk.LEFT, padx=5)
         ttk.Button(org_buttons_frame, text="Preview Organization", command=self.preview_organization).pack(side=tk.LEFT, padx=5)
         ttk.Button(org_buttons_frame, text="Apply Organization", command=self.apply_organization).pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Save Plan...", command=self.save_organization_plan).pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Apply Plan...", command=self.apply_saved_plan).pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Undo Last", command=self.undo_last_apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Library...", command=self.show_library).pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Stats", command=self.show_stats).pack(side=tk.LEFT, padx=5)
+        self.org_pause_button = ttk.Button(org_buttons_frame, text="Pause", command=self.toggle_pause)
+        self.org_pause_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(org_buttons_frame, text="Cancel", command=self.cancel_extraction).pack(side=tk.LEFT, padx=5)
         
         # Organization progress
         self.org_progress = ttk.Progressbar(org_main_frame, mode='determinate')
@@ -171,35 +330,94 @@ class FileOrganizer:
         org_tree_frame.rowconfigure(0, weight=1)
         org_main_frame.rowconfigure(7, weight=1)
         
-        self.org_tree = ttk.Treeview(org_tree_frame, columns=('file', 'datetime', 'destination'), show='headings')
-        self.org_tree.heading('file', text='File Name')
-        self.org_tree.heading('datetime', text='Date/Time')
-        self.org_tree.heading('destination', text='Destination Folder')
-        
-        self.org_tree.column('file', width=200)
-        self.org_tree.column('datetime', width=150)
-        self.org_tree.column('destination', width=300)
-        
-        org_v_scrollbar = ttk.Scrollbar(org_tree_frame, orient=tk.VERTICAL, command=self.org_tree.yview)
-        org_h_scrollbar = ttk.Scrollbar(org_tree_frame, orient=tk.HORIZONTAL, command=self.org_tree.xview)
-        self.org_tree.configure(yscrollcommand=org_v_scrollbar.set, xscrollcommand=org_h_scrollbar.set)
-        
+        self.org_tree = VirtualTable(org_tree_frame, columns=[
+            ('file', 'File Name', 200),
+            ('datetime', 'Date/Time', 150),
+            ('destination', 'Destination Folder', 300),
+            ('date_time', 'Date/Time Source', 120)
+        ])
         self.org_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        org_v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        org_h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        self.org_filter = self.create_source_filter(org_main_frame, self.org_tree, 3)
+        self.org_filter.grid(row=8, column=0, columnspan=3, sticky=tk.W)
+        ttk.Checkbutton(org_main_frame, text="Show thumbnails", variable=self.show_thumbnails,
+                        command=self.toggle_thumbnails).grid(row=8, column=2, sticky=tk.E)
+        self.org_tree.bind('<<TableRefreshed>>', self.request_thumbnails, add='+')
         
         # Data storage
-        self.analyzed_files = []
+        self.analyzed_files = FileTable()
         self.organization_plan = []
+        self.gap_index = None
+        self.org_grouping = None
+        self.org_renamed = {}
+        self.org_preview_scheduled = False
+        # (target folder, {index: original}) once the duplicate search is done
+        self.org_duplicates = None
+        self.duplicate_search = None
+        self.duplicate_results = queue.Queue()
+        
+    def create_source_filter(self, parent, table, column):
+        frame = ttk.Frame(parent)
+        ttk.Label(frame, text="Show:").pack(side=tk.LEFT)
+        choice = tk.StringVar(value=SOURCE_FILTERS[0])
+        combo = ttk.Combobox(frame, textvariable=choice, values=SOURCE_FILTERS, state='readonly', width=20)
+        combo.pack(side=tk.LEFT, padx=5)
+        
+        def on_change(event=None):
+            source = choice.get()
+            if source == SOURCE_FILTERS[0]:
+                table.set_filter(None)
+            else:
+                table.set_filter(lambda row: row[column] == source)
+                
+        combo.bind('<<ComboboxSelected>>', on_change)
+        return frame
         
     def update_threshold_label(self, *args):
         self.threshold_label.config(text=str(self.time_gap_threshold.get()))
+        self.draw_gap_histogram()
+        self.schedule_organization_preview()
+        
+    def draw_gap_histogram(self):
+        self.gap_canvas.delete('all')
+        if self.gap_index is None or len(self.gap_index) < 2:
+            return
+            
+        counts, edges = self.gap_index.gap_histogram()
+        log_edges = np.log(edges)
+        span = log_edges[-1] - log_edges[0]
+        
+        def x_for(minutes):
+            position = (np.log(max(minutes, edges[0])) - log_edges[0]) / span
+            return min(max(position, 0.0), 1.0) * GAP_CANVAS_WIDTH
+            
+        tallest = np.log1p(counts.max()) or 1.0
+        for count, left, right in zip(counts, edges[:-1], edges[1:]):
+            if count:
+                height = np.log1p(count) / tallest * (GAP_CANVAS_HEIGHT - 2)
+                self.gap_canvas.create_rectangle(x_for(left) + 1, GAP_CANVAS_HEIGHT - height,
+                                                 x_for(right), GAP_CANVAS_HEIGHT, fill='grey60', outline='')
+                                                 
+        x = x_for(self.time_gap_threshold.get())
+        self.gap_canvas.create_line(x, 0, x, GAP_CANVAS_HEIGHT, fill='red', width=2)
         
     def browse_folder(self):
         folder = filedialog.askdirectory()
         if folder:
             self.source_folder.set(folder)
             
+    def browse_import_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.import_folder.set(folder)
+            
+    def organize_target(self):
+        # Where the plan puts files, and the name to give them on the way
+        if self.import_mode.get():
+            custom_name = core.sanitize_filename(self.import_name.get().strip())
+            return Path(self.import_folder.get()), custom_name or None
+        return Path(self.organize_folder.get()), None
+        
     def browse_organize_folder(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -218,70 +436,17 @@ class FileOrganizer:
         self.status_label.config(text="Scanning files...")
         self.files_to_rename = []
         
-        all_files = []
-        for file_path in folder_path.iterdir():
-            if file_path.is_file():
-                if file_path.suffix.lower() in self.supported_extensions:
-                    all_files.append(file_path)
-            
-        self.files_to_rename = sorted(list(set(all_files)))
+        # The preview that follows adds its extraction to the same stats
+        stats = self.begin_stats('rename')
+        with stats.stage('scan'):
+            self.files_to_rename = sorted(core.iter_media_files(folder_path, self.supported_extensions,
+                                                                recursive=self.rename_recursive.get()),
+                                         key=lambda entry: entry.path)
         
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        for file_path in self.files_to_rename:
-            self.tree.insert('', 'end', values=(file_path.name, '', 'Not processed'))
+        self.tree.set_rows((file_path.name, '', 'Not processed') for file_path in self.files_to_rename)
             
         self.status_label.config(text=f"Found {len(self.files_to_rename)} files")
         
-    def get_image_datetime(self, file_path):
-        try:
-            with Image.open(file_path) as img:
-                exif_data = img._getexif()
-                if exif_data:
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        if tag in ['DateTime', 'DateTimeOriginal', 'DateTimeDigitized']:
-                            return datetime.strptime(value, '%Y:%m:%d %H:%M:%S'), 'EXIF'
-        except Exception:
-            pass
-        return None, None
-        
-    def get_video_datetime(self, file_path):
-        try:
-            cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', str(file_path)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                if 'format' in data and 'tags' in data['format']:
-                    tags = data['format']['tags']
-                    for key in ['creation_time', 'date', 'com.apple.quicktime.creationdate']:
-                        if key in tags:
-                            try:
-                                dt_str = tags[key]
-                                for fmt in ['%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%SZ']:
-                                    try:
-                                        return datetime.strptime(dt_str, fmt), 'Metadata'
-                                    except ValueError:
-                                        continue
-                            except ValueError:
-                                continue
-        except Exception:
-            pass
-        return None, None
-        
-    def get_file_datetime(self, file_path):
-        try:
-            stat = file_path.stat()
-            timestamp = getattr(stat, 'st_birthtime', None) or stat.st_mtime
-            return datetime.fromtimestamp(timestamp), 'File System'
-        except Exception:
-            return datetime.now(), 'Current Time'
-            
-    def sanitize_filename(self, filename):
-        invalid_chars = r'[<>:"/\\|?*]'
-        return re.sub(invalid_chars, '', filename)
-        
     def preview_changes(self):
         if not self.files_to_rename:
             messagebox.showerror("Error", "Please scan files first")
@@ -291,110 +456,115 @@ class FileOrganizer:
             messagebox.showerror("Error", "Please enter a custom name")
             return
             
-        custom_name = self.sanitize_filename(self.custom_name.get().strip())
+        custom_name = core.sanitize_filename(self.custom_name.get().strip())
         
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        if self.engine.busy:
+            messagebox.showerror("Error", "Metadata extraction is already running")
+            return
             
-        self.preview_data = []
-        self.progress['maximum'] = len(self.files_to_rename)
-        
-        for i, file_path in enumerate(self.files_to_rename):
-            self.progress['value'] = i + 1
-            self.root.update_idletasks()
+        # Same files as the last preview: only the names need re-formatting
+        if self.preview_files is self.files_to_rename and self.preview_names is not None:
+            self.preview_names = core.plan_renames(self.preview_table, custom_name)
+            self.tree.set_rows(RenameRows(self.preview_table, self.preview_names))
+            self.status_label.config(text=f"Preview updated for {len(self.preview_table)} files")
+            return
             
-            dt = None
-            dt_source = None
+        self.preview_files = self.files_to_rename
+        self.tree.set_rows((file_path.name, '', 'Pending') for file_path in self.files_to_rename)
+        stats = self.run_stats or self.begin_stats('rename')
             
-            if file_path.suffix.lower() in self.image_extensions:
-                dt, dt_source = self.get_image_datetime(file_path)
-            elif file_path.suffix.lower() in self.video_extensions:
-                dt, dt_source = self.get_video_datetime(file_path)
-                
-            if dt is None:
-                dt, dt_source = self.get_file_datetime(file_path)
+        table = self.preview_table = FileTable.from_paths(self.files_to_rename)
+        self.preview_names = None
+        self.progress['maximum'] = max(len(self.files_to_rename), 1)
+        self.status_label.config(text="Extracting date/time metadata...")
+        
+        def on_batch(results, done, total):
+            # Provisional names; clashes are numbered once every date is known
+            for i, file_path, dt, dt_source in results:
+                table.set_date(i, dt, dt_source)
+                self.tree.update_row(i, (file_path.name, core.format_new_name(custom_name, dt, file_path.suffix),
+                                         dt_source))
                 
-            dt_str = dt.strftime('%d-%m-%y_%H.%M.%S')
-            new_name = f"{custom_name}_{dt_str}{file_path.suffix}"
+            self.progress['value'] = done
+            self.status_label.config(text=f"Extracting date/time metadata... {done}/{total}")
             
-            self.preview_data.append({
-                'original_path': file_path,
-                'new_name': new_name,
-                'datetime': dt,
-                'dt_source': dt_source
-            })
-            
-            self.tree.insert('', 'end', values=(file_path.name, new_name, dt_source))
-            
-        self.progress['value'] = 0
-        self.status_label.config(text=f"Preview generated for {len(self.preview_data)} files")
+        def on_done(done, total, cancelled):
+            self.progress['value'] = 0
+            if cancelled:
+                self.preview_table = None
+                self.preview_files = None
+                self.status_label.config(text=f"Preview cancelled after {done} of {total} files")
+            else:
+                with stats.stage('naming'):
+                    self.preview_names = core.plan_renames(table, custom_name)
+                self.tree.set_rows(RenameRows(table, self.preview_names), keep_position=True)
+                self.status_label.config(text=f"Preview generated for {len(table)} files"
+                                              f"{self.failure_summary()}{self.cache_summary()}")
+            self.finish_stats(stats)
+                
+        self.engine.failures.clear()
+        self.start_extraction(self.files_to_rename, on_batch, on_done)
         
     def apply_changes(self):
-        if not self.preview_data:
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for metadata extraction to finish")
+            return
+            
+        if self.preview_names is None:
             messagebox.showerror("Error", "Please generate preview first")
             return
             
-        result = messagebox.askyesno("Confirm", f"Are you sure you want to rename {len(self.preview_data)} files?")
+        table = self.preview_table
+        changing = sum(name is not None for name in self.preview_names)
+        result = messagebox.askyesno("Confirm", f"Are you sure you want to rename {changing} files?")
         if not result:
             return
             
         success_count = 0
         error_count = 0
         errors = []
-        self.progress['maximum'] = len(self.preview_data)
+        # Files already named as planned stay in the list untouched
+        renamed = [table.path(i) for i, name in enumerate(self.preview_names) if name is None]
+        moves = []
+        self.progress['maximum'] = max(changing, 1)
         
-        test_file = Path(self.source_folder.get()) / "test_write_permissions.tmp"
         try:
-            test_file.write_text("test")
-            test_file.unlink()
+            core.check_writable(self.source_folder.get())
         except Exception as e:
             messagebox.showerror("Permission Error", 
                                f"Cannot write to destination folder:\n{e}\n\n"
                                f"Try running as administrator or check folder permissions.")
             return
         
-        for i, item in enumerate(self.preview_data):
-            self.progress['value'] = i + 1
-            self.root.update_idletasks()
-            
-            try:
-                old_path = item['original_path']
-                new_path = old_path.parent / item['new_name']
+        stats = self.begin_stats('rename-apply')
+        journal = Journal.create('rename', self.source_folder.get())
+        with stats.stage('apply'):
+            for n, (i, new_path, error) in enumerate(core.apply_renames(table, self.preview_names, journal)):
+                self.progress['value'] = n + 1
+                self.root.update_idletasks()
                 
-                if not old_path.exists():
-                    errors.append(f"{old_path.name}: Source file not found")
+                if error:
                     error_count += 1
-                    continue
-                
-                if new_path.exists():
-                    counter = 1
-                    base_name = new_path.stem
-                    extension = new_path.suffix
-                    while new_path.exists():
-                        new_name = f"{base_name}_{counter}{extension}"
-                        new_path = old_path.parent / new_name
-                        counter += 1
-                
-                old_path.rename(new_path)
-                success_count += 1
-                
-            except PermissionError as e:
-                error_count += 1
-                errors.append(f"{old_path.name}: Permission denied - file may be in use")
-                
-            except OSError as e:
-                error_count += 1
-                if "being used by another process" in str(e):
-                    errors.append(f"{old_path.name}: File is open in another program")
+                    errors.append(error)
                 else:
-                    errors.append(f"{old_path.name}: {str(e)}")
+                    success_count += 1
+                    renamed.append(new_path)
+                    moves.append((table.path(i), new_path))
+                    self.file_index.rename(table.path(i), new_path)
+                    if self.metadata_cache is not None:
+                        self.metadata_cache.rename(table.path(i), new_path)
+        self.catalog_moved(moves)
+        self.finish_stats(stats)
                     
-            except Exception as e:
-                error_count += 1
-                errors.append(f"{old_path.name}: {str(e)}")
-                
         self.progress['value'] = 0
         
+        # The renamed files keep their extracted datetimes in the index, so
+        # previewing them again doesn't re-read any metadata
+        self.files_to_rename = sorted(renamed)
+        self.preview_table = None
+        self.preview_names = None
+        self.preview_files = None
+        
         if error_count == 0:
             message = f"Successfully renamed {success_count} files!\n\nYou can now use the 'File Organization' tab to organize them into folders."
             messagebox.showinfo("Success", message)
@@ -410,12 +580,391 @@ class FileOrganizer:
                                  f"{error_count} files failed to rename.\n\n"
                                  f"Errors:\n{error_details}")
             
+    def start_extraction(self, files, on_batch, on_done, policy=None):
+        if self.metadata_cache is not None:
+            self.metadata_cache.reset_counters()
+        self.engine.stats = self.run_stats
+        job_id = self.engine.start(files, policy)
+        self.engine_handlers = {job_id: (on_batch, on_done)}
+        self.set_pause_text("Pause")
+        
+    def cache_summary(self):
+        if self.metadata_cache is None:
+            return ""
+        return f" (cache: {self.metadata_cache.hits} hits, {self.metadata_cache.misses} misses)"
+        
+    def failure_summary(self):
+        # Files dated by their file system time because their metadata
+        # couldn't be read; the Stats window breaks them down by extractor
+        failures = self.engine.failures
+        if not failures:
+            return ""
+        return f", {len(failures)} without readable metadata ({describe_failures(failures)})"
+        
+    def poll_engine(self):
+        try:
+            while True:
+                message = self.engine.results.get_nowait()
+                handlers = self.engine_handlers.get(message[0])
+                if handlers is None:
+                    continue
+                on_batch, on_done = handlers
+                if message[1] == 'batch':
+                    on_batch(*message[2:])
+                elif message[1] == 'done':
+                    del self.engine_handlers[message[0]]
+                    self.set_pause_text("Pause")
+                    on_done(*message[2:])
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                self.duplicates_found(*self.duplicate_results.get_nowait())
+        except queue.Empty:
+            pass
+        if self.thumbnail_loader is not None:
+            self.thumbnails_loaded(self.thumbnail_loader.results())
+        self.root.after(50, self.poll_engine)
+        
+    def set_pause_text(self, text):
+        self.pause_button.config(text=text)
+        self.org_pause_button.config(text=text)
+        
+    def toggle_pause(self):
+        if not self.engine.busy:
+            return
+        if self.engine.paused:
+            self.engine.resume()
+            self.set_pause_text("Pause")
+        else:
+            self.engine.pause()
+            self.set_pause_text("Resume")
+            
+    def cancel_extraction(self):
+        if self.engine.busy:
+            self.engine.cancel()
+            
+    def on_close(self):
+        self.engine.shutdown()
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.shutdown()
+            if self.thumbnail_loader.cache is not None:
+                self.thumbnail_loader.cache.close()
+        if self.library_catalog is not None:
+            self.library_catalog.close()
+        self.root.destroy()
+        
+    # Thumbnails
+    
+    def toggle_thumbnails(self):
+        if not self.show_thumbnails.get():
+            self.tree.show_images(None)
+            self.org_tree.show_images(None)
+            self.thumbnail_images.clear()
+            if self.thumbnail_loader is not None:
+                self.thumbnail_loader.request([])
+            return
+        if self.thumbnail_loader is None:
+            try:
+                cache = ThumbnailCache()
+            except Exception:
+                cache = None
+            self.thumbnail_loader = ThumbnailLoader(cache)
+        width, height = THUMBNAIL_SIZE
+        for table in (self.tree, self.org_tree):
+            table.show_images(lambda row, table=table: self.thumbnail_image(self.row_path(table, row)),
+                              width + 8, height + 4)
+            
+    def row_path(self, table, row):
+        # The file shown in a preview table's row, or None
+        if table is self.org_tree:
+            files = self.analyzed_files
+            return files.path(row) if row < len(files) else None
+        if self.preview_table is not None:
+            return self.preview_table.path(row) if row < len(self.preview_table) else None
+        return os.fspath(self.files_to_rename[row]) if row < len(self.files_to_rename) else None
+        
+    def thumbnail_image(self, path):
+        image = self.thumbnail_images.get(path)
+        if image is None:
+            return ''
+        self.thumbnail_images.move_to_end(path)
+        return image
+        
+    def request_thumbnails(self, event=None):
+        # Only what's on screen in either table is wanted; anything queued
+        # for rows scrolled past is dropped before it's decoded
+        if self.thumbnail_loader is None or not self.show_thumbnails.get():
+            return
+        wanted = []
+        for table in (self.tree, self.org_tree):
+            for row in table.visible_rows():
+                path = self.row_path(table, row)
+                if path is not None and path not in self.thumbnail_images:
+                    wanted.append(path)
+        self.thumbnail_loader.request(wanted)
+        
+    def thumbnails_loaded(self, loaded):
+        if not loaded or not self.show_thumbnails.get():
+            return
+        for path, data in loaded:
+            self.thumbnail_images[path] = tk.PhotoImage(data=data) if data else ''
+        while len(self.thumbnail_images) > MAX_THUMBNAIL_IMAGES:
+            self.thumbnail_images.popitem(last=False)
+        self.tree.schedule_refresh()
+        self.org_tree.schedule_refresh()
+        
+    def show_errors(self, title, summary, errors):
+        error_details = "\n".join(errors[:10])
+        if len(errors) > 10:
+            error_details += f"\n... and {len(errors) - 10} more errors"
+        messagebox.showwarning(title, f"{summary}\n\nErrors:\n{error_details}")
+        
+    def file_moved(self, old_path, new_path):
+        self.file_index.rename(old_path, new_path)
+        if self.metadata_cache is not None:
+            self.metadata_cache.rename(old_path, new_path)
+            
+    def catalog_moved(self, moves):
+        if self.library_catalog is not None and moves:
+            self.library_catalog.moved(moves)
+            
+    def catalog_files(self, library, files):
+        # (path, datetime, dt_source) of files now in the library
+        if self.library_catalog is not None and files:
+            self.library_catalog.record(library, files)
+            
+    def check_interrupted_runs(self):
+        journals = incomplete_journals()
+        if not journals:
+            return
+            
+        details = "\n".join(journal.describe() for journal in journals)
+        if not messagebox.askyesno("Interrupted Run",
+                                   f"A previous rename or organize did not finish:\n\n{details}\n\n"
+                                   f"Finish it now?"):
+            return
+            
+        completed = 0
+        errors = []
+        moves = []
+        for journal in journals:
+            for op, new_path, error in core.resume_journal(journal):
+                if error:
+                    errors.append(error)
+                else:
+                    completed += 1
+                    moves.append((op.src, new_path))
+                    self.file_moved(op.src, new_path)
+        self.catalog_moved(moves)
+                    
+        if errors:
+            self.show_errors("Partial Success", f"Completed {completed} files.\n"
+                                                f"{len(errors)} files could not be completed.", errors)
+        else:
+            messagebox.showinfo("Success", f"Completed {completed} files from the interrupted run.")
+            
+    def undo_last_apply(self):
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for metadata extraction to finish")
+            return
+            
+        journal = latest_undoable_journal()
+        if journal is None:
+            messagebox.showinfo("Undo", "Nothing to undo")
+            return
+            
+        if not messagebox.askyesno("Confirm Undo", f"Undo this run?\n\n{journal.describe()}"):
+            return
+            
+        restored = 0
+        errors = []
+        undone = []
+        for op, error in core.undo_journal(journal):
+            if error:
+                errors.append(error)
+            else:
+                restored += 1
+                undone.append(op)
+                self.file_moved(op.done, op.src)
+        # Renames are followed; files taken back out of a library are forgotten
+        if journal.kind == 'rename':
+            self.catalog_moved([(op.done, op.src) for op in undone])
+        elif self.library_catalog is not None:
+            self.library_catalog.forget(op.done for op in undone)
+                
+        # Previews refer to the names before the undo
+        self.clear_all()
+        self.clear_organization()
+        
+        if errors:
+            self.show_errors("Partial Undo", f"Restored {restored} files.\n"
+                                             f"{len(errors)} files could not be restored.", errors)
+        else:
+            messagebox.showinfo("Success", f"Restored {restored} files to their original names and folders.")
+            
+    # Library catalog
+    
+    def show_library(self):
+        if self.library_catalog is None:
+            messagebox.showerror("Error", "The library catalog could not be opened")
+            return
+        if self.library_window is not None and self.library_window.winfo_exists():
+            self.library_window.lift()
+            return
+            
+        window = self.library_window = tk.Toplevel(self.root)
+        window.title("Library")
+        window.geometry("860x520")
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(1, weight=1)
+        
+        controls = ttk.Frame(window, padding="10")
+        controls.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        start = tk.StringVar()
+        end = tk.StringVar()
+        file_type = tk.StringVar(value=SOURCE_FILTERS[0])
+        ttk.Label(controls, text="From:").pack(side=tk.LEFT)
+        ttk.Entry(controls, textvariable=start, width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Label(controls, text="To:").pack(side=tk.LEFT)
+        ttk.Entry(controls, textvariable=end, width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Combobox(controls, textvariable=file_type, values=[SOURCE_FILTERS[0], *TYPE_FOLDERS.values()],
+                     state='readonly', width=10).pack(side=tk.LEFT, padx=5)
+        
+        table = VirtualTable(window, columns=[
+            ('datetime', 'Date/Time', 140),
+            ('file', 'File Name', 220),
+            ('session', 'Session Folder', 200),
+            ('library', 'Library', 240)
+        ])
+        table.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=10)
+        status = ttk.Label(window, text="Dates as YYYY-MM-DD; leave them empty for no limit")
+        status.grid(row=2, column=0, sticky=tk.W, padx=10, pady=5)
+        
+        def search(event=None):
+            try:
+                first = parse_date(start.get()) if start.get().strip() else None
+                last = parse_date(end.get(), end=True) if end.get().strip() else None
+            except ValueError as e:
+                status.config(text=str(e))
+                return
+            codes = {folder: code for code, folder in TYPE_FOLDERS.items()}
+            rows = [(f"{dt:%d-%m-%y %H:%M:%S}", os.path.basename(path), session, library)
+                    for path, dt, _, session, library in self.library_catalog.files(first, last,
+                                                                                   file_type=codes.get(file_type.get()))]
+            table.set_rows(rows)
+            status.config(text=f"{len(rows)} files")
+            
+        def add_folder():
+            # Libraries organized before the catalog existed are read once;
+            # dates mostly come from the metadata cache
+            folder = filedialog.askdirectory(parent=window)
+            if not folder:
+                return
+            status.config(text=f"Cataloguing {folder}...")
+            finished = []
+            
+            def run():
+                try:
+                    engine = ExtractionEngine(cache=MetadataCache())
+                    try:
+                        finished.append(catalog_library(self.library_catalog, folder, engine))
+                    finally:
+                        engine.shutdown()
+                except Exception as e:
+                    finished.append(e)
+                    
+            def check():
+                if not finished:
+                    window.after(200, check)
+                elif isinstance(finished[0], Exception):
+                    status.config(text=f"Could not catalog {folder}: {finished[0]}")
+                else:
+                    status.config(text=f"Catalogued {finished[0][0]} files in {folder}")
+                    search()
+                    
+            threading.Thread(target=run, daemon=True).start()
+            window.after(200, check)
+            
+        ttk.Button(controls, text="Search", command=search).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Catalog Folder...", command=add_folder).pack(side=tk.LEFT, padx=5)
+        window.bind('<Return>', search)
+        
+    def begin_stats(self, label):
+        self.run_stats = RunStats(label, profile=self.profile_runs.get())
+        # Table redraws count towards whatever is being measured
+        self.tree.stats = self.run_stats
+        self.org_tree.stats = self.run_stats
+        return self.run_stats
+        
+    def finish_stats(self, stats):
+        # Every scan/apply is exported to the stats folder as it finishes
+        if self.run_stats is stats:
+            self.run_stats = None
+        try:
+            stats.save()
+        except OSError:
+            pass
+        self.last_stats = stats
+        self.refresh_stats_window()
+        
+    def show_stats(self):
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            self.refresh_stats_window()
+            return
+            
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("Stats")
+        self.stats_window.geometry("760x520")
+        self.stats_window.columnconfigure(0, weight=1)
+        self.stats_window.rowconfigure(0, weight=1)
+        
+        self.stats_text = tk.Text(self.stats_window, wrap=tk.NONE, font=('TkFixedFont', 9))
+        self.stats_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        stats_scrollbar = ttk.Scrollbar(self.stats_window, orient=tk.VERTICAL, command=self.stats_text.yview)
+        stats_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.stats_text.configure(yscrollcommand=stats_scrollbar.set)
+        
+        controls = ttk.Frame(self.stats_window, padding="5")
+        controls.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        ttk.Checkbutton(controls, text="Profile runs with cProfile (saved as .prof beside the stats)",
+                        variable=self.profile_runs).pack(side=tk.LEFT)
+        ttk.Button(controls, text="Export JSON...", command=self.export_stats).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(controls, text="Refresh", command=self.refresh_stats_window).pack(side=tk.RIGHT, padx=5)
+        
+        self.refresh_stats_window()
+        
+    def refresh_stats_window(self):
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            return
+        stats = self.run_stats or self.last_stats
+        text = "\n".join(stats.summary()) if stats is not None else "No scan or apply has run yet."
+        self.stats_text.configure(state=tk.NORMAL)
+        self.stats_text.delete('1.0', tk.END)
+        self.stats_text.insert('1.0', text)
+        self.stats_text.configure(state=tk.DISABLED)
+        
+    def export_stats(self):
+        stats = self.run_stats or self.last_stats
+        if stats is None:
+            return
+        path = filedialog.asksaveasfilename(parent=self.stats_window, defaultextension='.json',
+                                            filetypes=[("JSON", "*.json")])
+        if path:
+            try:
+                stats.save(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save stats:\n{e}", parent=self.stats_window)
+                
     def clear_all(self):
+        self.cancel_extraction()
         self.files_to_rename = []
-        self.preview_data = []
+        self.preview_table = None
+        self.preview_names = None
+        self.preview_files = None
         
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.tree.clear()
             
         self.status_label.config(text="Ready")
         self.progress['value'] = 0
@@ -430,137 +979,223 @@ class FileOrganizer:
             messagebox.showerror("Error", "Selected folder does not exist")
             return
             
+        if self.engine.busy:
+            messagebox.showerror("Error", "Metadata extraction is already running")
+            return
+            
         self.org_status_label.config(text="Analyzing files...")
-        self.analyzed_files = []
+        self.analyzed_files = FileTable()
+        self.gap_index = None
+        self.org_grouping = None
+        self.org_duplicates = None
         
-        all_files = []
-        for file_path in folder_path.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in self.supported_extensions:
-                all_files.append(file_path)
-                
-        self.org_progress['maximum'] = len(all_files)
+        stats = self.begin_stats('organize')
+        with stats.stage('scan'):
+            all_files = list(core.iter_media_files(folder_path, self.supported_extensions,
+                                                   recursive=self.organize_recursive.get()))
         
-        for i, file_path in enumerate(all_files):
-            self.org_progress['value'] = i + 1
-            self.root.update_idletasks()
-            
-            dt = None
-            dt_source = None
-            
-            if file_path.suffix.lower() in self.image_extensions:
-                dt, dt_source = self.get_image_datetime(file_path)
-            elif file_path.suffix.lower() in self.video_extensions:
-                dt, dt_source = self.get_video_datetime(file_path)
+        self.org_progress['maximum'] = max(len(all_files), 1)
+        
+        def on_batch(results, done, total):
+            for i, file_path, dt, dt_source in results:
+                self.analyzed_files.add(file_path, dt, dt_source)
                 
-            if dt is None:
-                dt, dt_source = self.get_file_datetime(file_path)
+            self.org_progress['value'] = done
+            self.org_status_label.config(text=f"Analyzing files... {done}/{total}")
+            
+        def on_done(done, total, cancelled):
+            self.org_progress['value'] = 0
+            if cancelled:
+                self.analyzed_files = FileTable()
+                self.org_status_label.config(text=f"Analysis cancelled after {done} of {total} files")
+                self.finish_stats(stats)
+                return
                 
-            self.analyzed_files.append({
-                'path': file_path,
-                'datetime': dt,
-                'dt_source': dt_source,
-                'is_image': file_path.suffix.lower() in self.image_extensions,
-                'is_video': file_path.suffix.lower() in self.video_extensions
-            })
+            if self.verify_names.get() and self.check_name_dates(stats):
+                return
+            self.finish_analysis(stats)
             
-        self.analyzed_files.sort(key=lambda x: x['datetime'])
-        
-        self.org_progress['value'] = 0
-        self.org_status_label.config(text=f"Analyzed {len(self.analyzed_files)} files")
+        self.engine.failures.clear()
+        self.start_extraction(all_files, on_batch, on_done)
+        
+    def finish_analysis(self, stats, note=""):
+        with stats.stage('grouping'):
+            self.analyzed_files.sort_by_capture()
+            self.gap_index = GapIndex.from_files(self.analyzed_files)
+        self.finish_stats(stats)
+        self.draw_gap_histogram()
+        self.org_status_label.config(text=f"Analyzed {len(self.analyzed_files)} files{note}"
+                                          f"{self.failure_summary()}{self.cache_summary()}")
+        
+    def check_name_dates(self, stats):
+        # A sample of the files dated by their names is read properly; if any
+        # disagree, every one of them is re-read in the background. Returns
+        # True when that re-read will finish the analysis.
+        names = core.name_dated(self.analyzed_files)
+        if not names:
+            return False
+        with stats.stage('verify_names'):
+            checked, mismatched = core.verify_name_dates(self.analyzed_files, self.engine)
+        if not mismatched:
+            self.finish_analysis(stats, f", {checked} dates from file names checked")
+            return True
+            
+        files = self.analyzed_files
+        self.org_progress['maximum'] = len(names)
+        self.org_status_label.config(text=f"{mismatched} of {checked} dates from file names differ from the "
+                                          f"metadata; reading all {len(names)} files...")
+        
+        def on_batch(results, done, total):
+            for i, file_path, dt, dt_source in results:
+                if core.has_metadata_date(dt_source):
+                    files.set_date(names[i], dt, dt_source)
+            self.org_progress['value'] = done
+            
+        def on_done(done, total, cancelled):
+            # Cancelling keeps the dates from the names
+            self.org_progress['value'] = 0
+            self.finish_analysis(stats, ", dates from file names replaced by metadata")
+            
+        self.start_extraction([files.path(i) for i in names], on_batch, on_done, metadata_policy())
+        return True
         
     def preview_organization(self):
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for file analysis to finish")
+            return
+            
         if not self.analyzed_files:
             messagebox.showerror("Error", "Please analyze files first")
             return
             
-        for item in self.org_tree.get_children():
-            self.org_tree.delete(item)
-            
-        self.organization_plan = []
-        
-        groups = self.group_files_for_organization()
+        self.update_organization_preview(keep_position=False)
         
-        for group_name, files in groups.items():
-            for file_info in files:
-                destination = self.get_destination_path(group_name, file_info)
-                
-                self.organization_plan.append({
-                    'file_info': file_info,
-                    'destination': destination
-                })
-                
-                self.org_tree.insert('', 'end', values=(
-                    file_info['path'].name,
-                    file_info['datetime'].strftime('%d-%m-%y %H:%M:%S'),
-                    str(destination.relative_to(Path(self.organize_folder.get())))
-                ))
-                
-        self.org_status_label.config(text=f"Organization plan created for {len(self.organization_plan)} files")
-        
-    def group_files_for_organization(self):
-        groups = defaultdict(list)
-        
-        current_session = 0
-        last_datetime = None
-        current_date = None
-        
-        for file_info in self.analyzed_files:
-            dt = file_info['datetime']
-            
-            if self.separate_by_date.get():
-                file_date = dt.date()
-                if current_date != file_date:
-                    current_date = file_date
-                    current_session = 0
+    def schedule_organization_preview(self, *args):
+        if self.org_grouping is not None and not self.org_preview_scheduled:
+            self.org_preview_scheduled = True
+            self.root.after(30, self.update_organization_preview)
             
-            if self.separate_by_session.get() and last_datetime:
-                time_diff = (dt - last_datetime).total_seconds() / 60
-                if time_diff > self.time_gap_threshold.get():
-                    current_session += 1
-            
-            group_parts = []
-            
-            if self.separate_by_date.get():
-                group_parts.append(dt.strftime('%Y-%m-%d'))
-                
-            if self.separate_by_session.get():
-                if current_session > 0:
-                    session_time = dt.strftime('%H.%M')
-                    group_parts.append(f"Session{current_session + 1}_{session_time}")
-                else:
-                    session_time = dt.strftime('%H.%M')
-                    group_parts.append(f"Session1_{session_time}")
-                    
-            if self.separate_by_type.get():
-                if file_info['is_image']:
-                    group_parts.append('Photos')
-                elif file_info['is_video']:
-                    group_parts.append('Videos')
-                    
-            group_key = '/'.join(group_parts) if group_parts else 'All_Files'
-            groups[group_key].append(file_info)
+    def update_organization_preview(self, keep_position=True):
+        self.org_preview_scheduled = False
+        if not self.analyzed_files:
+            return
+        if self.gap_index is None:
+            self.gap_index = GapIndex.from_files(self.analyzed_files)
             
-            last_datetime = dt
+        # Regrouping is a few array passes; only the visible rows get formatted
+        base_path, custom_name = self.organize_target()
+        if self.import_mode.get() and self.import_folder.get():
+            # Imports join the sessions already in the library
+            self.org_grouping = SessionIndex(base_path, self.organize_options(), self.engine,
+                                             self.library_catalog).assign(self.analyzed_files)
+        else:
+            self.org_grouping = self.gap_index.group(self.organize_options())
+        action = self.duplicate_action()
+        duplicates = self.current_duplicates(base_path) if action != 'keep' else None
+        skip = duplicates if action == 'skip' and duplicates else ()
+        self.org_renamed = core.resolve_destination_names(self.analyzed_files, self.org_grouping, base_path,
+                                                          custom_name=custom_name, skip=skip)
+        self.org_tree.set_rows(OrganizationRows(self.analyzed_files, self.org_grouping, self.org_renamed, custom_name,
+                                                duplicates, action),
+                               keep_position=keep_position)
+        
+        status = (f"Organization plan created for {len(self.analyzed_files)} files "
+                  f"in {self.org_grouping.session_count} sessions")
+        if action != 'keep':
+            status += " - looking for duplicates..." if duplicates is None else f", {len(duplicates)} duplicates"
+        self.org_status_label.config(text=status)
+        
+    def duplicate_action(self):
+        return DUPLICATE_CHOICES.get(self.duplicate_choice.get(), 'keep')
+        
+    def current_duplicates(self, base_path):
+        # Duplicates found for this target folder, or None while a search runs
+        if self.org_duplicates is not None and self.org_duplicates[0] == base_path:
+            return self.org_duplicates[1]
+        if self.duplicate_search is None:
+            self.start_duplicate_search(base_path)
+        return None
+        
+    def start_duplicate_search(self, base_path):
+        # Hashing reads file contents, so it runs off the Tk thread; the
+        # result is picked up by poll_engine
+        files = self.analyzed_files
+        paths = files.paths()
+        self.duplicate_search = (files, base_path)
+        
+        def search():
+            finder = DuplicateFinder()
+            try:
+                duplicates = core.find_duplicates(paths, base_path, finder)
+            except Exception:
+                duplicates = {}
+            self.duplicate_results.put((files, base_path, duplicates, finder))
             
-        return groups
+        threading.Thread(target=search, daemon=True).start()
         
-    def get_destination_path(self, group_name, file_info):
-        base_path = Path(self.organize_folder.get())
+    def duplicates_found(self, files, base_path, duplicates, finder):
+        self.duplicate_search = None
+        # Results for files since re-analyzed are dropped
+        if files is not self.analyzed_files:
+            return
+        self.org_duplicates = (base_path, duplicates)
+        self.schedule_organization_preview()
+        
+    def organize_options(self):
+        return core.OrganizeOptions(
+            separate_by_date=self.separate_by_date.get(),
+            separate_by_session=self.separate_by_session.get(),
+            separate_by_type=self.separate_by_type.get(),
+            time_gap_minutes=self.time_gap_threshold.get()
+        )
+        
+    def organization_plan_ready(self):
+        # Whether a plan can be made now; tells the user why not otherwise
+        if self.org_grouping is None:
+            messagebox.showerror("Error", "Please preview organization first")
+            return False
+        if self.duplicate_action() != 'keep' and self.current_duplicates(self.organize_target()[0]) is None:
+            messagebox.showerror("Error", "Please wait for the duplicate search to finish")
+            return False
+        if self.import_mode.get() and not self.import_folder.get():
+            messagebox.showerror("Error", "Please select a library folder to copy into")
+            return False
+        return True
+        
+    def make_organization_plan(self):
+        base_path, custom_name = self.organize_target()
+        action = self.duplicate_action()
+        duplicates = self.current_duplicates(base_path) if action != 'keep' else None
+        return list(core.plan_from_grouping(self.analyzed_files, self.org_grouping, base_path, self.org_renamed,
+                                            custom_name, duplicates, action))
         
-        if group_name == 'All_Files':
-            return base_path / file_info['path'].name
-        else:
-            folder_structure = Path(group_name)
-            return base_path / folder_structure / file_info['path'].name
-            
     def apply_organization(self):
-        if not self.organization_plan:
-            messagebox.showerror("Error", "Please preview organization first")
+        if not self.organization_plan_ready():
             return
             
-        result = messagebox.askyesno("Confirm Organization", 
-                                   f"Are you sure you want to organize {len(self.organization_plan)} files into folders?")
+        importing = self.import_mode.get()
+        base_path, _ = self.organize_target()
+        if importing:
+            try:
+                base_path.mkdir(parents=True, exist_ok=True)
+                core.check_writable(base_path)
+            except Exception as e:
+                messagebox.showerror("Permission Error", f"Cannot write to library folder:\n{e}")
+                return
+                
+        stats = self.begin_stats('import' if importing else 'organize-apply')
+        with stats.stage('plan'):
+            self.organization_plan = self.make_organization_plan()
+            
+        if importing:
+            action = "delete the originals after copying" if self.delete_originals.get() else "keep the originals"
+            result = messagebox.askyesno("Confirm Import",
+                                       f"Copy {len(self.organization_plan)} files into {base_path} and {action}?")
+        else:
+            result = messagebox.askyesno("Confirm Organization", 
+                                       f"Are you sure you want to organize {len(self.organization_plan)} files into folders?")
         if not result:
+            self.run_stats = None
             return
             
         success_count = 0
@@ -568,50 +1203,203 @@ class FileOrganizer:
         errors = []
         self.org_progress['maximum'] = len(self.organization_plan)
         
-        for i, plan_item in enumerate(self.organization_plan):
-            self.org_progress['value'] = i + 1
-            self.root.update_idletasks()
+        scheduler = MoveScheduler()
+        if importing:
+            delete_source = self.delete_originals.get()
+            journal = Journal.create('import', base_path, source=self.organize_folder.get(),
+                                     delete_source=delete_source, verify=True)
+            results = core.apply_import(self.organization_plan, journal, scheduler, delete_source)
+        else:
+            journal = Journal.create('organize', base_path)
+            results = core.apply_organization(self.organization_plan, journal, scheduler)
             
-            try:
-                source_path = plan_item['file_info']['path']
-                dest_path = plan_item['destination']
-                
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                shutil.move(str(source_path), str(dest_path))
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                errors.append(f"{source_path.name}: {str(e)}")
+        verb = "Copying" if importing else "Moving"
+        catalogued = []
+        with stats.stage('apply'):
+            for i, (plan_item, new_path, error) in enumerate(results):
+                self.org_progress['value'] = i + 1
+                if i % 200 == 0:
+                    files_per_sec, mb_per_sec = scheduler.throughput()
+                    self.org_status_label.config(text=f"{verb} files... {i + 1}/{len(self.organization_plan)} "
+                                                      f"({files_per_sec:.0f} files/s, {mb_per_sec:.1f} MB/s)")
+                self.root.update_idletasks()
                 
+                if error:
+                    error_count += 1
+                    errors.append(error)
+                else:
+                    success_count += 1
+                    file_info = plan_item['file_info']
+                    catalogued.append((new_path, file_info['datetime'], file_info['dt_source']))
+            self.catalog_files(base_path, catalogued)
+        self.finish_stats(stats)
+
         self.org_progress['value'] = 0
         
+        done = "copied" if importing else "organized"
         if error_count == 0:
-            messagebox.showinfo("Success", f"Successfully organized {success_count} files into folders!")
+            messagebox.showinfo("Success", f"Successfully {done} {success_count} files into folders!\n\n"
+                                           f"{'Copied' if importing else 'Moved'} {scheduler.summary()}")
         else:
             error_details = "\n".join(errors[:10])
             if len(errors) > 10:
                 error_details += f"\n... and {len(errors) - 10} more errors"
                 
             messagebox.showwarning("Partial Success", 
-                                 f"Organized {success_count} files successfully.\n"
-                                 f"{error_count} files failed to organize.\n\n"
+                                 f"{done.capitalize()} {success_count} files successfully.\n"
+                                 f"{error_count} files failed to {'import' if importing else 'organize'}.\n\n"
                                  f"Errors:\n{error_details}")
         
         self.clear_organization()
         
+    # Saved plans
+    
+    def ask_plan_path(self):
+        return filedialog.asksaveasfilename(defaultextension='.jsonl', initialfile='pavo-plan.jsonl',
+                                            filetypes=[("PAVO plans", "*.jsonl"), ("All files", "*.*")])
+        
+    def save_plan(self, kind, source, root, items, status_label, **options):
+        path = self.ask_plan_path()
+        if not path:
+            return
+        try:
+            _, count = PlanFile.write(path, kind, source, root, items, **options)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the plan:\n{e}")
+            return
+        status_label.config(text=f"Plan for {count} files saved to {path}")
+        
+    def save_rename_plan(self):
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for metadata extraction to finish")
+            return
+        if self.preview_names is None:
+            messagebox.showerror("Error", "Please generate preview first")
+            return
+        folder = self.source_folder.get()
+        self.save_plan('rename', folder, folder, core.rename_plan_items(self.preview_table, self.preview_names),
+                       self.status_label)
+        
+    def save_organization_plan(self):
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for file analysis to finish")
+            return
+        if not self.organization_plan_ready():
+            return
+        base_path, _ = self.organize_target()
+        items = core.organization_plan_items(self.make_organization_plan())
+        if self.import_mode.get():
+            self.save_plan('import', self.organize_folder.get(), base_path, items, self.org_status_label,
+                           delete_source=self.delete_originals.get(), verify=True)
+        else:
+            self.save_plan('organize', base_path, base_path, items, self.org_status_label)
+            
+    def apply_saved_plan(self):
+        if self.engine.busy:
+            messagebox.showerror("Error", "Please wait for metadata extraction to finish")
+            return
+        path = filedialog.askopenfilename(filetypes=[("PAVO plans", "*.jsonl"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            plan = PlanFile.load(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not read the plan:\n{e}")
+            return
+            
+        # Plans made on another machine name folders as they were mounted there
+        source, root = plan.source, plan.root
+        if not source.is_dir():
+            folder = filedialog.askdirectory(title=f"Where is {source.name} now?")
+            if not folder:
+                return
+            source = Path(folder)
+            if plan.root == plan.source:
+                root = source
+        relocated = (source, root) != (plan.source, plan.root)
+        
+        # One stat per file says what has changed since the plan was made
+        try:
+            total = stale = 0
+            for entry in plan.entries(source, root):
+                total += 1
+                stale += entry.stale_reason(relocated) is not None
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not read the plan:\n{e}")
+            return
+        message = f"Apply this plan to {total} files?\n\n{plan.describe()}"
+        if stale:
+            message += f"\n\n{stale} files changed since the plan was made and will be left alone."
+        if not messagebox.askyesno("Confirm Plan", message):
+            return
+            
+        try:
+            if plan.kind != 'rename':
+                root.mkdir(parents=True, exist_ok=True)
+            core.check_writable(root)
+        except Exception as e:
+            messagebox.showerror("Permission Error", f"Cannot write to {root}:\n{e}")
+            return
+            
+        progress = self.progress if plan.kind == 'rename' else self.org_progress
+        progress['maximum'] = max(total, 1)
+        applied = 0
+        errors = []
+        done = []
+        stats = self.begin_stats(f"{plan.kind}-plan")
+        journal = Journal.create(plan.kind, root, source=str(source), plan=str(plan.path), **plan.options)
+        results = core.apply_plan(plan.kind, plan.entries(source, root), journal, MoveScheduler(), relocated,
+                                  **plan.options)
+        with stats.stage('apply'):
+            for i, (entry, new_path, error) in enumerate(results):
+                progress['value'] = i + 1
+                if i % 200 == 0:
+                    self.root.update_idletasks()
+                if error:
+                    errors.append(error)
+                    continue
+                applied += 1
+                done.append((entry, new_path))
+                # The dates came with the plan; nothing needs reading again
+                try:
+                    stat = os.stat(new_path)
+                except OSError:
+                    continue
+                self.file_index.store(new_path, stat, entry.datetime, entry.dt_source)
+                if self.metadata_cache is not None:
+                    self.metadata_cache.store(new_path, stat, entry.datetime, entry.dt_source)
+            if plan.kind == 'rename':
+                self.catalog_moved([(entry.src, new_path) for entry, new_path in done])
+            else:
+                self.catalog_files(root, [(new_path, entry.datetime, entry.dt_source) for entry, new_path in done])
+        self.finish_stats(stats)
+        progress['value'] = 0
+        
+        # Previews refer to the names before the plan ran
+        self.clear_all()
+        self.clear_organization()
+        
+        if errors:
+            self.show_errors("Partial Success", f"Applied the plan to {applied} files.\n"
+                                                f"{len(errors)} files were changed since, or failed.", errors)
+        else:
+            messagebox.showinfo("Success", f"Applied the plan to {applied} files.")
+        
     def clear_organization(self):
-        self.analyzed_files = []
+        self.analyzed_files = FileTable()
         self.organization_plan = []
+        self.gap_index = None
+        self.org_grouping = None
+        self.org_duplicates = None
+        self.draw_gap_histogram()
         
-        for item in self.org_tree.get_children():
-            self.org_tree.delete(item)
+        self.org_tree.clear()
             
         self.org_status_label.config(text="Ready to organize files")
         self.org_progress['value'] = 0
 
 def main():
+    multiprocessing.freeze_support()
     try:
         root = tk.Tk()
         app = FileOrganizer(root)
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def get_cache_dir():
+    override = os.environ.get('PAVO_CACHE_DIR')
+    if override:
+        cache_dir = Path(override)
+    elif sys.platform == 'win32':
+        cache_dir = Path(os.environ.get('LOCALAPPDATA', Path.home() / 'AppData' / 'Local')) / 'PAVO' / 'Cache'
+    elif sys.platform == 'darwin':
+        cache_dir = Path.home() / 'Library' / 'Caches' / 'PAVO'
+    else:
+        cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'pavo'
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+class MetadataCache:
+    # Results that don't describe the file itself are never cached
+    UNCACHED_SOURCES = {'Current Time'}
+
+    def __init__(self, path=None, max_entries=1_000_000, max_age_days=365, flush_every=500):
+        self.path = Path(path) if path else get_cache_dir() / 'metadata.sqlite3'
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._pending_writes = []
+        self._pending_touches = []
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS metadata (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                datetime TEXT NOT NULL,
+                dt_source TEXT NOT NULL,
+                accessed REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def lookup(self, file_path, stat):
+        key = self._key(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, ino, datetime, dt_source FROM metadata WHERE path = ?',
+                (key,)).fetchone()
+            if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_touches.append((time.time(), key))
+            if len(self._pending_touches) >= self.flush_every:
+                self._flush_locked()
+        return datetime.fromisoformat(row[3]), row[4]
+
+    def store(self, file_path, stat, dt, dt_source):
+        if dt is None or dt_source in self.UNCACHED_SOURCES:
+            return
+        with self._lock:
+            self._pending_writes.append((self._key(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                                         dt.isoformat(), dt_source, time.time()))
+            if len(self._pending_writes) >= self.flush_every:
+                self._flush_locked()
+
+    def rename(self, old_path, new_path):
+        with self._lock:
+            self._flush_locked()
+            self._conn.execute('UPDATE OR REPLACE metadata SET path = ? WHERE path = ?',
+                               (self._key(new_path), self._key(old_path)))
+            self._conn.commit()
+
+    def moved(self, moves):
+        """Follow (old path, new path) renames, in one transaction."""
+        with self._lock:
+            self._flush_locked()
+            self._conn.executemany('UPDATE OR REPLACE metadata SET path = ? WHERE path = ?',
+                                   [(self._key(new), self._key(old)) for old, new in moves])
+            self._conn.commit()
+
+    def forget(self, file_path):
+        with self._lock:
+            self._conn.execute('DELETE FROM metadata WHERE path = ?', (self._key(file_path),))
+            self._conn.commit()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._conn is None:
+            return
+        if self._pending_writes:
+            self._conn.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   self._pending_writes)
+            self._pending_writes = []
+        if self._pending_touches:
+            self._conn.executemany('UPDATE metadata SET accessed = ? WHERE path = ?', self._pending_touches)
+            self._pending_touches = []
+        self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            self._flush_locked()
+            cutoff = time.time() - self.max_age_days * 86400
+            removed = self._conn.execute('DELETE FROM metadata WHERE accessed < ?', (cutoff,)).rowcount
+            count = self._conn.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+            if count > self.max_entries:
+                removed += self._conn.execute(
+                    'DELETE FROM metadata WHERE path IN '
+                    '(SELECT path FROM metadata ORDER BY accessed LIMIT ?)',
+                    (count - self.max_entries,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.evict()
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,818 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+from pavo import core
+from pavo.cache import MetadataCache
+from pavo.dedupe import DUPLICATE_ACTIONS, DuplicateFinder
+from pavo.engine import ExtractionEngine
+from pavo.filetable import FileTable
+from pavo.journal import Journal, incomplete_journals, latest_undoable_journal, list_journals
+from pavo.layout import READ_ORDERS
+from pavo.library import LibraryCatalog, SessionIndex, catalog_library, parse_date
+from pavo.mover import MoveScheduler
+from pavo.planfile import PlanFile
+from pavo.quarantine import Quarantine, describe_failures
+from pavo.scanner import DEFAULT_EXCLUDE
+from pavo.sessions import TYPE_FOLDERS
+from pavo.stats import RunStats
+from pavo.watch import DEBOUNCE_SECONDS, SETTLE_SECONDS, WatchDaemon
+
+PROGRESS_INTERVAL = 1.0
+
+READ_ORDER_HELP = ("order files are read in (default: name); 'physical' reads them one at a time per disk in "
+                   "the order they sit on it, and 'auto' does that for rotational disks and card readers whose "
+                   "filesystem reports where files are")
+
+
+class Progress:
+    def __init__(self, label, quiet=False):
+        self.label = label
+        self.quiet = quiet
+        self.count = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def step(self, n=1):
+        self.count += n
+        now = time.monotonic()
+        if not self.quiet and now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            rate = self.count / max(now - self.started, 1e-9)
+            print(f"{self.label}: {self.count} files ({rate:.0f} files/s)", file=sys.stderr)
+
+    def finish(self):
+        if not self.quiet:
+            elapsed = time.monotonic() - self.started
+            print(f"{self.label}: {self.count} files in {elapsed:.1f}s", file=sys.stderr)
+
+
+def cmd_import(args):
+    folder = Path(args.folder)
+    destination = Path(args.destination)
+    custom_name = core.sanitize_filename(args.name.strip()) if args.name else None
+    if not args.dry_run and not args.save_plan:
+        destination.mkdir(parents=True, exist_ok=True)
+        core.check_writable(destination)
+
+    stats = RunStats('import', args.profile)
+    table = analyze(args, folder, stats)
+
+    progress = Progress("Imported" if not args.dry_run else "Planned", args.quiet)
+    errors = []
+    catalog = open_catalog()
+    try:
+        grouping = library_grouping(args, table, destination, catalog, stats)
+        plan = plan_with_duplicates(args, table, destination, stats, grouping, custom_name=custom_name)
+        verify = not args.no_verify
+        if args.save_plan:
+            save_plan(args, 'import', folder, destination, core.organization_plan_items(plan),
+                      delete_source=args.delete_source, verify=verify)
+        elif args.dry_run:
+            print_plan(plan, destination, progress)
+        else:
+            journal = Journal.create('import', destination, source=str(folder),
+                                     delete_source=args.delete_source, verify=verify)
+            scheduler = MoveScheduler()
+            with stats.stage('apply'):
+                results = core.apply_import(plan, journal, scheduler, args.delete_source, verify)
+                errors = apply_and_catalog(results, catalog, destination, progress)
+            progress.finish()
+            if not args.quiet:
+                print(f"Copied {scheduler.summary()}", file=sys.stderr)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    report_stats(args, stats)
+
+    if errors:
+        print(f"{len(errors)} files failed to import:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def open_catalog():
+    try:
+        return LibraryCatalog()
+    except Exception as e:
+        print(f"Library catalog unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def library_grouping(args, table, library, catalog, stats):
+    # Imported files join the sessions already in the library. The catalog
+    # answers for the days it knows; only session folders it doesn't are read.
+    engine = make_engine(args, stats)
+    try:
+        with stats.stage('sessions'):
+            return SessionIndex(library, organize_options(args), engine, catalog).assign(table)
+    finally:
+        if engine is not None:
+            engine.shutdown()
+
+
+def apply_and_catalog(results, catalog, library, progress):
+    """Run apply_organization/apply_import results, cataloguing the files
+    that made it into library; returns the errors."""
+    errors = []
+    catalogued = []
+    for item, new_path, error in results:
+        if error:
+            errors.append(error)
+        else:
+            catalogued.append((new_path, item['file_info']['datetime'], item['file_info']['dt_source']))
+        progress.step()
+    if catalog is not None:
+        catalog.record(library, catalogued)
+    return errors
+
+
+def open_cache(args):
+    if args.no_cache:
+        return None
+    try:
+        return MetadataCache()
+    except Exception as e:
+        print(f"Metadata cache unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def open_quarantine(args):
+    # --no-cache reads every file again, quarantined or not
+    if args.no_cache:
+        return None
+    try:
+        return Quarantine()
+    except Exception as e:
+        print(f"Quarantine list unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def report_failures(engine):
+    if engine is None or not engine.failures:
+        return
+    print(f"Dates of {len(engine.failures)} files could not be read from their metadata "
+          f"({describe_failures(engine.failures)}); see 'pavo quarantine'", file=sys.stderr)
+
+
+def make_engine(args, stats=None):
+    # Under --profile files are read one at a time on the main thread, so
+    # the profile sees the extractors themselves
+    if args.profile:
+        return None
+    return ExtractionEngine(max_threads=args.threads, max_processes=args.processes, cache=open_cache(args),
+                            stats=stats, read_order=args.read_order, quarantine=open_quarantine(args))
+
+
+def analyze(args, folder, stats):
+    engine = make_engine(args, stats)
+    try:
+        with stats.stage('extract'):
+            table = core.analyze_folder(folder, engine, stats, **scan_options(args))
+        if args.verify_names:
+            with stats.stage('verify_names'):
+                check_name_dates(args, table, engine)
+        if not args.quiet:
+            report_failures(engine)
+        return table
+    finally:
+        if engine is not None:
+            engine.shutdown()
+
+
+def check_name_dates(args, table, engine):
+    # Dates read from file names are only as good as whoever named the files;
+    # if any of a sample disagree with the metadata, the metadata wins
+    names = len(core.name_dated(table))
+    if not names:
+        return
+    checked, mismatched = core.verify_name_dates(table, engine, args.verify_names)
+    if not mismatched:
+        if not args.quiet:
+            print(f"Dates in file names: {checked} checked against metadata, all match", file=sys.stderr)
+        return
+    print(f"Dates in file names: {mismatched} of {checked} checked differ from the metadata; "
+          f"reading the metadata of all {names} files", file=sys.stderr)
+    changed = core.use_metadata_dates(table, engine)
+    table.sort_by_capture()
+    if not args.quiet:
+        print(f"Dates in file names: {changed} corrected", file=sys.stderr)
+
+
+def report_stats(args, stats):
+    # Every run's stats are kept in the stats folder; --stats shows them
+    try:
+        path = stats.save(args.stats_json)
+    except OSError as e:
+        print(f"Could not save stats: {e}", file=sys.stderr)
+        return
+    if args.stats:
+        for line in stats.summary():
+            print(line, file=sys.stderr)
+        print(f"Stats saved to {path}", file=sys.stderr)
+
+
+def scan_options(args):
+    return {
+        'recursive': args.recursive,
+        'include': args.include,
+        'exclude': args.exclude if args.exclude is not None else DEFAULT_EXCLUDE
+    }
+
+
+def report_errors(errors):
+    for error in errors[:10]:
+        print(f"  {error}", file=sys.stderr)
+    if len(errors) > 10:
+        print(f"  ... and {len(errors) - 10} more errors", file=sys.stderr)
+
+
+def cmd_rename(args):
+    folder = Path(args.folder)
+    custom_name = core.sanitize_filename(args.name.strip())
+    if not custom_name:
+        print("Error: custom name is empty", file=sys.stderr)
+        return 2
+    if not args.dry_run and not args.save_plan:
+        core.check_writable(folder)
+
+    stats = RunStats('rename', args.profile)
+    engine = make_engine(args, stats)
+    progress = Progress("Renamed" if not args.dry_run and not args.save_plan else "Planned", args.quiet)
+    errors = []
+    try:
+        files = core.iter_media_files(folder, **scan_options(args))
+        with stats.stage('extract'):
+            table = FileTable.from_extracted(core.extract_datetimes(files, engine, stats))
+        duplicates = ()
+        if args.skip_duplicates:
+            with stats.stage('duplicates'):
+                duplicates = find_duplicates(table.paths(), None, args.quiet)
+        with stats.stage('naming'):
+            new_names = core.plan_renames(table, custom_name, skip=duplicates)
+        if args.save_plan:
+            save_plan(args, 'rename', folder, folder, core.rename_plan_items(table, new_names))
+        elif args.dry_run:
+            for i, new_name in enumerate(new_names):
+                if new_name is not None:
+                    print(f"{table.name(i)}\t{new_name}\t{table.dt_source(i)}")
+                    progress.step()
+        else:
+            journal = Journal.create('rename', folder)
+            renamed = []
+            with stats.stage('apply'):
+                for i, new_path, error in core.apply_renames(table, new_names, journal):
+                    if error:
+                        errors.append(error)
+                    else:
+                        renamed.append((table.path(i), new_path))
+                    progress.step()
+            # The dates stay cached under the new names
+            cache = open_cache(args)
+            if cache is not None:
+                try:
+                    cache.moved(renamed)
+                finally:
+                    cache.close()
+            follow_moves(renamed)
+    finally:
+        if engine is not None:
+            engine.shutdown()
+
+    progress.finish()
+    report_stats(args, stats)
+    if errors:
+        print(f"{len(errors)} files failed to rename:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def follow_moves(moves):
+    # Renamed files in a library stay in the catalog under their new names
+    catalog = open_catalog()
+    if catalog is not None:
+        try:
+            catalog.moved(moves)
+        finally:
+            catalog.close()
+
+
+def find_duplicates(paths, target_root, quiet):
+    finder = DuplicateFinder()
+    duplicates = core.find_duplicates(paths, target_root, finder)
+    if not quiet:
+        print(f"Duplicates: {len(duplicates)} found ({finder.summary()})", file=sys.stderr)
+    return duplicates
+
+
+def plan_with_duplicates(args, table, base_path, stats, grouping=None, **plan_options):
+    duplicates = None
+    if args.duplicates != 'keep' or args.dry_run:
+        with stats.stage('duplicates'):
+            duplicates = find_duplicates(table.paths(), base_path, args.quiet)
+    with stats.stage('plan'):
+        if grouping is not None:
+            return list(core.plan_from_grouping(table, grouping, base_path, duplicates=duplicates,
+                                                duplicate_action=args.duplicates, **plan_options))
+        return list(core.plan_organization(table, base_path, organize_options(args), duplicates=duplicates,
+                                           duplicate_action=args.duplicates, **plan_options))
+
+
+def print_plan(plan, base_path, progress):
+    for item in plan:
+        line = f"{item['file_info']['path'].name}\t{item['destination'].relative_to(base_path)}"
+        if 'duplicate_of' in item:
+            line += f"\tduplicate of {item['duplicate_of']}"
+        print(line)
+        progress.step()
+    progress.finish()
+
+
+def save_plan(args, kind, source, root, items, **options):
+    _, count = PlanFile.write(args.save_plan, kind, source, root, items, **options)
+    if not args.quiet:
+        print(f"Plan for {count} files saved to {args.save_plan}; apply it with 'pavo apply'", file=sys.stderr)
+
+
+def organize_options(args):
+    return core.OrganizeOptions(
+        separate_by_date=not args.no_date,
+        separate_by_session=not args.no_session,
+        separate_by_type=not args.no_type,
+        time_gap_minutes=args.gap
+    )
+
+
+def cmd_organize(args):
+    folder = Path(args.folder)
+
+    stats = RunStats('organize', args.profile)
+    table = analyze(args, folder, stats)
+
+    progress = Progress("Organized" if not args.dry_run else "Planned", args.quiet)
+    errors = []
+    plan = plan_with_duplicates(args, table, folder, stats)
+    if args.save_plan:
+        save_plan(args, 'organize', folder, folder, core.organization_plan_items(plan))
+    elif args.dry_run:
+        print_plan(plan, folder, progress)
+    else:
+        journal = Journal.create('organize', folder)
+        scheduler = MoveScheduler()
+        catalog = open_catalog()
+        try:
+            with stats.stage('apply'):
+                errors = apply_and_catalog(core.apply_organization(plan, journal, scheduler), catalog, folder,
+                                           progress)
+        finally:
+            if catalog is not None:
+                catalog.close()
+        progress.finish()
+        if not args.quiet:
+            print(f"Moved {scheduler.summary()}", file=sys.stderr)
+    report_stats(args, stats)
+
+    if errors:
+        print(f"{len(errors)} files failed to organize:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def cmd_watch(args):
+    destination = Path(args.destination)
+    destination.mkdir(parents=True, exist_ok=True)
+    core.check_writable(destination)
+    custom_name = core.sanitize_filename(args.name.strip()) if args.name else None
+
+    def report(message):
+        if not args.quiet:
+            print(f"{time.strftime('%H:%M:%S')} {message}", file=sys.stderr)
+
+    engine = ExtractionEngine(max_threads=args.threads, max_processes=args.processes, cache=open_cache(args),
+                              read_order=args.read_order, quarantine=open_quarantine(args))
+    catalog = open_catalog()
+    try:
+        daemon = WatchDaemon(args.folder, destination, organize_options(args), engine, custom_name=custom_name,
+                             duplicate_action=args.duplicates, poll=args.poll, settle_seconds=args.settle,
+                             debounce_seconds=args.debounce,
+                             exclude=args.exclude if args.exclude is not None else DEFAULT_EXCLUDE,
+                             report=report, catalog=catalog)
+    except ValueError as e:
+        engine.shutdown()
+        if catalog is not None:
+            catalog.close()
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    # Stop between batches on SIGTERM as well as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    report(f"Watching {daemon.folder} ({daemon.mode}), organizing into {daemon.destination}")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.shutdown()
+        if catalog is not None:
+            catalog.close()
+    report(f"Stopped after {daemon.files_done} files in {daemon.batches} batches")
+    return 0
+
+
+def cmd_apply(args):
+    try:
+        plan = PlanFile.load(args.plan)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    # A rename or organize plan has one folder; --root moves both ends
+    source = args.source or (args.root if plan.source == plan.root else None)
+    source = Path(os.path.abspath(source)) if source else plan.source
+    root = Path(os.path.abspath(args.root)) if args.root else plan.root
+    relocated = (source, root) != (plan.source, plan.root)
+    entries = plan.entries(source, root)
+    if not args.quiet:
+        print(f"Plan: {plan.describe()}", file=sys.stderr)
+
+    if args.dry_run:
+        progress = Progress("Checked", args.quiet)
+        stale = 0
+        for entry in entries:
+            reason = entry.stale_reason(relocated)
+            stale += reason is not None
+            print(f"{entry.src}\t{entry.dst}\t{reason or 'ok'}")
+            progress.step()
+        progress.finish()
+        if stale:
+            print(f"{stale} files changed since the plan was made and would be left alone", file=sys.stderr)
+        return 0
+
+    if plan.kind != 'rename':
+        root.mkdir(parents=True, exist_ok=True)
+    core.check_writable(root)
+    journal = Journal.create(plan.kind, root, source=str(source), plan=str(plan.path), **plan.options)
+    scheduler = MoveScheduler()
+    cache = open_cache(args)
+    progress = Progress("Applied", args.quiet)
+    errors = []
+    stale = []
+    done = []
+    try:
+        for entry, new_path, error in core.apply_plan(plan.kind, entries, journal, scheduler, relocated,
+                                                      **plan.options):
+            if entry.stale is not None:
+                stale.append(error)
+            elif error:
+                errors.append(error)
+            else:
+                done.append((entry, new_path))
+                if cache is not None:
+                    # The date travelled with the plan, so it's never read again here
+                    try:
+                        cache.store(new_path, os.stat(new_path), entry.datetime, entry.dt_source)
+                    except OSError:
+                        pass
+            progress.step()
+    finally:
+        if cache is not None:
+            cache.close()
+    if plan.kind == 'rename':
+        follow_moves([(entry.src, new_path) for entry, new_path in done])
+    else:
+        catalog = open_catalog()
+        if catalog is not None:
+            try:
+                catalog.record(root, [(new_path, entry.datetime, entry.dt_source) for entry, new_path in done])
+            finally:
+                catalog.close()
+
+    progress.finish()
+    if plan.kind != 'rename' and not args.quiet:
+        print(f"{'Copied' if plan.kind == 'import' else 'Moved'} {scheduler.summary()}", file=sys.stderr)
+    if stale:
+        print(f"{len(stale)} files changed since the plan was made and were left alone:", file=sys.stderr)
+        report_errors(stale)
+    if errors:
+        print(f"{len(errors)} files failed:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def cmd_library(args):
+    catalog = open_catalog()
+    if catalog is None:
+        return 1
+    try:
+        if args.update:
+            if args.library is None or not Path(args.library).is_dir():
+                print("Error: --update needs the library folder", file=sys.stderr)
+                return 2
+            engine = ExtractionEngine(max_threads=args.threads, cache=open_cache(args), read_order=args.read_order,
+                                      quarantine=open_quarantine(args))
+            try:
+                recorded, forgotten = catalog_library(catalog, args.library, engine)
+                if not args.quiet:
+                    report_failures(engine)
+            finally:
+                engine.shutdown()
+            if not args.quiet:
+                print(f"Catalogued {recorded} files in {os.path.abspath(args.library)}"
+                      + (f", forgot {forgotten} no longer there" if forgotten else ""), file=sys.stderr)
+            return 0
+
+        start = parse_date(args.start) if args.start else None
+        end = parse_date(args.end, end=True) if args.end else None
+        if args.sessions:
+            libraries = [args.library] if args.library else [library for library, *_ in catalog.libraries()]
+            for library in libraries:
+                for session, first, last, count in catalog.sessions(library, start, end):
+                    print(f"{os.path.join(os.path.abspath(library), session)}\t{first:%Y-%m-%d %H:%M:%S}\t"
+                          f"{last:%Y-%m-%d %H:%M:%S}\t{count}")
+            return 0
+        if args.library is None and start is None and end is None and args.type is None:
+            for library, count, first, last in catalog.libraries():
+                print(f"{library}\t{count}\t{first:%Y-%m-%d}\t{last:%Y-%m-%d}")
+            return 0
+        file_type = {folder.lower(): code for code, folder in TYPE_FOLDERS.items()}.get(args.type)
+        count = 0
+        for path, dt, _, _, _ in catalog.files(start, end, args.library, file_type):
+            print(f"{dt:%Y-%m-%d %H:%M:%S}\t{path}")
+            count += 1
+        if not args.quiet:
+            print(f"{count} files", file=sys.stderr)
+        return 0
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        catalog.close()
+
+
+def load_journal(args):
+    if args.journal:
+        return Journal.load(args.journal)
+    return latest_undoable_journal()
+
+
+def cmd_quarantine(args):
+    try:
+        quarantine = Quarantine()
+    except Exception as e:
+        print(f"Quarantine list unavailable: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.release:
+            released = quarantine.release(args.paths or None)
+            if not args.quiet:
+                print(f"Released {released} files; they will be read again", file=sys.stderr)
+            return 0
+        for path, failures, kind, extractor, last in quarantine.entries():
+            state = 'quarantined' if failures >= quarantine.threshold else 'failed'
+            print(f"{path}\t{state}\t{failures} x {kind}\t{extractor}\t"
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}")
+        return 0
+    finally:
+        quarantine.close()
+
+
+def cmd_journals(args):
+    for path in list_journals():
+        print(f"{path}\t{Journal.load(path).describe()}")
+    return 0
+
+
+def cmd_resume(args):
+    journals = [Journal.load(args.journal)] if args.journal else incomplete_journals()
+    if not journals:
+        print("Nothing to resume", file=sys.stderr)
+        return 0
+
+    cache = open_cache(args)
+    errors = []
+    moves = []
+    try:
+        for journal in journals:
+            progress = Progress(f"Resumed {journal.kind}", args.quiet)
+            for op, new_path, error in core.resume_journal(journal):
+                if error:
+                    errors.append(error)
+                else:
+                    moves.append((op.src, new_path))
+                    if cache is not None:
+                        cache.rename(op.src, new_path)
+                progress.step()
+            progress.finish()
+    finally:
+        if cache is not None:
+            cache.close()
+    follow_moves(moves)
+
+    if errors:
+        print(f"{len(errors)} files could not be completed:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def cmd_undo(args):
+    journal = load_journal(args)
+    if journal is None:
+        print("Nothing to undo", file=sys.stderr)
+        return 0
+    if not journal.complete:
+        print(f"Undoing an interrupted run: {journal.describe()}", file=sys.stderr)
+
+    progress = Progress(f"Undid {journal.kind}", args.quiet)
+    errors = []
+    undone = []
+    for op, error in core.undo_journal(journal):
+        if error:
+            errors.append(error)
+        else:
+            undone.append(op)
+            progress.step()
+    cache = open_cache(args)
+    if cache is not None:
+        try:
+            cache.moved([(op.done, op.src) for op in undone])
+        finally:
+            cache.close()
+    # Renames are followed; files taken back out of a library are forgotten
+    if journal.kind == 'rename':
+        follow_moves([(op.done, op.src) for op in undone])
+    else:
+        catalog = open_catalog()
+        if catalog is not None:
+            try:
+                catalog.forget(op.done for op in undone)
+            finally:
+                catalog.close()
+
+    progress.finish()
+    if errors:
+        print(f"{len(errors)} files could not be restored:", file=sys.stderr)
+        report_errors(errors)
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pavo', description="Photo/Video batch renaming and organising tool")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--dry-run', action='store_true', help="print the plan without changing any files")
+    common.add_argument('--no-cache', action='store_true', help="don't use the persistent metadata cache")
+    common.add_argument('--threads', type=int, default=None, help="extraction worker threads")
+    common.add_argument('--processes', type=int, default=None, help="EXIF worker processes")
+    common.add_argument('--read-order', choices=READ_ORDERS, default='name', help=READ_ORDER_HELP)
+    common.add_argument('-r', '--recursive', action='store_true', help="include files in subfolders")
+    common.add_argument('--include', action='append', metavar='GLOB',
+                        help="only take files from folders matching GLOB ('.' is the folder itself; repeatable)")
+    common.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="skip subfolders matching GLOB (repeatable, default: hidden folders)")
+    common.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+    common.add_argument('--stats', action='store_true',
+                        help="print where the time went (stage timings, extractors, slowest files)")
+    common.add_argument('--stats-json', metavar='PATH',
+                        help="write the stats here (default: the stats folder in the cache directory)")
+    common.add_argument('--profile', action='store_true',
+                        help="run under cProfile, reading files one at a time on the main thread; "
+                             "the profile is saved beside the stats JSON")
+    common.add_argument('--save-plan', metavar='PATH',
+                        help="save the plan to PATH, to check and carry out later with 'pavo apply', "
+                             "instead of changing any files")
+
+    rename = subparsers.add_parser('rename', parents=[common], help="rename files to <name>_<date taken>")
+    rename.add_argument('folder')
+    rename.add_argument('--name', required=True, help="custom name prefix")
+    rename.add_argument('--skip-duplicates', action='store_true',
+                        help="leave files whose content matches an earlier file unrenamed")
+    rename.set_defaults(func=cmd_rename)
+
+    grouping = argparse.ArgumentParser(add_help=False)
+    grouping.add_argument('--gap', type=int, default=120, help="time gap for a new session, in minutes")
+    grouping.add_argument('--no-date', action='store_true', help="don't separate by date")
+    grouping.add_argument('--no-session', action='store_true', help="don't separate by session")
+    grouping.add_argument('--no-type', action='store_true', help="don't separate photos and videos")
+    grouping.add_argument('--duplicates', choices=DUPLICATE_ACTIONS, default='keep',
+                          help="files whose content is already planned or in the destination: keep them "
+                               "(numbered), skip them, or hard-link them to the original (default: keep)")
+
+    # Files PAVO has renamed are dated by their names; this checks them
+    names = argparse.ArgumentParser(add_help=False)
+    names.add_argument('--verify-names', type=int, nargs='?', const=core.VERIFY_SAMPLE_SIZE, default=0, metavar='N',
+                       help="check N (default: %(const)s) dates read from file names against the files' metadata, "
+                            "and use the metadata for all of them if any differ")
+
+    organize = subparsers.add_parser('organize', parents=[common, grouping, names], help="move files into date/session folders")
+    organize.add_argument('folder')
+    organize.set_defaults(func=cmd_organize)
+
+    import_ = subparsers.add_parser('import', parents=[common, grouping, names],
+                                    help="copy files into date/session folders under another folder")
+    import_.add_argument('folder', help="folder to import from, e.g. a memory card")
+    import_.add_argument('destination', help="library folder to copy into")
+    import_.add_argument('--name', help="also rename the copies to <name>_<date taken>")
+    import_.add_argument('--delete-source', action='store_true',
+                         help="delete each original once its copy has been verified")
+    import_.add_argument('--no-verify', action='store_true',
+                         help="skip checksums and flushing copies to disk (ignored with --delete-source)")
+    import_.set_defaults(func=cmd_import)
+
+    watch = subparsers.add_parser('watch', parents=[grouping],
+                                  help="keep organizing files into a library as they arrive in a folder")
+    watch.add_argument('folder', help="drop folder to watch, including its subfolders")
+    watch.add_argument('destination', help="library folder to move files into")
+    watch.add_argument('--name', help="also rename files to <name>_<date taken>")
+    watch.add_argument('--poll', action='store_true',
+                       help="rescan every few seconds instead of using inotify (e.g. for network shares)")
+    watch.add_argument('--settle', type=float, default=SETTLE_SECONDS, metavar='SECONDS',
+                       help=f"wait until a file is unchanged for this long (default: {SETTLE_SECONDS:g})")
+    watch.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, metavar='SECONDS',
+                       help=f"start a batch once no new file has settled for this long (default: {DEBOUNCE_SECONDS:g})")
+    watch.add_argument('--exclude', action='append', metavar='GLOB',
+                       help="skip subfolders matching GLOB (repeatable, default: hidden folders)")
+    watch.add_argument('--no-cache', action='store_true', help="don't use the persistent metadata cache")
+    watch.add_argument('--threads', type=int, default=None, help="extraction worker threads")
+    watch.add_argument('--processes', type=int, default=None, help="EXIF worker processes")
+    watch.add_argument('--read-order', choices=READ_ORDERS, default='name', help=READ_ORDER_HELP)
+    watch.add_argument('-q', '--quiet', action='store_true', help="don't report batches")
+    watch.set_defaults(func=cmd_watch)
+
+    apply = subparsers.add_parser('apply', help="carry out a plan saved with --save-plan, leaving alone files "
+                                                "that changed since")
+    apply.add_argument('plan', help="plan file")
+    apply.add_argument('--root', help="where the plan's folder (the library, for imports) is now, "
+                                      "if it has moved or is mounted elsewhere")
+    apply.add_argument('--source', help="where an import plan's source folder is now")
+    apply.add_argument('--dry-run', action='store_true',
+                       help="list each file and whether it changed since the plan was made")
+    apply.add_argument('--no-cache', action='store_true', help="don't add the plan's dates to the metadata cache")
+    apply.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+    apply.set_defaults(func=cmd_apply)
+
+    library = subparsers.add_parser('library', help="search the catalog of organized and imported files by date")
+    library.add_argument('library', nargs='?', help="only this library folder (default: every catalogued one; "
+                                                    "with nothing else given, list the libraries)")
+    library.add_argument('--from', dest='start', metavar='DATE',
+                         help="files captured from DATE (YYYY-MM-DD or 'YYYY-MM-DD HH:MM')")
+    library.add_argument('--to', dest='end', metavar='DATE', help="files captured up to DATE (a bare date "
+                                                                  "includes that day)")
+    library.add_argument('--type', choices=[folder.lower() for folder in TYPE_FOLDERS.values()],
+                         help="only photos or only videos")
+    library.add_argument('--sessions', action='store_true',
+                         help="list session folders with their first and last capture times instead of files")
+    library.add_argument('--update', action='store_true',
+                         help="catalog every file in the library folder, e.g. one organized before the catalog "
+                              "existed, and forget files no longer there")
+    library.add_argument('--no-cache', action='store_true', help="don't use the persistent metadata cache")
+    library.add_argument('--threads', type=int, default=None, help="extraction worker threads (with --update)")
+    library.add_argument('--read-order', choices=READ_ORDERS, default='name', help=READ_ORDER_HELP)
+    library.add_argument('-q', '--quiet', action='store_true', help="don't report counts")
+    library.set_defaults(func=cmd_library)
+
+    quarantine = subparsers.add_parser('quarantine', help="list files whose dates couldn't be read; those that "
+                                                          "failed twice are no longer read")
+    quarantine.add_argument('paths', nargs='*', help="with --release, only these files")
+    quarantine.add_argument('--release', action='store_true',
+                            help="forget the failures (of every file by default) so they are read again")
+    quarantine.add_argument('-q', '--quiet', action='store_true', help="don't report counts")
+    quarantine.set_defaults(func=cmd_quarantine)
+
+    journals = subparsers.add_parser('journals', help="list the journals of past renames and organizes")
+    journals.set_defaults(func=cmd_journals)
+
+    replay = argparse.ArgumentParser(add_help=False)
+    replay.add_argument('journal', nargs='?', help="journal file (see 'pavo journals')")
+    replay.add_argument('--no-cache', action='store_true', help="don't update the persistent metadata cache")
+    replay.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+
+    resume = subparsers.add_parser('resume', parents=[replay],
+                                   help="finish interrupted runs (default: all of them)")
+    resume.set_defaults(func=cmd_resume)
+
+    undo = subparsers.add_parser('undo', parents=[replay], help="undo a run (default: the latest)")
+    undo.set_defaults(func=cmd_undo)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if hasattr(args, 'folder') and not Path(args.folder).is_dir():
+        print(f"Error: {args.folder} is not a folder", file=sys.stderr)
+        return 2
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,530 @@
+import os
+import random
+import re
+import shutil
+import sys
+from collections import defaultdict, deque
+from pathlib import Path
+
+from pavo.dedupe import DuplicateFinder
+from pavo.filetable import FileTable
+from pavo.metadata import FALLBACK_SOURCES, SUPPORTED_EXTENSIONS, find_policy, get_datetime, metadata_policy
+from pavo.mover import MoveScheduler, import_file, link_into_place, unique_path
+from pavo.namemeta import NAME_DATE_FORMAT
+from pavo.scanner import DEFAULT_EXCLUDE, ScanEntry, scan
+from pavo.sessions import GapIndex
+from pavo.stats import traced
+
+
+# Windows and macOS volumes don't tell names apart by case by default
+CASE_INSENSITIVE_NAMES = sys.platform in ('win32', 'darwin')
+
+
+class OrganizeOptions:
+    def __init__(self, separate_by_date=True, separate_by_session=True, separate_by_type=True,
+                 time_gap_minutes=120):
+        self.separate_by_date = separate_by_date
+        self.separate_by_session = separate_by_session
+        self.separate_by_type = separate_by_type
+        self.time_gap_minutes = time_gap_minutes
+
+
+# Scanning and extraction
+
+def iter_media_files(folder, extensions=SUPPORTED_EXTENSIONS, recursive=False, include=None,
+                     exclude=DEFAULT_EXCLUDE):
+    return scan(folder, extensions, recursive=recursive, include=include, exclude=exclude)
+
+
+def extract_datetimes(files, engine=None, stats=None, policy=None):
+    """Yield (path, datetime, dt_source) for each file, in completion order.
+
+    Without an engine files are read one at a time on this thread, recorded
+    into stats when given (an engine records into its own). policy overrides
+    the folders' extractor policies.
+    """
+    if engine is None:
+        policies = {}
+        for file_path in files:
+            stat = file_path.stat if isinstance(file_path, ScanEntry) else None
+            file_path = Path(file_path)
+            file_policy = policy if policy is not None else find_policy(file_path.parent, policies)
+            if stats is None:
+                dt, dt_source = get_datetime(file_path, stat, file_policy)
+            else:
+                (dt, dt_source), timings, bytes_read, failures = traced(get_datetime, file_path, stat, file_policy)
+                stats.record_extraction(file_path, dt_source, timings, bytes_read)
+                if failures and dt_source in FALLBACK_SOURCES:
+                    stats.record_failure(failures[-1][1], failures[-1][0])
+            yield file_path, dt, dt_source
+    else:
+        for _, file_path, dt, dt_source in engine.run(files, policy):
+            yield file_path, dt, dt_source
+
+
+def analyze_folder(folder, engine=None, stats=None, **scan_options):
+    """A FileTable of the media files in folder, in capture order."""
+    files = iter_media_files(folder, **scan_options)
+    table = FileTable.from_extracted(extract_datetimes(files, engine, stats))
+    table.sort_by_capture()
+    return table
+
+
+# Dates from file names
+
+# How many of the files dated by their names are checked against their
+# metadata
+VERIFY_SAMPLE_SIZE = 50
+
+
+def name_dated(table):
+    """Indices of the files whose date came from their name."""
+    return table.indices_with_source('Filename')
+
+
+def has_metadata_date(dt_source):
+    return dt_source != 'Filename' and dt_source not in FALLBACK_SOURCES
+
+
+def read_metadata_dates(table, indices, engine=None):
+    """Yield (index, datetime, dt_source) for the files at indices whose
+    metadata has a date, ignoring their names."""
+    by_path = {table.path(i): i for i in indices}
+    for file_path, dt, dt_source in extract_datetimes(list(by_path), engine, policy=metadata_policy()):
+        if has_metadata_date(dt_source):
+            yield by_path[file_path], dt, dt_source
+
+
+def verify_name_dates(table, engine=None, sample_size=VERIFY_SAMPLE_SIZE):
+    """Compare a random sample of the files dated by their names with their
+    metadata, to the second. Returns (checked, mismatched); files with no
+    date in their metadata can't be checked."""
+    indices = name_dated(table)
+    sample = random.sample(indices, min(sample_size, len(indices)))
+    checked = mismatched = 0
+    for i, dt, _ in read_metadata_dates(table, sample, engine):
+        checked += 1
+        if dt.replace(microsecond=0) != table.datetime(i).replace(microsecond=0):
+            mismatched += 1
+    return checked, mismatched
+
+
+def use_metadata_dates(table, engine=None):
+    """Re-date every file dated by its name from its metadata, where that has
+    a date. Returns how many dates changed; sort the table again afterwards."""
+    changed = 0
+    for i, dt, dt_source in read_metadata_dates(table, name_dated(table), engine):
+        if dt.replace(microsecond=0) != table.datetime(i).replace(microsecond=0):
+            changed += 1
+        table.set_date(i, dt, dt_source)
+    return changed
+
+
+# Duplicates
+
+def find_duplicates(paths, target_root=None, finder=None):
+    """Map index in paths -> path of a file with identical content.
+
+    Files already under target_root are checked too, and are always the
+    ones kept.
+    """
+    candidates = []
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            size = 0
+        candidates.append((path, size))
+
+    existing = []
+    if target_root is not None and os.path.isdir(target_root):
+        own = {os.fspath(path) for path in paths}
+        existing = [(Path(entry.path), entry.stat.st_size)
+                    for entry in scan(target_root, recursive=True) if entry.path not in own]
+
+    if finder is None:
+        finder = DuplicateFinder()
+    return finder.find(candidates, existing)
+
+
+# Target names
+
+class Namespace:
+    """Names in the target folders, listed once and then tracked in memory.
+
+    Collisions are resolved against the listing and the names already
+    handed out, so a burst of same-second shots costs one listdir per folder
+    rather than a stat per candidate name.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._next_counter = {}
+
+    @staticmethod
+    def fold(name):
+        return name.casefold() if CASE_INSENSITIVE_NAMES else name
+
+    def names(self, directory):
+        names = self._names.get(directory)
+        if names is None:
+            try:
+                names = {self.fold(name) for name in os.listdir(directory)}
+            except OSError:
+                names = set()
+            self._names[directory] = names
+        return names
+
+    def claim(self, directory, name, own_name=None):
+        """Reserve name in directory, or the first free name_N after it.
+
+        own_name is the file's current name when it already lives in
+        directory; it stays available to that file.
+        """
+        names = self.names(directory)
+        folded = self.fold(name)
+        if folded not in names:
+            names.add(folded)
+            return name
+
+        own = self.fold(own_name) if own_name is not None else None
+        if folded == own:
+            return name
+        key = (directory, folded)
+        counter = self._next_counter.get(key, 1)
+        stem, extension = os.path.splitext(name)
+        while True:
+            candidate = f"{stem}_{counter}{extension}"
+            counter += 1
+            if self.fold(candidate) not in names or self.fold(candidate) == own:
+                break
+        self._next_counter[key] = counter
+        names.add(self.fold(candidate))
+        return candidate
+
+
+# Renaming
+
+def sanitize_filename(filename):
+    invalid_chars = r'[<>:"/\\|?*]'
+    return re.sub(invalid_chars, '', filename)
+
+
+def format_new_name(custom_name, dt, suffix):
+    return f"{custom_name}_{dt.strftime(NAME_DATE_FORMAT)}{suffix}"
+
+
+def plan_renames(table, custom_name, namespace=None, skip=()):
+    """New names, by index, for renaming each file to <custom_name>_<date taken>.
+
+    Files wanting the same name get name, name_1, name_2, ... in capture
+    order, skipping names already taken in the folder. Indices in skip,
+    and files that already have their new name, get None.
+    """
+    if namespace is None:
+        namespace = Namespace()
+    new_names = [None] * len(table)
+    for i in table.capture_order().tolist():
+        if i in skip:
+            continue
+        name = format_new_name(custom_name, table.datetime(i), table.suffix(i))
+        new_name = namespace.claim(table.directory(i), name, table.name(i))
+        if new_name != table.name(i):
+            new_names[i] = new_name
+    return new_names
+
+
+def check_writable(folder):
+    test_file = Path(folder) / "test_write_permissions.tmp"
+    test_file.write_text("test")
+    test_file.unlink()
+
+
+def describe_error(file_path, error):
+    if isinstance(error, FileNotFoundError):
+        return f"{file_path.name}: Source file not found"
+    if isinstance(error, PermissionError):
+        return f"{file_path.name}: Permission denied - file may be in use"
+    if isinstance(error, OSError) and "being used by another process" in str(error):
+        return f"{file_path.name}: File is open in another program"
+    return f"{file_path.name}: {str(error)}"
+
+
+def rename_file(old_path, new_name):
+    new_path = old_path.parent / new_name
+    if new_path == old_path:
+        return old_path
+
+    # Names are resolved when planning; this one check keeps a file created
+    # since then from being overwritten
+    if new_path.exists() and not new_path.samefile(old_path):
+        new_path = unique_path(new_path)
+
+    old_path.rename(new_path)
+    return new_path
+
+
+def rename_to(old_path, new_path):
+    return rename_file(old_path, new_path.name)
+
+
+def run_operations(ops, operation, journal=None):
+    """Perform (item, src, dst) operations, yielding (item, new_path, exception).
+
+    With a journal every operation is recorded so the run can be resumed
+    or undone later.
+    """
+    if journal is not None:
+        yield from journal.run(ops, operation)
+        return
+    for item, src, dst in ops:
+        try:
+            yield item, operation(src, dst), None
+        except Exception as e:
+            yield item, None, e
+
+
+def rename_ops(table, new_names):
+    for i, new_name in enumerate(new_names):
+        if new_name is not None:
+            old_path = table.path(i)
+            yield i, old_path, old_path.with_name(new_name)
+
+
+def apply_renames(table, new_names, journal=None):
+    """Rename each file with a new name (see plan_renames), yielding
+    (index, new_path, error_message)."""
+    for i, new_path, error in run_operations(rename_ops(table, new_names), rename_to, journal):
+        yield i, new_path, describe_error(table.path(i), error) if error else None
+
+
+# Organizing
+
+def group_files_for_organization(table, options, gap_index=None):
+    """Map group key -> indices of its files."""
+    if gap_index is None:
+        gap_index = GapIndex.from_files(table)
+    groups = defaultdict(list)
+    for i, group_key in enumerate(gap_index.group(options)):
+        groups[group_key].append(i)
+    return groups
+
+
+def get_destination_path(base_path, group_name, name):
+    base_path = Path(base_path)
+    if group_name == 'All_Files':
+        return base_path / name
+    return base_path / Path(group_name) / name
+
+
+def target_name(table, i, custom_name=None):
+    if custom_name:
+        return format_new_name(custom_name, table.datetime(i), table.suffix(i))
+    return table.name(i)
+
+
+def resolve_destination_names(table, grouping, base_path, namespace=None, custom_name=None, skip=()):
+    """Final names, by index, for files that can't keep their target name.
+
+    The target name is the file's own name, or <custom_name>_<date taken>
+    when renaming on the way. Indices in skip don't take a name. The
+    table should be in capture order so clashing names are numbered in the
+    order the shots were taken.
+    """
+    if namespace is None:
+        namespace = Namespace()
+    base = os.path.normpath(os.fspath(base_path))
+    directories = {}
+    renamed = {}
+    claim = namespace.claim
+    for i, group_name in enumerate(grouping):
+        if i in skip:
+            continue
+        directory = directories.get(group_name)
+        if directory is None:
+            directory = base if group_name == 'All_Files' else os.path.normpath(os.path.join(base, group_name))
+            directories[group_name] = directory
+        own_name = table.name(i)
+        name = target_name(table, i, custom_name) if custom_name else own_name
+        final_name = claim(directory, name, own_name if table.directory(i) == directory else None)
+        if final_name != name:
+            renamed[i] = final_name
+    return renamed
+
+
+def plan_from_grouping(table, grouping, base_path, renamed=None, custom_name=None,
+                       duplicates=None, duplicate_action='keep'):
+    """Plan items for every file, in table order; each item's file_info is
+    the file's FileRow.
+
+    duplicates maps an index to the file it duplicates (see
+    find_duplicates). With duplicate_action 'skip' those files are left out;
+    with 'link' their destination becomes a hard link to the original.
+    """
+    duplicates = duplicates or {}
+    skip = duplicates if duplicate_action == 'skip' else ()
+    linking = duplicate_action == 'link' and duplicates
+    if renamed is None:
+        renamed = resolve_destination_names(table, grouping, base_path, custom_name=custom_name, skip=skip)
+
+    planned = {}
+    for i, group_name in enumerate(grouping):
+        if i in skip:
+            continue
+        name = renamed.get(i) or target_name(table, i, custom_name)
+        destination = get_destination_path(base_path, group_name, name)
+        plan_item = {
+            'file_info': table[i],
+            'destination': destination
+        }
+        original = duplicates.get(i)
+        if original is not None:
+            plan_item['duplicate_of'] = original
+            if linking:
+                # Originals come earlier in the plan, or are already in place
+                plan_item['link_to'] = planned.get(original, original)
+        if linking:
+            planned[table.path(i)] = destination
+        yield plan_item
+
+
+def plan_organization(table, base_path, options, gap_index=None, custom_name=None,
+                      duplicates=None, duplicate_action='keep'):
+    if gap_index is None:
+        gap_index = GapIndex.from_files(table)
+    return plan_from_grouping(table, gap_index.group(options), base_path, custom_name=custom_name,
+                              duplicates=duplicates, duplicate_action=duplicate_action)
+
+
+def move_file(source_path, dest_path):
+    if dest_path == source_path:
+        return dest_path
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    # shutil.move replaces an existing file on POSIX
+    if dest_path.exists():
+        dest_path = unique_path(dest_path)
+    shutil.move(str(source_path), str(dest_path))
+    return dest_path
+
+
+def apply_organization(plan, journal=None, scheduler=None):
+    """Move each planned file, yielding (item, new_path, error_message) in completion order."""
+    if scheduler is None:
+        scheduler = MoveScheduler()
+    ops = ((plan_item, plan_item['file_info']['path'], plan_item['destination'], plan_item.get('link_to'))
+           for plan_item in plan)
+    for plan_item, new_path, error in scheduler.run(ops, journal):
+        yield plan_item, new_path, f"{plan_item['file_info']['path'].name}: {str(error)}" if error else None
+
+
+def apply_import(plan, journal=None, scheduler=None, delete_source=False, verify=True):
+    """Copy each planned file to its destination, yielding (item, new_path, error_message).
+
+    Sources are only deleted, with delete_source, once their copy has been
+    verified.
+    """
+    if scheduler is None:
+        scheduler = MoveScheduler()
+    ops = ((plan_item, plan_item['file_info']['path'], plan_item['destination'], plan_item.get('link_to'))
+           for plan_item in plan)
+    for plan_item, new_path, error in scheduler.run(ops, journal, copy=True, delete_source=delete_source,
+                                                    verify=verify):
+        yield plan_item, new_path, f"{plan_item['file_info']['path'].name}: {str(error)}" if error else None
+
+
+# Saved plans
+
+def rename_plan_items(table, new_names):
+    """(src, dst, datetime, dt_source, link_to, duplicate_of) for PlanFile.write."""
+    for i, src, dst in rename_ops(table, new_names):
+        yield src, dst, table.datetime(i), table.dt_source(i), None, None
+
+
+def organization_plan_items(plan):
+    """(src, dst, datetime, dt_source, link_to, duplicate_of) for PlanFile.write."""
+    for plan_item in plan:
+        file_info = plan_item['file_info']
+        yield (file_info['path'], plan_item['destination'], file_info['datetime'], file_info['dt_source'],
+               plan_item.get('link_to'), plan_item.get('duplicate_of'))
+
+
+def apply_plan(kind, entries, journal=None, scheduler=None, relocated=False, delete_source=False, verify=True):
+    """Carry out saved plan entries, yielding (entry, new_path, error_message).
+
+    Each source is checked against what was planned first; entries whose
+    file has changed or gone since are left alone and come back with
+    entry.stale set.
+    """
+    stale = deque()
+
+    def fresh(entries):
+        for entry in entries:
+            entry.stale = entry.stale_reason(relocated)
+            if entry.stale is None:
+                yield entry
+            else:
+                stale.append(entry)
+
+    if kind == 'rename':
+        results = run_operations(((entry, entry.src, entry.dst) for entry in fresh(entries)), rename_to, journal)
+    else:
+        if scheduler is None:
+            scheduler = MoveScheduler()
+        ops = ((entry, entry.src, entry.dst, entry.link_to) for entry in fresh(entries))
+        copy = kind == 'import'
+        results = scheduler.run(ops, journal, copy=copy, delete_source=copy and delete_source, verify=verify)
+
+    def stale_results():
+        while stale:
+            entry = stale.popleft()
+            yield entry, None, f"{entry.src.name}: {entry.stale} since the plan was made"
+
+    for entry, new_path, error in results:
+        yield from stale_results()
+        yield entry, new_path, describe_error(entry.src, error) if error else None
+    yield from stale_results()
+
+
+# Journals
+
+OPERATIONS = {'rename': rename_to, 'organize': move_file}
+
+
+def journal_operation(journal):
+    if journal.kind != 'import':
+        return OPERATIONS[journal.kind]
+    delete_source = journal.options.get('delete_source', False)
+    verify = journal.options.get('verify', True)
+
+    def copy_to(source_path, dest_path):
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        return import_file(source_path, dest_path, delete_source, verify)
+    return copy_to
+
+
+def journal_link(journal):
+    # Duplicates hard-linked to an identical file, as MoveScheduler makes them
+    removes_source = journal.kind != 'import' or journal.options.get('delete_source', False)
+
+    def link_to(target, source_path, dest_path):
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            new_path = link_into_place(target, dest_path)
+        except OSError:
+            return None
+        if removes_source:
+            os.unlink(source_path)
+        return new_path
+    return link_to
+
+
+def resume_journal(journal):
+    """Finish an interrupted journaled run, yielding (op, new_path, error_message)."""
+    for op, new_path, error in journal.resume(journal_operation(journal), journal_link(journal)):
+        yield op, new_path, describe_error(op.src, error) if error else None
+
+
+def undo_journal(journal):
+    """Undo a journaled run, yielding (op, error_message)."""
+    for op, error in journal.undo():
+        yield op, describe_error(op.done, error) if error else None
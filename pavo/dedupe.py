@@ -0,0 +1,125 @@
+import mmap
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pavo.transfer import COPY_CHUNK, new_hasher
+
+# Bytes hashed from each end of a file before deciding whether the whole
+# file needs reading. Files up to twice this size are hashed in full anyway.
+PARTIAL_SIZE = 1024 * 1024
+
+HASH_WORKERS = 4
+
+# What to do with a file whose content is already in the plan or the target
+DUPLICATE_ACTIONS = ('keep', 'skip', 'link')
+
+
+def partial_digest(path, size):
+    with open(path, 'rb') as f:
+        if size <= 2 * PARTIAL_SIZE:
+            hasher = new_hasher()
+            hasher.update(f.read())
+            return hasher.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            view = memoryview(mapping)
+            try:
+                hasher = new_hasher()
+                hasher.update(view[:PARTIAL_SIZE])
+                hasher.update(view[size - PARTIAL_SIZE:size])
+                return hasher.hexdigest()
+            finally:
+                view.release()
+
+
+def full_digest(path):
+    hasher = new_hasher()
+    buffer = bytearray(COPY_CHUNK)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                return hasher.hexdigest()
+            hasher.update(view[:n])
+
+
+class DuplicateFinder:
+    """Finds files with identical content, reading as little as possible.
+
+    Files are grouped by size; only sizes that repeat get their first and
+    last PARTIAL_SIZE bytes hashed, and only files still tied after that
+    are hashed in full. Hashing runs on a small thread pool.
+    """
+
+    def __init__(self, max_workers=HASH_WORKERS):
+        self.max_workers = max_workers
+        self.partial_hashed = 0
+        self.full_hashed = 0
+        self.bytes_hashed = 0
+
+    def _digests(self, pool, func, entries):
+        def digest(entry):
+            try:
+                return func(entry)
+            except OSError:
+                return None
+        return list(pool.map(digest, entries))
+
+    def find(self, candidates, existing=()):
+        """Map candidate index -> path of the file it duplicates.
+
+        candidates and existing are lists of (path, size). Files in existing
+        (e.g. already in the library) are always the ones kept; among the
+        candidates, the first of each set of identical files is kept.
+        """
+        entries = [(path, size, None) for path, size in existing]
+        entries += [(path, size, i) for i, (path, size) in enumerate(candidates)]
+
+        # Empty files are usually failed writes, not copies of each other
+        by_size = defaultdict(list)
+        for entry in entries:
+            if entry[1]:
+                by_size[entry[1]].append(entry)
+        tied = [entry for group in by_size.values() if len(group) > 1 for entry in group]
+
+        duplicates = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            partials = self._digests(pool, lambda entry: partial_digest(entry[0], entry[1]), tied)
+            self.partial_hashed += len(tied)
+            self.bytes_hashed += sum(min(size, 2 * PARTIAL_SIZE) for _, size, _ in tied)
+
+            by_partial = defaultdict(list)
+            for entry, digest in zip(tied, partials):
+                if digest is not None:
+                    by_partial[(entry[1], digest)].append(entry)
+
+            final_groups = []
+            ambiguous = []
+            for (size, _), group in by_partial.items():
+                if len(group) < 2:
+                    continue
+                if size <= 2 * PARTIAL_SIZE:
+                    final_groups.append(group)
+                else:
+                    ambiguous.extend(group)
+
+            # Only files that agree on size and both ends are read in full
+            fulls = self._digests(pool, lambda entry: full_digest(entry[0]), ambiguous)
+            self.full_hashed += len(ambiguous)
+            self.bytes_hashed += sum(size for _, size, _ in ambiguous)
+            by_full = defaultdict(list)
+            for entry, digest in zip(ambiguous, fulls):
+                if digest is not None:
+                    by_full[(entry[1], digest)].append(entry)
+            final_groups.extend(group for group in by_full.values() if len(group) > 1)
+
+        for group in final_groups:
+            keeper = group[0][0]
+            for path, _, index in group[1:]:
+                if index is not None:
+                    duplicates[index] = keeper
+        return duplicates
+
+    def summary(self):
+        return (f"{self.partial_hashed} files sampled, {self.full_hashed} hashed in full, "
+                f"{self.bytes_hashed / 1e6:.1f} MB read")
@@ -0,0 +1,546 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from pavo.layout import READ_ORDERS, is_rotational, maps_extents, sort_by_layout
+from pavo.metadata import IMAGE_EXTENSIONS, chain_timeout, find_policy, free_chain, get_file_datetime, run_chain
+from pavo.quarantine import ERROR, QUARANTINED, TIMEOUT
+from pavo.scanner import ScanEntry
+from pavo.stats import traced
+
+# Images are parsed in worker processes in batches so the per-task pickling
+# overhead is paid once per batch rather than once per file.
+IMAGE_BATCH_SIZE = 64
+
+# Below this many images a process pool costs more to start than it saves.
+MIN_IMAGES_FOR_PROCESSES = 200
+
+# How often files being read are checked against their time budgets
+DEADLINE_CHECK_SECONDS = 0.5
+
+
+# Workers get (path, chain) with the part of the file's extractor chain
+# still to run, and return ((datetime, dt_source, trusted), extractor
+# timings, bytes read, failures); see pavo.stats.traced. Tracing is cheap
+# enough to leave on.
+
+def _extract_image_batch(items):
+    return [traced(run_chain, path, chain) for path, chain in items]
+
+
+def _extract_file(path, chain):
+    return traced(run_chain, path, chain)
+
+
+class ExtractionEngine:
+    def __init__(self, max_threads=None, max_processes=None, progress_interval=0.1, cache=None, index=None,
+                 stats=None, read_order='name', quarantine=None):
+        if read_order not in READ_ORDERS:
+            raise ValueError(f"read_order must be one of {', '.join(READ_ORDERS)}")
+        cpus = os.cpu_count() or 1
+        self.max_threads = max_threads or min(32, cpus * 4)
+        self.max_processes = max_processes or max(1, cpus - 1)
+        self.progress_interval = progress_interval
+        self.cache = cache
+        self.index = index
+        # A pavo.stats.RunStats to record into, when set
+        self.stats = stats
+        # See pavo.layout.READ_ORDERS
+        self.read_order = read_order
+        # A pavo.quarantine.Quarantine of files not to read again, when set
+        self.quarantine = quarantine
+        # Path -> failure kind of every file whose date couldn't be read (or
+        # that was quarantined), until cleared
+        self.failures = {}
+        self.results = queue.Queue()
+
+        self._thread_pool = None
+        self._process_pool = None
+        # st_dev -> the one thread reading a rotational device
+        self._device_readers = {}
+        self._worker = None
+        self._job_id = 0
+        self._cancel = threading.Event()
+        self._unpaused = threading.Event()
+        # Set once a job has posted its results and its thread is only exiting
+        self._finishing = threading.Event()
+        self._unpaused.set()
+
+    # Pool management
+
+    def _get_thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_threads,
+                                                   thread_name_prefix='pavo-extract')
+        return self._thread_pool
+
+    def _get_process_pool(self):
+        if self._process_pool is None and self.max_processes > 1:
+            try:
+                # Spawn rather than fork: the GUI process has Tk and worker threads
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_processes,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, NotImplementedError):
+                self.max_processes = 1
+        return self._process_pool
+
+    def _device_reader(self, device):
+        # Several readers on one spinning disk only make its head seek back
+        # and forth between them
+        reader = self._device_readers.get(device)
+        if reader is None:
+            reader = self._device_readers[device] = ThreadPoolExecutor(max_workers=1,
+                                                                       thread_name_prefix='pavo-read')
+        return reader
+
+    def shutdown(self):
+        self.cancel()
+        if self._worker is not None:
+            self._worker.join()
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        for reader in self._device_readers.values():
+            reader.shutdown(wait=False, cancel_futures=True)
+        self._device_readers = {}
+        if self.cache is not None:
+            self.cache.close()
+        if self.quarantine is not None:
+            self.quarantine.close()
+
+    # Job control
+
+    @property
+    def busy(self):
+        return self._worker is not None and self._worker.is_alive()
+
+    @property
+    def paused(self):
+        return not self._unpaused.is_set()
+
+    def pause(self):
+        self._unpaused.clear()
+
+    def resume(self):
+        self._unpaused.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._unpaused.set()
+
+    def _wait_if_paused(self):
+        while not self._unpaused.wait(0.1):
+            if self._cancel.is_set():
+                break
+        return not self._cancel.is_set()
+
+    # Extraction
+
+    def run(self, files, policy=None):
+        """Yield (index, path, datetime, dt_source) as results complete.
+
+        files may be any iterable, including a generator; it is consumed
+        lazily so only a bounded window of files is ever held in memory.
+        policy, when given, is used for every file instead of the folders'
+        own (see pavo.metadata.find_policy).
+
+        With read_order 'physical', files that have to be read are held
+        back until files is exhausted, then read in the order they sit on
+        their device by one thread per device; see _layout_order. 'auto'
+        does that only for rotational devices whose filesystem maps extents.
+
+        Each file may take as long as the timeouts of its extractors add up
+        to (see pavo.metadata.chain_timeout), and a batch of images as long
+        as its files together. A file that runs over is given its fallback
+        date and counted as failed; the worker reading it can't be stopped,
+        so it is left to finish and its result dropped. Files
+        that fail are not cached but recorded in self.failures and the
+        quarantine, and quarantined files are not read at all.
+        """
+        self._cancel.clear()
+        cache = self.cache
+        file_index = self.index
+        quarantine = self.quarantine
+        stats = self.stats
+        source = enumerate(files)
+        exhausted = False
+        # Time spent pulling files from a lazy scan, reported as its own stage
+        time_scan = stats is not None and not isinstance(files, (list, tuple))
+        scan_seconds = scan_cpu = 0.0
+
+        thread_pool = self._get_thread_pool()
+        process_pool = None
+        images_seen = 0
+        image_batch = []
+
+        # Work items are future -> [index, ...]; at most max_pending are in
+        # flight, and inflight holds (path, stat, chain, fallback, timings)
+        # only for those files.
+        max_pending = self.max_threads * 2 + self.max_processes * 2
+        pending = {}
+        inflight = {}
+        # future -> (seconds it may run, device reader or None, whether it
+        # went to the process pool), and when each was first seen running
+        budgets = {}
+        started = {}
+        next_deadline_check = time.monotonic() + DEADLINE_CHECK_SECONDS
+        # Folder policies, (folder, suffix) -> the chain split into its free
+        # head and the rest, and chain -> its time budget
+        policies = {}
+        chains = {}
+        timeouts = {}
+
+        def submit(executor, indices, device=None):
+            if len(indices) > 1:
+                future = executor.submit(_extract_image_batch, [(inflight[i][0], inflight[i][2]) for i in indices])
+            else:
+                future = executor.submit(_extract_file, inflight[indices[0]][0], inflight[indices[0]][2])
+            pending[future] = indices
+            # A batch may take as long as its files together may
+            seconds = 0
+            for i in indices:
+                chain = inflight[i][2]
+                if chain not in timeouts:
+                    timeouts[chain] = chain_timeout(chain)
+                seconds += timeouts[chain]
+            budgets[future] = (seconds, device, executor is process_pool)
+
+        def submit_images(indices):
+            if process_pool is not None:
+                submit(process_pool, indices)
+            else:
+                for i in indices:
+                    submit(thread_pool, [i])
+
+        def finish(index, result):
+            (dt, dt_source, _), timings, bytes_read, failures = result
+            file_path, stat, _, fallback, free_timings = inflight.pop(index)
+            timings = free_timings + timings
+            # A source that failed but was followed by one that answered is
+            # no loss
+            failed = dt is None and failures
+            if failed:
+                self._failed(file_path, stat, failures)
+            if dt is None and fallback is not None:
+                dt, dt_source = fallback
+            if dt is None:
+                (dt, dt_source), fallback, _, _ = traced(get_file_datetime, file_path, stat)
+                timings += fallback
+            if stats is not None:
+                stats.record_extraction(file_path, dt_source, timings, bytes_read)
+            if stat is not None and not failed:
+                if cache is not None:
+                    cache.store(file_path, stat, dt, dt_source)
+                if file_index is not None:
+                    file_index.store(file_path, stat, dt, dt_source)
+            return index, file_path, dt, dt_source
+
+        def triage():
+            # Yields ('done', index, path, dt, dt_source) for files answered
+            # here, and ('read', index, path, stat, chain, fallback, timings,
+            # device) for the ones left for the pools
+            nonlocal scan_seconds, scan_cpu
+            while True:
+                try:
+                    if time_scan:
+                        wall = time.perf_counter()
+                        cpu = time.process_time()
+                        try:
+                            index, file_path = next(source)
+                        finally:
+                            scan_seconds += time.perf_counter() - wall
+                            scan_cpu += time.process_time() - cpu
+                    else:
+                        index, file_path = next(source)
+                except StopIteration:
+                    return
+
+                # Scanner entries carry the stat scandir already did
+                stat = None
+                if isinstance(file_path, ScanEntry):
+                    stat = file_path.stat
+                file_path = Path(file_path)
+
+                # Sources that cost nothing (file names) run here, ahead of
+                # the cache; only the rest of the chain reaches the pools
+                key = (os.path.dirname(file_path), file_path.suffix.lower())
+                split = chains.get(key)
+                if split is None:
+                    folder_policy = policy if policy is not None else find_policy(key[0], policies)
+                    split = chains[key] = free_chain(folder_policy.chain(key[1]))
+                free, chain = split
+                fallback = None
+                free_timings = ()
+                if free:
+                    (dt, dt_source, trusted), timings, bytes_read, _ = traced(run_chain, file_path, free)
+                    if trusted:
+                        if stats is not None:
+                            stats.record_extraction(file_path, dt_source, timings, bytes_read)
+                        yield 'done', index, file_path, dt, dt_source
+                        continue
+                    if dt is not None:
+                        fallback = (dt, dt_source)
+                    free_timings = timings
+
+                if cache is not None or file_index is not None or quarantine is not None:
+                    # Session index and cache hits are answered straight
+                    # away; only misses reach the pools
+                    if stat is None:
+                        try:
+                            stat = file_path.stat()
+                        except OSError:
+                            stat = None
+                    if stat is not None:
+                        cached = file_index.lookup(file_path, stat) if file_index is not None else None
+                        found_in = 'index'
+                        if cached is None and cache is not None:
+                            cached = cache.lookup(file_path, stat)
+                            found_in = 'cache'
+                            if cached is not None and file_index is not None:
+                                file_index.store(file_path, stat, cached[0], cached[1])
+                        if cached is not None:
+                            if stats is not None:
+                                stats.record_lookup(found_in, cached[1])
+                            yield 'done', index, file_path, cached[0], cached[1]
+                            continue
+                        if quarantine is not None and quarantine.contains(file_path, stat):
+                            # Its reads have failed before; the fallback date
+                            # is what they'd end with anyway
+                            dt, dt_source = fallback or get_file_datetime(file_path, stat)
+                            self.failures[os.fspath(file_path)] = QUARANTINED
+                            if stats is not None:
+                                stats.record_lookup('quarantine', dt_source)
+                                stats.record_failure(QUARANTINED)
+                            yield 'done', index, file_path, dt, dt_source
+                            continue
+
+                yield 'read', index, file_path, stat, chain, fallback, free_timings, None
+
+        work = triage() if self.read_order == 'name' else self._layout_order(triage())
+
+        try:
+            while True:
+                if not self._wait_if_paused():
+                    return
+
+                # Pull more files until the in-flight window is full
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        item = next(work)
+                    except StopIteration:
+                        exhausted = True
+                        if image_batch:
+                            submit_images(image_batch)
+                            image_batch = []
+                        break
+                    if item[0] == 'done':
+                        yield item[1:]
+                        continue
+
+                    _, index, file_path, stat, chain, fallback, free_timings, device = item
+                    inflight[index] = (file_path, stat, chain, fallback, free_timings)
+                    if device is not None:
+                        submit(self._device_reader(device), [index], device)
+                    elif file_path.suffix.lower() in IMAGE_EXTENSIONS:
+                        images_seen += 1
+                        if process_pool is None and images_seen == MIN_IMAGES_FOR_PROCESSES:
+                            process_pool = self._get_process_pool()
+                        if process_pool is None:
+                            submit_images([index])
+                        else:
+                            image_batch.append(index)
+                            if len(image_batch) >= IMAGE_BATCH_SIZE:
+                                submit_images(image_batch)
+                                image_batch = []
+                    else:
+                        submit(thread_pool, [index])
+
+                if not pending:
+                    if exhausted:
+                        break
+                    if image_batch:
+                        submit_images(image_batch)
+                        image_batch = []
+                    continue
+
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    indices = pending.pop(future)
+                    del budgets[future]
+                    started.pop(future, None)
+                    try:
+                        values = future.result()
+                    except BrokenProcessPool:
+                        # Fall back to threads for the rest of this job; the
+                        # broken pool's manager thread and any workers left
+                        # are let go
+                        if self._process_pool is not None:
+                            self._process_pool.shutdown(wait=False, cancel_futures=True)
+                        self._process_pool = None
+                        process_pool = None
+                        submit_images(indices)
+                        continue
+                    except Exception:
+                        values = [((None, None, False), (), 0, (('', ERROR),))] * len(indices)
+
+                    if len(indices) == 1 and not isinstance(values, list):
+                        values = [values]
+
+                    for index, result in zip(indices, values):
+                        yield finish(index, result)
+
+                now = time.monotonic()
+                if now < next_deadline_check:
+                    continue
+                next_deadline_check = now + DEADLINE_CHECK_SECONDS
+                # A process pool reports a call running once it is queued for
+                # a worker, so no more of its calls than it has workers are
+                # taken to have started
+                pooled = sum(1 for future in started if budgets[future][2])
+                for future in list(pending):
+                    if future not in started:
+                        if future.running() and (not budgets[future][2] or pooled < self.max_processes):
+                            started[future] = now
+                            pooled += budgets[future][2]
+                        continue
+                    seconds, device, _ = budgets[future]
+                    if now - started[future] <= seconds:
+                        continue
+                    indices = pending.pop(future)
+                    del budgets[future], started[future]
+                    if len(indices) > 1:
+                        # Which of the batch is stuck isn't known; each is
+                        # read again on its own, with its own deadline
+                        for i in indices:
+                            submit(thread_pool, [i])
+                        continue
+                    if device is not None:
+                        # The device's one reader is stuck on this file; what
+                        # was queued behind it moves to a new reader
+                        self._device_readers.pop(device).shutdown(wait=False)
+                        for queued in list(pending):
+                            if budgets[queued][1] == device and queued.cancel():
+                                requeued = pending.pop(queued)
+                                del budgets[queued]
+                                submit(self._device_reader(device), requeued, device)
+                    names = '+'.join(name for name, _ in inflight[indices[0]][2])
+                    yield finish(indices[0], ((None, None, False), (), 0, ((names, TIMEOUT),)))
+        finally:
+            for future in pending:
+                future.cancel()
+            if cache is not None:
+                cache.flush()
+            if time_scan:
+                stats.add_stage('scan', scan_seconds, scan_cpu)
+
+    def _failed(self, file_path, stat, failures):
+        # A timeout is what a file is remembered for if it had one
+        kind, extractor = ERROR, failures[0][0]
+        for name, failure in failures:
+            if failure == TIMEOUT:
+                kind, extractor = TIMEOUT, name
+                break
+        self.failures[os.fspath(file_path)] = kind
+        if self.stats is not None:
+            self.stats.record_failure(kind, extractor)
+        if self.quarantine is not None and stat is not None:
+            self.quarantine.record(file_path, stat, kind, extractor)
+
+    def _layout_order(self, work):
+        # Reads to reorder are held per device while everything else passes
+        # straight through; devices are then interleaved, a file at a time,
+        # so each one's reader has work
+        held = {}
+        for item in work:
+            if self._cancel.is_set():
+                return
+            if item[0] == 'read':
+                file_path, stat = item[2], item[3]
+                if stat is None:
+                    try:
+                        stat = file_path.stat()
+                    except OSError:
+                        yield item
+                        continue
+                    item = item[:3] + (stat,) + item[4:]
+                if self.read_order == 'physical' or is_rotational(stat.st_dev):
+                    held.setdefault(stat.st_dev, []).append((file_path, stat, item[:-1] + (stat.st_dev,)))
+                    continue
+            yield item
+        devices = deque()
+        for files in held.values():
+            if self.read_order == 'auto' and not maps_extents([path for path, _, _ in files]):
+                # Where files are can't be told, so there's no order to read
+                # them in; they go to the pools as usual
+                for _, _, item in files:
+                    yield item[:-1] + (None,)
+                continue
+            devices.append(deque(item for _, _, item in sort_by_layout(files)))
+        while devices:
+            reads = devices.popleft()
+            yield reads.popleft()
+            if reads:
+                devices.append(reads)
+
+    def _run_stage(self, files, policy=None):
+        # Background jobs time (and profile) their own thread as one stage
+        stats = self.stats
+        if stats is None:
+            yield from self.run(files, policy)
+            return
+        with stats.stage('extract'):
+            yield from self.run(files, policy)
+
+    def start(self, files, policy=None):
+        """Run extraction on a background thread, posting messages to self.results.
+
+        Messages are tuples tagged with the job id returned here:
+            (job_id, 'batch', [(index, path, dt, dt_source), ...], done, total)
+            (job_id, 'done', done, total, cancelled)
+        """
+        if self.busy:
+            # A job started from the previous one's 'done' message waits for
+            # that thread to exit
+            if not self._finishing.is_set():
+                raise RuntimeError("Extraction already running")
+            self._worker.join()
+        self._finishing.clear()
+
+        files = list(files)
+        self._job_id += 1
+        job_id = self._job_id
+        self._cancel.clear()
+        self._unpaused.set()
+
+        def worker():
+            total = len(files)
+            done = 0
+            batch = []
+            last_post = time.monotonic()
+            try:
+                for item in self._run_stage(files, policy):
+                    batch.append(item)
+                    done += 1
+                    now = time.monotonic()
+                    if now - last_post >= self.progress_interval:
+                        self.results.put((job_id, 'batch', batch, done, total))
+                        batch = []
+                        last_post = now
+            finally:
+                if batch:
+                    self.results.put((job_id, 'batch', batch, done, total))
+                self._finishing.set()
+                self.results.put((job_id, 'done', done, total, self._cancel.is_set()))
+
+        self._worker = threading.Thread(target=worker, name='pavo-engine', daemon=True)
+        self._worker.start()
+        return job_id
@@ -0,0 +1,182 @@
+import struct
+from collections import namedtuple
+from datetime import datetime
+
+from pavo.stats import add_bytes_read
+
+# Enough for the APP1 segment of almost every camera JPEG; larger or later
+# segments are fetched with one extra targeted read.
+HEADER_READ_SIZE = 64 * 1024
+
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_OFFSET_TIME = 0x9010
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_OFFSET_TIME_DIGITIZED = 0x9012
+TAG_SUBSEC_TIME = 0x9290
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+TAG_SUBSEC_TIME_DIGITIZED = 0x9292
+
+IFD0_TAGS = {TAG_DATETIME, TAG_EXIF_IFD, TAG_OFFSET_TIME, TAG_SUBSEC_TIME}
+EXIF_IFD_TAGS = {TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED, TAG_OFFSET_TIME, TAG_OFFSET_TIME_ORIGINAL,
+                 TAG_OFFSET_TIME_DIGITIZED, TAG_SUBSEC_TIME, TAG_SUBSEC_TIME_ORIGINAL, TAG_SUBSEC_TIME_DIGITIZED}
+
+# (date tag, sub-second tag, offset tag) in order of preference
+DATE_PRIORITY = [
+    (TAG_DATETIME_ORIGINAL, TAG_SUBSEC_TIME_ORIGINAL, TAG_OFFSET_TIME_ORIGINAL),
+    (TAG_DATETIME_DIGITIZED, TAG_SUBSEC_TIME_DIGITIZED, TAG_OFFSET_TIME_DIGITIZED),
+    (TAG_DATETIME, TAG_SUBSEC_TIME, TAG_OFFSET_TIME),
+]
+
+TYPE_ASCII = 2
+TYPE_LONG = 4
+
+ExifDate = namedtuple('ExifDate', ['datetime', 'subsec', 'offset', 'tag'])
+
+
+class ExifFormatError(ValueError):
+    pass
+
+
+class _Reader:
+    # Serves byte ranges from the initial read and falls back to seeking
+    # for anything outside it (TIFFs may keep IFDs after the image data).
+    def __init__(self, f, buf):
+        self.f = f
+        self.buf = buf
+
+    def get(self, offset, length):
+        if offset + length <= len(self.buf):
+            return self.buf[offset:offset + length]
+        if self.f is None:
+            raise ExifFormatError("EXIF offset outside its segment")
+        self.f.seek(offset)
+        data = self.f.read(length)
+        add_bytes_read(len(data))
+        if len(data) < length:
+            raise ExifFormatError("EXIF data runs past end of file")
+        return data
+
+
+def _read_ifd(reader, order, offset, wanted):
+    values = {}
+    count = struct.unpack(order + 'H', reader.get(offset, 2))[0]
+    entries = reader.get(offset + 2, count * 12)
+    for i in range(count):
+        tag, value_type, value_count, raw = struct.unpack_from(order + 'HHI4s', entries, i * 12)
+        if tag not in wanted:
+            continue
+        if value_type == TYPE_ASCII:
+            if value_count <= 4:
+                data = raw[:value_count]
+            else:
+                data = reader.get(struct.unpack(order + 'I', raw)[0], value_count)
+            values[tag] = data.split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+        elif value_type == TYPE_LONG:
+            values[tag] = struct.unpack(order + 'I', raw)[0]
+    return values
+
+
+def _read_tiff(reader):
+    header = reader.get(0, 8)
+    if header[:2] == b'II':
+        order = '<'
+    elif header[:2] == b'MM':
+        order = '>'
+    else:
+        raise ExifFormatError("Bad TIFF byte order")
+    if struct.unpack(order + 'H', header[2:4])[0] != 42:
+        raise ExifFormatError("Bad TIFF magic")
+
+    tags = _read_ifd(reader, order, struct.unpack(order + 'I', header[4:8])[0], IFD0_TAGS)
+    exif_offset = tags.pop(TAG_EXIF_IFD, None)
+    if exif_offset:
+        tags.update(_read_ifd(reader, order, exif_offset, EXIF_IFD_TAGS))
+    return tags
+
+
+def _find_jpeg_exif(f, buf):
+    window_start = 0
+    offset = 2
+    while True:
+        if offset + 4 > window_start + len(buf):
+            f.seek(offset)
+            buf = f.read(HEADER_READ_SIZE)
+            add_bytes_read(len(buf))
+            window_start = offset
+            if len(buf) < 4:
+                return None
+        pos = offset - window_start
+        if buf[pos] != 0xFF:
+            raise ExifFormatError("Bad JPEG marker")
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # Start of scan / end of image: no EXIF in the header
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        if marker == 0xE1:
+            if offset + 2 + length > window_start + len(buf):
+                f.seek(offset)
+                buf = f.read(2 + length)
+                add_bytes_read(len(buf))
+                window_start = offset
+                pos = 0
+            segment = buf[pos:pos + 2 + length]
+            if segment[4:10] == b'Exif\x00\x00':
+                return _Reader(None, segment[10:])
+        offset += 2 + length
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def read_exif_tags(file_path):
+    """Return the date-related EXIF tags of a JPEG or TIFF from its header.
+
+    Returns None when the file has no EXIF block and raises ExifFormatError
+    when it isn't a JPEG/TIFF we can walk.
+    """
+    with open(file_path, 'rb') as f:
+        buf = f.read(HEADER_READ_SIZE)
+        add_bytes_read(len(buf))
+        try:
+            if buf[:2] == b'\xff\xd8':
+                reader = _find_jpeg_exif(f, buf)
+                if reader is None:
+                    return None
+            elif buf[:4] in (b'II*\x00', b'MM\x00*'):
+                reader = _Reader(f, buf)
+            else:
+                raise ExifFormatError("Not a JPEG or TIFF file")
+            return _read_tiff(reader)
+        except (struct.error, IndexError) as e:
+            raise ExifFormatError(str(e))
+
+
+def read_exif_date(file_path):
+    tags = read_exif_tags(file_path)
+    if not tags:
+        return None
+    for date_tag, subsec_tag, offset_tag in DATE_PRIORITY:
+        dt = _parse_date(tags.get(date_tag))
+        if dt is None:
+            continue
+        subsec = tags.get(subsec_tag) or tags.get(TAG_SUBSEC_TIME) or ''
+        digits = ''.join(c for c in subsec if c.isdigit())[:6]
+        if digits:
+            dt = dt.replace(microsecond=int(digits.ljust(6, '0')))
+        offset = tags.get(offset_tag) or tags.get(TAG_OFFSET_TIME) or None
+        return ExifDate(dt, digits or None, offset, date_tag)
+    return None
@@ -0,0 +1,61 @@
+import os
+import threading
+
+
+class FileRecord:
+    __slots__ = ('path', 'size', 'mtime_ns', 'datetime', 'dt_source')
+
+    def __init__(self, path, size, mtime_ns, dt, dt_source):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.datetime = dt
+        self.dt_source = dt_source
+
+
+class FileIndex:
+    """Extracted datetimes for this session, keyed by file identity.
+
+    Records are keyed by (st_dev, st_ino), so a file renamed or moved within
+    a volume is still found under its new name. Where the platform doesn't
+    report inode numbers (scandir on Windows) the absolute path is used and
+    rename() keeps it up to date.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _key(file_path, stat):
+        if stat.st_ino:
+            return (stat.st_dev, stat.st_ino)
+        return os.path.abspath(file_path)
+
+    def lookup(self, file_path, stat):
+        with self._lock:
+            record = self._records.get(self._key(file_path, stat))
+            if record is None or record.size != stat.st_size or record.mtime_ns != stat.st_mtime_ns:
+                return None
+            record.path = os.fspath(file_path)
+            return record.datetime, record.dt_source
+
+    def store(self, file_path, stat, dt, dt_source):
+        with self._lock:
+            self._records[self._key(file_path, stat)] = FileRecord(
+                os.fspath(file_path), stat.st_size, stat.st_mtime_ns, dt, dt_source)
+
+    def rename(self, old_path, new_path):
+        key = os.path.abspath(old_path)
+        with self._lock:
+            record = self._records.pop(key, None)
+            if record is not None:
+                record.path = os.fspath(new_path)
+                self._records[os.path.abspath(new_path)] = record
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
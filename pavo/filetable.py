@@ -0,0 +1,234 @@
+import os
+import re
+import sys
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from pavo.metadata import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from pavo.sessions import TYPE_IMAGE, TYPE_OTHER, TYPE_VIDEO
+
+# Capture times are kept as wall-clock microseconds since this, as NumPy's
+# naive datetime64 does
+EPOCH = datetime(1970, 1, 1)
+
+# Date sources by code; 0 is a file not read yet. Labels from extractors
+# registered elsewhere get the next free code.
+SOURCES = [None, 'EXIF', 'Metadata', 'Filename', 'Sidecar', 'File System', 'Current Time']
+_source_codes = {label: code for code, label in enumerate(SOURCES)}
+
+# Frame/sequence number at the end of camera file names (GOPR0042, IMG_1234, DSC_0001 (2))
+BURST_SEQUENCE = re.compile(r'(\d+)\D*$')
+
+# Bigger frame numbers are only ever ties, and have to fit an int64
+MAX_SEQUENCE = 2 ** 62
+
+
+def source_code(label):
+    code = _source_codes.get(label)
+    if code is None:
+        if len(SOURCES) > 255:
+            raise ValueError(f"too many date sources for {label!r}")
+        code = _source_codes[label] = len(SOURCES)
+        SOURCES.append(label)
+    return code
+
+
+def type_code(name):
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in IMAGE_EXTENSIONS:
+        return TYPE_IMAGE
+    if suffix in VIDEO_EXTENSIONS:
+        return TYPE_VIDEO
+    return TYPE_OTHER
+
+
+def burst_sequence(name):
+    match = BURST_SEQUENCE.search(os.path.splitext(name)[0])
+    return min(int(match.group(1)), MAX_SEQUENCE) if match else -1
+
+
+def to_micros(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def _take(column, order):
+    # column reordered by order, as a new array of the same type
+    taken = array(column.typecode)
+    taken.frombytes(np.frombuffer(column, dtype=column.typecode)[order].tobytes())
+    return taken
+
+
+class FileRow:
+    """One file of a FileTable, readable like the dicts plans are made of.
+
+    Rows look up the table when read, so they follow the file only until
+    the table is reordered.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        return FileTable.FIELDS[key](self.table, self.index)
+
+    def __repr__(self):
+        return f"FileRow({self.table.path(self.index)!r})"
+
+
+class FileTable:
+    """The files of a scan with their capture times, stored by column.
+
+    Each folder is stored once and files refer to it by number; times are
+    int64 microseconds and sources and types one-byte codes, so a file
+    costs its name plus 14 bytes rather than a dict of Path and datetime
+    objects. Columns are array.arrays so files can be added as extraction
+    results arrive; sorting and grouping work on NumPy views of them.
+    """
+
+    def __init__(self):
+        self.directories = []
+        self._directory_ids = {}
+        self.names = []
+        self.dir_ids = array('I')
+        self.micros = array('q')
+        self.sources = array('B')
+        self.types = array('B')
+
+    @classmethod
+    def from_extracted(cls, extracted):
+        """A table of (path, datetime, dt_source) items."""
+        table = cls()
+        for file_path, dt, dt_source in extracted:
+            table.add(file_path, dt, dt_source)
+        return table
+
+    @classmethod
+    def from_paths(cls, paths):
+        """A table of files whose dates are filled in later with set_date."""
+        table = cls()
+        for file_path in paths:
+            table.add(file_path)
+        return table
+
+    def add(self, file_path, dt=None, dt_source=None):
+        """Append a file, returning its index."""
+        directory, name = os.path.split(os.fspath(file_path))
+        directory = directory or os.curdir
+        dir_id = self._directory_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+        self.names.append(name)
+        self.dir_ids.append(dir_id)
+        self.micros.append(to_micros(dt) if dt is not None else 0)
+        self.sources.append(source_code(dt_source))
+        self.types.append(type_code(name))
+        return len(self.names) - 1
+
+    def set_date(self, i, dt, dt_source):
+        self.micros[i] = to_micros(dt)
+        self.sources[i] = source_code(dt_source)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return FileRow(self, i)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self.names)))
+
+    # Single files
+
+    def name(self, i):
+        return self.names[i]
+
+    def directory(self, i):
+        return self.directories[self.dir_ids[i]]
+
+    def path(self, i):
+        return Path(self.directories[self.dir_ids[i]], self.names[i])
+
+    def suffix(self, i):
+        return os.path.splitext(self.names[i])[1]
+
+    def datetime(self, i):
+        if not self.sources[i]:
+            return None
+        return EPOCH + timedelta(microseconds=self.micros[i])
+
+    def dt_source(self, i):
+        return SOURCES[self.sources[i]]
+
+    def is_image(self, i):
+        return self.types[i] == TYPE_IMAGE
+
+    def is_video(self, i):
+        return self.types[i] == TYPE_VIDEO
+
+    FIELDS = {'path': path, 'datetime': datetime, 'dt_source': dt_source, 'is_image': is_image,
+              'is_video': is_video}
+
+    # Columns
+
+    def paths(self):
+        return [self.path(i) for i in range(len(self.names))]
+
+    def capture_times(self):
+        """A datetime64[us] copy of the capture times."""
+        return np.frombuffer(self.micros, dtype=np.int64).astype('datetime64[us]')
+
+    def type_codes(self):
+        return np.frombuffer(self.types, dtype=np.uint8).copy()
+
+    def indices_with_source(self, dt_source):
+        code = _source_codes.get(dt_source)
+        if code is None:
+            return []
+        return np.flatnonzero(np.frombuffer(self.sources, dtype=np.uint8) == code).tolist()
+
+    # Ordering
+
+    def capture_order(self):
+        """Indices in capture order.
+
+        Shots taken in the same second are ordered by their sub-second time
+        (already in the time when the camera records it), then by frame
+        number, then by name; names are only compared where those tie.
+        """
+        micros = np.frombuffer(self.micros, dtype=np.int64)
+        sequences = np.fromiter(map(burst_sequence, self.names), dtype=np.int64, count=len(self.names))
+        order = np.lexsort((sequences, micros))
+        ordered_micros = micros[order]
+        ordered_sequences = sequences[order]
+        ties = (ordered_micros[1:] == ordered_micros[:-1]) & (ordered_sequences[1:] == ordered_sequences[:-1])
+        if ties.any():
+            names = np.array(self.names, dtype=object)
+            _, name_ranks = np.unique(names, return_inverse=True)
+            order = np.lexsort((name_ranks, sequences, micros))
+        return order
+
+    def reorder(self, order):
+        names = self.names
+        self.names = [names[i] for i in order.tolist()]
+        self.dir_ids = _take(self.dir_ids, order)
+        self.micros = _take(self.micros, order)
+        self.sources = _take(self.sources, order)
+        self.types = _take(self.types, order)
+
+    def sort_by_capture(self):
+        self.reorder(self.capture_order())
+
+    def memory_usage(self):
+        """Bytes held by the table: its columns, names and folders."""
+        size = sys.getsizeof(self.names) + sum(map(sys.getsizeof, self.names))
+        size += sys.getsizeof(self.directories) + sum(map(sys.getsizeof, self.directories))
+        size += sys.getsizeof(self._directory_ids)
+        for column in (self.dir_ids, self.micros, self.sources, self.types):
+            size += column.itemsize * len(column)
+        return size
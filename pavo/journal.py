@@ -0,0 +1,418 @@
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from pavo.cache import get_cache_dir
+
+# Completion records are fsynced in batches; anything lost in a crash is
+# recovered on resume by finding the file at its destination
+FSYNC_BATCH = 256
+
+# Finished journals kept around for undo
+KEEP_JOURNALS = 50
+
+
+def get_journal_dir():
+    journal_dir = get_cache_dir() / 'journals'
+    journal_dir.mkdir(parents=True, exist_ok=True)
+    return journal_dir
+
+
+def list_journals():
+    """Journal paths, oldest first."""
+    return sorted(get_journal_dir().glob('*.jsonl'))
+
+
+def identity(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def same_file(stat, ident):
+    # Moves across volumes keep size and mtime (shutil.move uses copy2) but
+    # not the inode number
+    size, mtime_ns, ino = ident
+    return stat.st_size == size and (stat.st_ino == ino or stat.st_mtime_ns == mtime_ns)
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _collision_candidates(dst):
+    # rename_file picks name_1, name_2, ... when the planned name is taken
+    yield dst
+    counter = 1
+    while True:
+        candidate = dst.with_name(f"{dst.stem}_{counter}{dst.suffix}")
+        if not candidate.exists():
+            return
+        yield candidate
+        counter += 1
+
+
+class Operation:
+    __slots__ = ('id', 'src', 'dst', 'ident', 'link_to', 'done', 'checksum', 'linked', 'error', 'undone')
+
+    def __init__(self, op_id, src, dst, ident, link_to=None):
+        self.id = op_id
+        self.src = Path(src)
+        self.dst = Path(dst)
+        self.ident = ident
+        # Planned destination of the identical file dst is to be a hard link to
+        self.link_to = Path(link_to) if link_to is not None else None
+        self.done = None
+        self.checksum = None
+        self.linked = False
+        self.error = None
+        self.undone = False
+
+
+class Journal:
+    """Append-only record of a rename/organize/import run.
+
+    Each operation is written as an intent (source, planned destination and
+    the source's size/mtime/inode) before it is attempted, then marked done
+    with the destination actually used, or failed. A run killed part way can
+    be resumed from the journal alone, and a finished one undone by replaying
+    it backwards.
+    """
+
+    def __init__(self, path, kind=None, root=None, created=None, options=None):
+        self.path = Path(path)
+        self.kind = kind
+        self.root = Path(root) if root else None
+        self.created = created
+        self.options = options or {}
+        self.complete = False
+        self.operations = {}
+        self._file = None
+        self._unsynced = 0
+
+    @classmethod
+    def create(cls, kind, root, prune=True, **options):
+        # Long-running callers pass prune=False and call prune_journals
+        # themselves, now and then
+        created = datetime.now()
+        path = get_journal_dir() / f"{created.strftime('%Y%m%d-%H%M%S-%f')}-{kind}.jsonl"
+        journal = cls(path, kind, root, created, options)
+        journal._write({'type': 'begin', 'kind': kind, 'root': str(root), 'created': created.isoformat(),
+                        'options': options})
+        journal.sync()
+        if prune:
+            prune_journals()
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        journal = cls(path)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    break
+                journal._replay(record)
+        return journal
+
+    def _replay(self, record):
+        record_type = record['type']
+        if record_type == 'begin':
+            self.kind = record['kind']
+            self.root = Path(record['root'])
+            self.created = datetime.fromisoformat(record['created'])
+            self.options = record.get('options', {})
+        elif record_type == 'op':
+            self.operations[record['id']] = Operation(record['id'], record['src'], record['dst'], record['ident'],
+                                                      record.get('link_to'))
+        elif record_type == 'done':
+            op = self.operations[record['id']]
+            op.done = Path(record['dst'])
+            op.checksum = record.get('hash')
+            op.linked = record.get('link', False)
+        elif record_type == 'fail':
+            self.operations[record['id']].error = record['error']
+        elif record_type == 'undone':
+            self.operations[record['id']].undone = True
+        elif record_type == 'end':
+            self.complete = True
+
+    def __len__(self):
+        return len(self.operations)
+
+    @property
+    def pending(self):
+        return [op for op in self.operations.values() if op.done is None and op.error is None]
+
+    @property
+    def done(self):
+        return [op for op in self.operations.values() if op.done is not None]
+
+    @property
+    def undoable(self):
+        # A file that kept its name or place has nothing to put back
+        return [op for op in self.operations.values()
+                if op.done is not None and not op.undone and op.done != op.src]
+
+    def describe(self):
+        state = 'complete' if self.complete else f"incomplete, {len(self.pending)} pending"
+        undone = sum(op.undone for op in self.operations.values())
+        if undone:
+            state += f", {undone} undone"
+        return (f"{self.created:%Y-%m-%d %H:%M:%S} {self.kind} {self.root}: "
+                f"{len(self.done)}/{len(self)} done ({state})")
+
+    # Writing
+
+    def _write(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record) + '\n')
+        self._unsynced += 1
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _sync_batch(self):
+        if self._unsynced >= FSYNC_BATCH:
+            self.sync()
+
+    def add(self, src, dst, stat, link_to=None):
+        # Callers sync() once they've added everything, before acting on it
+        op = Operation(len(self.operations), src, dst, identity(stat), link_to)
+        self.operations[op.id] = op
+        record = {'type': 'op', 'id': op.id, 'src': str(op.src), 'dst': str(op.dst), 'ident': op.ident}
+        if link_to is not None:
+            record['link_to'] = str(link_to)
+        self._write(record)
+        return op
+
+    def mark_done(self, op, dst, checksum=None, linked=False):
+        op.done = Path(dst)
+        op.checksum = checksum
+        op.linked = linked
+        record = {'type': 'done', 'id': op.id, 'dst': str(dst)}
+        if checksum is not None:
+            record['hash'] = checksum
+        if linked:
+            record['link'] = True
+        self._write(record)
+        self._sync_batch()
+
+    def mark_failed(self, op, error):
+        op.error = str(error)
+        self._write({'type': 'fail', 'id': op.id, 'error': op.error})
+        self._sync_batch()
+
+    def _mark_undone(self, op):
+        op.undone = True
+        self._write({'type': 'undone', 'id': op.id})
+        self._sync_batch()
+
+    def finish(self):
+        self._write({'type': 'end'})
+        self.complete = True
+        self.close()
+
+    # Running
+
+    def run(self, ops, operation):
+        """Journal and perform (item, src, dst) operations.
+
+        operation(src, dst) does the work and returns the path actually
+        used. Yields (item, new_path, exception) like the unjournaled apply.
+        """
+        try:
+            # The whole plan is on disk before the first file is touched, so
+            # a resume never needs the metadata again
+            started = []
+            for item, src, dst in ops:
+                try:
+                    stat = os.stat(src)
+                except OSError as e:
+                    yield item, None, e
+                    continue
+                started.append((item, self.add(src, dst, stat)))
+            self.sync()
+
+            for item, op in started:
+                try:
+                    new_path = operation(op.src, op.dst)
+                except Exception as e:
+                    self.mark_failed(op, e)
+                    yield item, None, e
+                    continue
+                self.mark_done(op, new_path)
+                yield item, new_path, None
+            self.finish()
+        finally:
+            self.close()
+
+    def _find_at_destination(self, op, target_stat=None):
+        # A hard link is the target's inode, not the source's
+        for candidate in _collision_candidates(op.dst):
+            dst_stat = _stat(candidate)
+            if dst_stat is None:
+                continue
+            if target_stat is not None:
+                if (dst_stat.st_dev, dst_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+                    return candidate
+            elif same_file(dst_stat, op.ident):
+                return candidate
+        return None
+
+    def resume(self, operation, link=None):
+        """Finish the pending operations of an interrupted run.
+
+        operation(src, dst) returns the path used, or (path, checksum).
+        Operations recorded with a link_to go to link(target, src, dst)
+        instead, with the path their target ended up at; it returns the
+        path of the hard link, or None if none could be made, and the file
+        is then moved or copied by operation like any other. Yields (op,
+        new_path, exception). Operations that completed before the crash
+        but weren't marked yet are recognised by the file's identity at the
+        destination and only recorded.
+        """
+        # A finished copy leaves the source in place, so look for it first
+        copies = self.kind == 'import'
+        removes_sources = not copies or self.options.get('delete_source', False)
+        # Where each planned destination actually ended up
+        final_paths = {op.dst: op.done for op in self.done}
+        try:
+            # Links last, once what they link to is in place, as in the run
+            for op in sorted(self.pending, key=lambda op: op.link_to is not None):
+                src_stat = _stat(op.src)
+                source_intact = src_stat is not None and same_file(src_stat, op.ident)
+                target = target_stat = None
+                if op.link_to is not None and link is not None:
+                    target = final_paths.get(op.link_to, op.link_to)
+                    target_stat = _stat(target)
+                if target_stat is not None:
+                    # The link is made before the source is removed
+                    found = self._find_at_destination(op, target_stat)
+                    if found is not None and source_intact and removes_sources:
+                        try:
+                            os.unlink(op.src)
+                        except OSError as e:
+                            self.mark_failed(op, e)
+                            yield op, None, e
+                            continue
+                else:
+                    found = self._find_at_destination(op) if copies or not source_intact else None
+                if found is not None:
+                    self.mark_done(op, found, linked=target_stat is not None)
+                    final_paths[op.dst] = found
+                    yield op, found, None
+                elif source_intact:
+                    try:
+                        new_path = link(target, op.src, op.dst) if target_stat is not None else None
+                        linked = new_path is not None
+                        result = new_path if linked else operation(op.src, op.dst)
+                    except Exception as e:
+                        self.mark_failed(op, e)
+                        yield op, None, e
+                        continue
+                    new_path, checksum = result if isinstance(result, tuple) else (result, None)
+                    self.mark_done(op, new_path, checksum, linked)
+                    final_paths[op.dst] = new_path
+                    yield op, new_path, None
+                else:
+                    error = FileNotFoundError(f"{op.src.name}: file has moved or changed since the run began")
+                    self.mark_failed(op, error)
+                    yield op, None, error
+            if not self.complete:
+                self.finish()
+        finally:
+            self.close()
+
+    def undo(self):
+        """Put every completed operation back, newest first.
+
+        Moved files go back to their original names; imported copies are
+        deleted, or moved back if their source was deleted after copying.
+        Yields (op, exception). Files that changed or whose original name has
+        been taken since are left alone and reported. Folders emptied by the
+        undo are removed, up to the journal's root.
+        """
+        try:
+            for op in sorted(self.undoable, key=lambda op: op.id, reverse=True):
+                try:
+                    dst_stat = os.stat(op.done)
+                    # A duplicate replaced by a hard link shares the original's
+                    # inode and times; only its size can be checked
+                    matches = dst_stat.st_size == op.ident[0] if op.linked else same_file(dst_stat, op.ident)
+                    if not matches:
+                        raise FileExistsError(f"{op.done.name}: file has changed since it was moved")
+                    if op.src.exists():
+                        if self.kind != 'import':
+                            raise FileExistsError(f"{op.src.name}: original name is taken")
+                        os.unlink(op.done)
+                    else:
+                        op.src.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.move(str(op.done), str(op.src))
+                except Exception as e:
+                    yield op, e
+                    continue
+                self._mark_undone(op)
+                self._remove_empty_dirs(op.done.parent)
+                yield op, None
+        finally:
+            self.close()
+
+    def _remove_empty_dirs(self, directory):
+        root = self.root
+        while root is not None and directory != root and root in directory.parents:
+            try:
+                directory.rmdir()
+            except OSError:
+                return
+            directory = directory.parent
+
+
+def prune_journals(keep=KEEP_JOURNALS):
+    # Only finished journals are dropped; interrupted ones wait to be resumed
+    journals = list_journals()
+    for path in journals[:-keep]:
+        try:
+            if Journal.load(path).complete:
+                path.unlink()
+        except (OSError, ValueError, KeyError):
+            continue
+
+
+def incomplete_journals():
+    journals = []
+    for path in list_journals():
+        try:
+            journal = Journal.load(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if not journal.complete:
+            journals.append(journal)
+    return journals
+
+
+def latest_undoable_journal():
+    # Repeated undos walk back through earlier runs
+    for path in reversed(list_journals()):
+        try:
+            journal = Journal.load(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if journal.undoable:
+            return journal
+    return None
@@ -0,0 +1,109 @@
+import os
+import struct
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# How the extraction engine orders reads: 'name' never reorders, 'physical'
+# reorders whatever the device, and 'auto' reorders files on rotational
+# devices whose filesystem maps their extents (virtual disks often claim to
+# spin, and without extents there's little to gain) and leaves the rest in
+# name order
+READ_ORDERS = ('auto', 'name', 'physical')
+
+# FS_IOC_FIEMAP (linux/fs.h): struct fiemap followed by one fiemap_extent
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+FIEMAP_EXTENT_UNKNOWN = 0x00000002
+FIEMAP_EXTENT_DELALLOC = 0x00000004
+FIEMAP_EXTENT_DATA_INLINE = 0x00000200
+FIEMAP_NO_OFFSET = FIEMAP_EXTENT_UNKNOWN | FIEMAP_EXTENT_DELALLOC | FIEMAP_EXTENT_DATA_INLINE
+
+# If none of a device's first few files has an extent map, its filesystem
+# doesn't do FIEMAP and inode order is all there is
+FIEMAP_PROBE = 16
+
+_rotational = {}
+
+
+def is_rotational(st_dev):
+    """Whether the block device behind st_dev says it spins, from /sys/block.
+
+    USB card readers usually do, which suits them: they too are fastest read
+    in order, one request at a time. None when it can't be told (not Linux,
+    network and virtual filesystems).
+    """
+    try:
+        return _rotational[st_dev]
+    except KeyError:
+        pass
+    rotational = None
+    if sys.platform.startswith('linux'):
+        try:
+            device = os.path.realpath(f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}")
+            # Partitions take the setting of the disk they're on
+            if os.path.exists(os.path.join(device, 'partition')):
+                device = os.path.dirname(device)
+            with open(os.path.join(device, 'queue', 'rotational')) as f:
+                rotational = f.read().strip() == '1'
+        except (OSError, ValueError):
+            pass
+    _rotational[st_dev] = rotational
+    return rotational
+
+
+def physical_offset(path):
+    """Where a file's data starts on its device, or None if the filesystem
+    can't say (no FIEMAP, inline or not yet allocated data)."""
+    if fcntl is None:
+        return None
+    buffer = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(buffer, 0, 0, 2 ** 64 - 1, 0, 0, 1, 0)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, buffer, True)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if not FIEMAP_HEADER.unpack_from(buffer)[3]:
+        return None
+    _, physical, _, _, _, flags, _, _, _ = FIEMAP_EXTENT.unpack_from(buffer, FIEMAP_HEADER.size)
+    if flags & FIEMAP_NO_OFFSET:
+        return None
+    return physical
+
+
+def maps_extents(paths):
+    """Whether the filesystem of paths (on one device) says where files
+    are, judged by the first FIEMAP_PROBE of them."""
+    return any(physical_offset(path) is not None for path in paths[:FIEMAP_PROBE])
+
+
+def sort_by_layout(files, extents=True):
+    """Sort (path, stat, item) of files on one device into the order their
+    data sits on it: by first extent where FIEMAP tells, otherwise by inode
+    number, which most filesystems allocate close to the data.
+
+    Extent maps are looked up in inode order, so even that pass mostly reads
+    the inode tables front to back.
+    """
+    files = sorted(files, key=lambda file: file[1].st_ino)
+    if not extents or len(files) < 2:
+        return files
+    offsets = []
+    for n, (path, _, _) in enumerate(files):
+        if n == FIEMAP_PROBE and not any(offset is not None for offset in offsets):
+            return files
+        offsets.append(physical_offset(path))
+    # Files without an extent map go last, still in inode order
+    order = sorted(range(len(files)), key=lambda i: (offsets[i] is None, offsets[i] or 0, i))
+    return [files[i] for i in order]
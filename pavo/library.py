@@ -0,0 +1,318 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, time as clock_time, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from pavo import core
+from pavo.cache import get_cache_dir
+from pavo.filetable import EPOCH, to_micros, type_code
+from pavo.scanner import scan
+from pavo.sessions import TYPE_FOLDERS, Grouping
+
+# Days of session time ranges kept in memory; older days are asked of the
+# catalog (or re-read from the library) if files for them turn up again
+MAX_CACHED_DAYS = 64
+
+SESSION_FOLDER = re.compile(r'^Session(\d+)_(\d\d)\.(\d\d)$')
+
+_TYPE_FOLDER_NAMES = set(TYPE_FOLDERS.values())
+
+
+def session_of(folder):
+    # The session part of a file's folder relative to the library: the type
+    # folder is dropped, and '' is the library itself
+    parts = [part for part in folder.split('/') if part and part != '.']
+    if parts and parts[-1] in _TYPE_FOLDER_NAMES:
+        parts.pop()
+    return '/'.join(parts)
+
+
+def _from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def parse_date(text, end=False):
+    """A date to search from or to: YYYY-MM-DD, optionally with a time. A
+    bare date given as the end of a range includes that whole day."""
+    text = text.strip()
+    try:
+        when = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"not a date: {text!r} (use YYYY-MM-DD or 'YYYY-MM-DD HH:MM')") from None
+    if end and len(text) <= 10:
+        when += timedelta(days=1)
+    return when
+
+
+class LibraryCatalog:
+    """Every file PAVO has organized or imported: its library, session
+    folder, capture time and type, indexed by capture time.
+
+    One catalog serves every library. Grouping new files against a library
+    then only asks for the sessions around their dates, and the library can
+    be searched by date without reading it.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else get_cache_dir() / 'catalog.sqlite3'
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                library TEXT NOT NULL,
+                session TEXT NOT NULL,
+                micros INTEGER NOT NULL,
+                type INTEGER NOT NULL,
+                dt_source TEXT NOT NULL,
+                added REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_library_time ON files (library, micros)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_time ON files (micros)')
+        self._conn.commit()
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def record(self, library, files):
+        """Add (path, datetime, dt_source) of files now in library, replacing
+        what was known about those paths. Files outside library are ignored."""
+        library = self._key(library)
+        now = time.time()
+        rows = []
+        for path, dt, dt_source in files:
+            if dt is None:
+                continue
+            path = self._key(path)
+            try:
+                folder = os.path.relpath(os.path.dirname(path), library)
+            except ValueError:
+                # Another drive, on Windows
+                continue
+            if folder == os.pardir or folder.startswith(os.pardir + os.sep):
+                continue
+            rows.append((path, library, session_of(folder.replace(os.sep, '/')), to_micros(dt),
+                         type_code(path), dt_source, now))
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+        return len(rows)
+
+    def moved(self, moves):
+        """Follow (old path, new path) renames of catalogued files."""
+        with self._lock:
+            self._conn.executemany('UPDATE OR REPLACE files SET path = ? WHERE path = ?',
+                                   [(self._key(new), self._key(old)) for old, new in moves])
+            self._conn.commit()
+
+    def forget(self, paths):
+        with self._lock:
+            self._conn.executemany('DELETE FROM files WHERE path = ?', [(self._key(path),) for path in paths])
+            self._conn.commit()
+
+    def forget_library(self, library, keep=()):
+        """Drop a library's files that aren't in keep; returns how many."""
+        library = self._key(library)
+        keep = {self._key(path) for path in keep}
+        with self._lock:
+            gone = [(path,) for path, in self._conn.execute('SELECT path FROM files WHERE library = ?', (library,))
+                    if path not in keep]
+            self._conn.executemany('DELETE FROM files WHERE path = ?', gone)
+            self._conn.commit()
+        return len(gone)
+
+    @staticmethod
+    def _range(start, end):
+        # Inclusive start, exclusive end; None is open-ended
+        return (to_micros(start) if start is not None else -2 ** 63,
+                to_micros(end) if end is not None else 2 ** 63 - 1)
+
+    def sessions(self, library, start=None, end=None):
+        """(session, first, last, count) of the library's files captured in [start, end)."""
+        low, high = self._range(start, end)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT session, MIN(micros), MAX(micros), COUNT(*) FROM files '
+                'WHERE library = ? AND micros >= ? AND micros < ? GROUP BY session ORDER BY MIN(micros)',
+                (self._key(library), low, high)).fetchall()
+        return [(session, _from_micros(first), _from_micros(last), count) for session, first, last, count in rows]
+
+    def files(self, start=None, end=None, library=None, file_type=None):
+        """Yield (path, datetime, type, session, library) in capture order."""
+        low, high = self._range(start, end)
+        query = 'SELECT path, micros, type, session, library FROM files WHERE micros >= ? AND micros < ?'
+        params = [low, high]
+        if library is not None:
+            query += ' AND library = ?'
+            params.append(self._key(library))
+        if file_type is not None:
+            query += ' AND type = ?'
+            params.append(file_type)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY micros', params).fetchall()
+        for path, micros, code, session, library_path in rows:
+            yield path, _from_micros(micros), code, session, library_path
+
+    def libraries(self):
+        """(library, file count, first, last) of every catalogued library."""
+        with self._lock:
+            rows = self._conn.execute('SELECT library, COUNT(*), MIN(micros), MAX(micros) FROM files '
+                                      'GROUP BY library ORDER BY library').fetchall()
+        return [(library, count, _from_micros(first), _from_micros(last)) for library, count, first, last in rows]
+
+    def close(self):
+        if self._conn is None:
+            return
+        self._conn.close()
+        self._conn = None
+
+
+def catalog_library(catalog, library, engine=None, recursive=True):
+    """Catalog every media file under library, and forget catalogued files
+    no longer there. Dates come from the metadata cache where it has them.
+    Returns (files catalogued, files forgotten)."""
+    files = list(core.extract_datetimes(list(scan(library, recursive=recursive)), engine))
+    recorded = catalog.record(library, files)
+    forgotten = catalog.forget_library(library, keep=[path for path, _, _ in files])
+    return recorded, forgotten
+
+
+# Sessions already in a library
+
+class Session:
+    __slots__ = ('number', 'start', 'end', 'prefix')
+
+    def __init__(self, number, start, end, prefix):
+        self.number = number
+        self.start = start
+        self.end = end
+        self.prefix = prefix
+
+
+class SessionIndex:
+    """Time ranges of the session folders already in the library.
+
+    New files join the session whose range (widened by the gap threshold)
+    they fall into, or start a new session numbered after the existing ones
+    for that date; existing folders are never renamed or regrouped. A day's
+    ranges come from a range query on the catalog; only session folders the
+    catalog doesn't know are read from the library, and then catalogued.
+    The most recent max_days are kept in memory.
+    """
+
+    def __init__(self, root, options, engine=None, catalog=None, max_days=MAX_CACHED_DAYS):
+        self.root = Path(root)
+        self.options = options
+        self.engine = engine
+        self.catalog = catalog
+        self.max_days = max_days
+        self._days = OrderedDict()
+
+    def _day(self, day):
+        sessions = self._days.get(day)
+        if sessions is None:
+            sessions = self._days[day] = self._load(day)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+        else:
+            self._days.move_to_end(day)
+        return sessions
+
+    def day_folder(self, day):
+        return self.root / day.strftime('%Y-%m-%d') if day is not None else self.root
+
+    def _catalogued(self, day):
+        # Session prefix -> (first, last) of the day's catalogued sessions
+        if self.catalog is None:
+            return {}
+        if day is None:
+            ranges = self.catalog.sessions(self.root)
+        else:
+            start = datetime.combine(day, clock_time())
+            ranges = self.catalog.sessions(self.root, start, start + timedelta(days=1))
+        return {session: (first, last) for session, first, last, _ in ranges}
+
+    def _load(self, day):
+        directory = self.day_folder(day)
+        sessions = []
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return sessions
+        catalogued = self._catalogued(day)
+        for entry in entries:
+            match = SESSION_FOLDER.match(entry.name)
+            if match is None:
+                continue
+            number = int(match.group(1))
+            prefix = f"{day:%Y-%m-%d}/{entry.name}" if day is not None else entry.name
+            known = catalogued.get(prefix)
+            if known is not None:
+                sessions.append(Session(number, known[0], known[1], prefix))
+                continue
+            files = list(core.extract_datetimes(list(scan(entry.path, recursive=True)), self.engine))
+            times = [dt for _, dt, _ in files]
+            if self.catalog is not None:
+                self.catalog.record(self.root, files)
+            if times:
+                sessions.append(Session(number, min(times), max(times), prefix))
+            elif day is not None:
+                start = datetime.combine(day, clock_time(int(match.group(2)), int(match.group(3))))
+                sessions.append(Session(number, start, start, prefix))
+            else:
+                # Nothing to place it in time by; only its number is taken
+                sessions.append(Session(number, None, None, prefix))
+        return sessions
+
+    def _session_for(self, dt):
+        day = dt.date() if self.options.separate_by_date else None
+        sessions = self._day(day)
+        gap = self.options.time_gap_minutes * 60
+        best = None
+        best_distance = None
+        for session in sessions:
+            if session.start is None:
+                continue
+            if session.start <= dt <= session.end:
+                distance = 0
+            else:
+                distance = min(abs((dt - session.start).total_seconds()), abs((dt - session.end).total_seconds()))
+            if distance <= gap and (best is None or distance < best_distance):
+                best, best_distance = session, distance
+        if best is None:
+            number = max((session.number for session in sessions), default=0) + 1
+            name = f"Session{number}_{dt.strftime('%H.%M')}"
+            best = Session(number, dt, dt, f"{day:%Y-%m-%d}/{name}" if day is not None else name)
+            sessions.append(best)
+        else:
+            best.start = min(best.start, dt)
+            best.end = max(best.end, dt)
+        return best
+
+    def assign(self, table):
+        """A Grouping for a FileTable sorted by capture time, placing its
+        files in the library's sessions."""
+        options = self.options
+        prefix_ids = {}
+        session_ids = np.empty(len(table), dtype=np.int64)
+        for i in range(len(table)):
+            dt = table.datetime(i)
+            if options.separate_by_session:
+                prefix = self._session_for(dt).prefix
+            elif options.separate_by_date:
+                prefix = dt.strftime('%Y-%m-%d')
+            else:
+                prefix = ''
+            session_ids[i] = prefix_ids.setdefault(prefix, len(prefix_ids))
+        return Grouping(session_ids, list(prefix_ids), table.type_codes(), options.separate_by_type)
@@ -0,0 +1,394 @@
+import json
+import os
+import struct
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+from PIL import Image
+from PIL.ExifTags import TAGS
+
+from pavo.exifmeta import ExifFormatError, read_exif_date
+from pavo.mp4meta import APPLE_CREATION_KEY, MP4_EXTENSIONS, parse_tag_datetime, read_mp4_tags
+from pavo.namemeta import parse_name_date, parse_name_timestamp, parse_pavo_name
+from pavo.sidecarmeta import find_sidecars, read_xmp_date
+from pavo.quarantine import ERROR, TIMEOUT
+from pavo.stats import add_bytes_read, note_extractor, note_failure
+
+# Supported file extensions
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tiff', '.bmp', '.gif'}
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm'}
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+
+# Files that get sidecars: XMP from photo editors, THM and LRV from cameras
+SIDECAR_EXTENSIONS = {'.jpg', '.jpeg', '.tiff', '.mp4', '.mov', '.avi'}
+
+# Seconds a date source may spend on one file. ffprobe is killed when it
+# runs over; the parsers in this process can't be stopped part way, so a
+# file they overrun on is given up on by the engine (see pavo.engine).
+EXTRACTOR_TIMEOUT = 5.0
+FFPROBE_TIMEOUT = 15.0
+
+
+class UnsupportedFile(ValueError):
+    """Raised by a date source for a file it doesn't handle, so the next
+    source gets a go without the file counting as damaged."""
+
+
+# Same preference order the header parser uses
+PIL_DATE_TAGS = ['DateTimeOriginal', 'DateTimeDigitized', 'DateTime']
+
+
+def get_image_datetime(file_path):
+    note_extractor('exif')
+    try:
+        exif_date = read_exif_date(file_path)
+        return (exif_date.datetime, 'EXIF') if exif_date else (None, None)
+    except ExifFormatError:
+        pass
+    except OSError:
+        note_failure(ERROR)
+        return None, None
+    return get_pil_image_datetime(file_path)
+
+
+def get_pil_image_datetime(file_path):
+    note_extractor('pil')
+    try:
+        with Image.open(file_path) as img:
+            # BMPs and GIFs have no EXIF to read
+            getexif = getattr(img, '_getexif', None)
+            exif_data = getexif() if getexif is not None else None
+            # Formats read whole on open have closed their file by now
+            if img.fp is not None:
+                add_bytes_read(img.fp.tell())
+            if exif_data:
+                tags = {TAGS.get(tag_id, tag_id): value for tag_id, value in exif_data.items()}
+                for tag in PIL_DATE_TAGS:
+                    if tag in tags:
+                        try:
+                            return datetime.strptime(tags[tag], '%Y:%m:%d %H:%M:%S'), 'EXIF'
+                        except (TypeError, ValueError):
+                            continue
+    except Exception:
+        note_failure(ERROR)
+    return None, None
+
+
+# Tag priority matches what ffprobe reported as format tags
+VIDEO_DATE_TAGS = ['creation_time', 'date', APPLE_CREATION_KEY]
+
+
+def _video_tags_datetime(tags):
+    for key in VIDEO_DATE_TAGS:
+        if key in tags:
+            dt = parse_tag_datetime(tags[key])
+            if dt is not None:
+                return dt
+    return None
+
+
+def get_mp4_datetime(file_path):
+    note_extractor('mp4')
+    tags = read_mp4_tags(file_path)
+    if tags is None:
+        # Not a file the box parser can follow; ffprobe gets a go
+        raise UnsupportedFile("not an MP4 file")
+    dt = _video_tags_datetime(tags)
+    return (dt, 'Metadata') if dt is not None else (None, None)
+
+
+def get_ffprobe_datetime(file_path):
+    note_extractor('ffprobe')
+    dt = _video_tags_datetime(get_ffprobe_tags(file_path))
+    return (dt, 'Metadata') if dt is not None else (None, None)
+
+
+def get_pavo_name_datetime(file_path):
+    note_extractor('pavo_name')
+    dt = parse_pavo_name(os.path.basename(file_path))
+    return (dt, 'Filename') if dt is not None else (None, None)
+
+
+def get_name_datetime(file_path):
+    note_extractor('filename')
+    dt = parse_name_timestamp(os.path.basename(file_path))
+    return (dt, 'Filename') if dt is not None else (None, None)
+
+
+def get_name_date(file_path):
+    # Only the day is known; the file's own time is used if it's that day
+    note_extractor('filename_date')
+    dt = parse_name_date(os.path.basename(file_path))
+    if dt is None:
+        return None, None
+    modified = datetime.fromtimestamp(os.stat(file_path).st_mtime)
+    if modified.date() == dt.date():
+        dt = modified
+    return dt, 'Filename'
+
+
+def get_sidecar_datetime(file_path):
+    note_extractor('sidecar')
+    for kind, sidecar in find_sidecars(file_path, Path(file_path).suffix.lower() in VIDEO_EXTENSIONS):
+        try:
+            if kind == 'xmp':
+                dt = read_xmp_date(sidecar)
+            elif kind == 'thm':
+                exif_date = read_exif_date(sidecar)
+                dt = exif_date.datetime if exif_date else None
+            else:
+                dt = _video_tags_datetime(read_mp4_tags(sidecar) or {})
+        except (OSError, ValueError, struct.error, ExifFormatError):
+            continue
+        if dt is not None:
+            return dt, 'Sidecar'
+    return None, None
+
+
+def get_ffprobe_tags(file_path, timeout=FFPROBE_TIMEOUT):
+    cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_entries', 'format_tags', str(file_path)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # run() has killed it by now
+        raise TimeoutError(f"ffprobe took over {timeout:g}s") from None
+    except OSError:
+        # No ffprobe installed
+        return {}
+    if result.returncode != 0:
+        raise ValueError("ffprobe could not read the file")
+    try:
+        return json.loads(result.stdout).get('format', {}).get('tags', {})
+    except (ValueError, AttributeError):
+        return {}
+
+
+def get_file_datetime(file_path, stat=None):
+    note_extractor('stat')
+    try:
+        if stat is None:
+            stat = Path(file_path).stat()
+        timestamp = getattr(stat, 'st_birthtime', None) or stat.st_mtime
+        return datetime.fromtimestamp(timestamp), 'File System'
+    except Exception:
+        return datetime.now(), 'Current Time'
+
+
+# Extractor registry. Every date source declares what it costs and which
+# extensions it reads; files go through the sources for their extension
+# cheapest first, stopping at the first trusted answer. An untrusted answer
+# is only used when nothing after it answers, and the file's own time is the
+# last resort (see get_datetime).
+
+# Rough cost per file: 0 is string work only, 1 a stat or small sidecar
+# read, 10 parsing the file's header, 100 starting a process
+COST_FREE = 0
+COST_LOOKUP = 1
+COST_HEADER = 10
+COST_PROCESS = 100
+
+# Per-folder policy file; the nearest one at or above a file applies
+POLICY_FILE = '.pavo.json'
+
+
+class Extractor:
+    __slots__ = ('name', 'func', 'cost', 'extensions', 'trusted', 'replaces', 'timeout')
+
+    def __init__(self, name, func, cost, extensions=None, trusted=True, replaces=(), timeout=EXTRACTOR_TIMEOUT):
+        self.name = name
+        self.func = func
+        self.cost = cost
+        self.extensions = extensions
+        self.trusted = trusted
+        self.replaces = replaces
+        self.timeout = timeout
+
+
+EXTRACTORS = {}
+_chains = {}
+
+
+def register_extractor(name, func, cost, extensions=None, trusted=True, replaces=(), timeout=EXTRACTOR_TIMEOUT):
+    """Add (or replace) a date source.
+
+    func(file_path) returns (datetime, dt_source), or (None, None) if the
+    file has no date it can find; it may raise OSError or ValueError for
+    files it can't read (UnsupportedFile for ones it doesn't handle, and
+    TimeoutError when it gives up). extensions limits it to those suffixes
+    (all media files when None). Once it has read a file without finding a
+    date, the sources named in replaces are skipped for that file. timeout
+    is the seconds it may spend on one file.
+    """
+    EXTRACTORS[name] = Extractor(name, func, cost, extensions, trusted, tuple(replaces), timeout)
+    _chains.clear()
+
+
+register_extractor('pavo_name', get_pavo_name_datetime, COST_FREE)
+register_extractor('filename', get_name_datetime, COST_FREE)
+register_extractor('filename_date', get_name_date, COST_LOOKUP, trusted=False)
+register_extractor('sidecar', get_sidecar_datetime, COST_LOOKUP, SIDECAR_EXTENSIONS)
+register_extractor('exif', get_image_datetime, COST_HEADER, IMAGE_EXTENSIONS)
+register_extractor('mp4', get_mp4_datetime, COST_HEADER, MP4_EXTENSIONS, replaces=['ffprobe'])
+register_extractor('ffprobe', get_ffprobe_datetime, COST_PROCESS, VIDEO_EXTENSIONS, timeout=FFPROBE_TIMEOUT)
+
+
+class ExtractorPolicy:
+    """Which date sources to use for a folder, and which to trust.
+
+    use lists the sources to run, in that order (default: all of them,
+    cheapest first); skip leaves sources out; answers from sources in
+    distrust are only taken when nothing else answers.
+    """
+    __slots__ = ('use', 'skip', 'distrust')
+
+    def __init__(self, use=None, skip=(), distrust=()):
+        self.use = tuple(use) if use is not None else None
+        self.skip = frozenset(skip)
+        self.distrust = frozenset(distrust)
+
+    def _key(self):
+        return self.use, self.skip, self.distrust
+
+    def __eq__(self, other):
+        return isinstance(other, ExtractorPolicy) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def chain(self, suffix):
+        """((name, trusted), ...) to run for files with suffix."""
+        key = (self, suffix)
+        chain = _chains.get(key)
+        if chain is None:
+            if self.use is not None:
+                extractors = [EXTRACTORS[name] for name in self.use if name in EXTRACTORS]
+            else:
+                extractors = sorted(EXTRACTORS.values(), key=lambda extractor: extractor.cost)
+            chain = _chains[key] = tuple(
+                (extractor.name, extractor.trusted and extractor.name not in self.distrust)
+                for extractor in extractors
+                if extractor.name not in self.skip
+                and (extractor.extensions is None or suffix in extractor.extensions))
+        return chain
+
+
+DEFAULT_POLICY = ExtractorPolicy()
+
+# What a file gets when no source knows its date
+FALLBACK_SOURCES = ('File System', 'Current Time')
+
+
+def metadata_policy():
+    """A policy that skips the sources that only look at file names."""
+    # filename_date stats the file, but only to place a date from its name
+    return ExtractorPolicy(skip=[name for name, extractor in EXTRACTORS.items()
+                                 if extractor.cost <= COST_FREE or name == 'filename_date'])
+
+
+def load_policy(path):
+    """The ExtractorPolicy in a policy file, e.g.
+
+        {"extractors": {"skip": ["ffprobe"], "distrust": ["filename"]}}
+
+    Unreadable files and unknown keys give the default policy.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            settings = json.load(f).get('extractors') or {}
+        return ExtractorPolicy(settings.get('use'), settings.get('skip', ()), settings.get('distrust', ()))
+    except (OSError, ValueError, AttributeError, TypeError):
+        return DEFAULT_POLICY
+
+
+def find_policy(directory, known=None):
+    """The policy for files in directory: the nearest POLICY_FILE at or above it.
+
+    known maps folders already looked up to their policy, and is filled in
+    for every folder walked through, so a scan reads each policy file once.
+    """
+    if known is None:
+        known = {}
+    directory = os.path.abspath(directory)
+    walked = []
+    policy = DEFAULT_POLICY
+    while True:
+        if directory in known:
+            policy = known[directory]
+            break
+        walked.append(directory)
+        policy_path = os.path.join(directory, POLICY_FILE)
+        if os.path.isfile(policy_path):
+            policy = load_policy(policy_path)
+            break
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    for folder in walked:
+        known[folder] = policy
+    return policy
+
+
+def free_chain(chain):
+    """Split chain into the leading sources that cost nothing and the rest."""
+    split = 0
+    while split < len(chain) and EXTRACTORS[chain[split][0]].cost <= COST_FREE:
+        split += 1
+    return chain[:split], chain[split:]
+
+
+def chain_timeout(chain):
+    """Seconds the sources in chain may spend on one file between them."""
+    return sum(EXTRACTORS[name].timeout for name, _ in chain if name in EXTRACTORS)
+
+
+def run_chain(file_path, chain):
+    """(datetime, dt_source, trusted) from the first trusted answer in chain,
+    else the first untrusted one, else (None, None, False).
+
+    Sources that fail on the file, or take longer than their timeout, are
+    noted with pavo.stats.note_failure.
+    """
+    fallback = (None, None, False)
+    skipped = ()
+    for name, trusted in chain:
+        if name in skipped:
+            continue
+        extractor = EXTRACTORS.get(name)
+        if extractor is None:
+            # Registered in another process only
+            continue
+        started = time.perf_counter()
+        try:
+            dt, dt_source = extractor.func(file_path)
+        except UnsupportedFile:
+            continue
+        except TimeoutError:
+            note_failure(TIMEOUT)
+            continue
+        except (OSError, ValueError, struct.error):
+            note_failure(ERROR)
+            continue
+        if time.perf_counter() - started > extractor.timeout:
+            note_failure(TIMEOUT)
+        if dt is None:
+            skipped += extractor.replaces
+        elif trusted:
+            return dt, dt_source, True
+        elif fallback[0] is None:
+            fallback = (dt, dt_source, False)
+    return fallback
+
+
+def get_metadata_datetime(file_path, policy=DEFAULT_POLICY):
+    dt, dt_source, _ = run_chain(file_path, policy.chain(Path(file_path).suffix.lower()))
+    return dt, dt_source
+
+
+def get_datetime(file_path, stat=None, policy=DEFAULT_POLICY):
+    dt, dt_source = get_metadata_datetime(file_path, policy)
+    if dt is None:
+        dt, dt_source = get_file_datetime(file_path, stat)
+    return dt, dt_source
@@ -0,0 +1,294 @@
+import errno
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from pavo.transfer import copy_file
+
+# Copies between devices running at once, overall and per device. Spinning
+# disks and network shares slow down when asked for too much at once.
+MOVE_WORKERS = 8
+MOVES_PER_DEVICE = 2
+
+
+class MoveJob:
+    __slots__ = ('item', 'src', 'dst', 'stat', 'op', 'link_to', 'devices')
+
+    def __init__(self, item, src, dst, stat, op, link_to=None):
+        self.item = item
+        self.src = src
+        self.dst = dst
+        self.stat = stat
+        self.op = op
+        self.link_to = link_to
+        self.devices = ()
+
+
+def unique_path(path):
+    # Names are resolved when planning; this guards against files created
+    # since then, which os.rename would silently replace on POSIX
+    counter = 1
+    candidate = path
+    while os.path.lexists(candidate):
+        candidate = path.with_name(f"{path.stem}_{counter}{path.suffix}")
+        counter += 1
+    return candidate
+
+
+def copy_into_place(src, dst, verify=True, read_back=False):
+    """Copy beside the target, then rename into place.
+
+    A crash part way leaves only a hidden partial file behind, never a
+    truncated file under the final name. Returns (path, checksum); see
+    pavo.transfer.copy_file for verify and read_back.
+    """
+    partial = dst.with_name(f".{dst.name}.pavo-part")
+    try:
+        # Left over from an interrupted copy
+        os.unlink(partial)
+    except FileNotFoundError:
+        pass
+    checksum = copy_file(src, partial, verify, read_back)
+    try:
+        dst = unique_path(dst)
+        os.rename(partial, dst)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return dst, checksum
+
+
+def copy_move(src, dst):
+    # The source is only removed once the copy has been read back
+    dst, checksum = copy_into_place(src, dst, read_back=True)
+    os.unlink(src)
+    return dst, checksum
+
+
+def import_file(src, dst, delete_source=False, verify=True):
+    dst, checksum = copy_into_place(src, dst, verify or delete_source, read_back=delete_source)
+    if delete_source:
+        os.unlink(src)
+    return dst, checksum
+
+
+def link_into_place(target, dst):
+    # Hard links can't cross devices, and some filesystems (FAT, many
+    # shares) don't have them at all; callers fall back to a real copy/move
+    dst = unique_path(dst)
+    os.link(target, dst)
+    return dst
+
+
+class MoveScheduler:
+    """Carries out planned moves with as few syscalls as the layout allows.
+
+    Every distinct destination folder is created once up front. Moves within
+    a device are a plain os.rename on the calling thread; moves across
+    devices, and every file in copy (import) mode, are copied by a bounded
+    pool that keeps at most per_device copies reading from or writing to
+    any one device.
+    """
+
+    def __init__(self, max_workers=MOVE_WORKERS, per_device=MOVES_PER_DEVICE):
+        self.max_workers = max_workers
+        self.per_device = per_device
+        self.reset()
+
+    def reset(self):
+        self.files = 0
+        self.bytes = 0
+        self.copied = 0
+        self.verified = 0
+        self.linked = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return max(end - self.started, 1e-9)
+
+    def throughput(self):
+        """(files per second, MB per second) over the last run."""
+        return self.files / self.elapsed, self.bytes / self.elapsed / 1e6
+
+    def summary(self):
+        files_per_sec, mb_per_sec = self.throughput()
+        text = f"{self.files} files in {self.elapsed:.1f}s ({files_per_sec:.0f} files/s, {mb_per_sec:.1f} MB/s)"
+        if self.copied:
+            text += f", {self.copied} copied"
+        if self.verified:
+            text += f", {self.verified} verified"
+        if self.linked:
+            text += f", {self.linked} duplicates hard-linked"
+        return text
+
+    def make_directories(self, directories):
+        """Create each folder once; returns {folder: st_dev or exception}."""
+        devices = {}
+        # Parents sort before their children, so makedirs rarely walks up
+        for directory in sorted(directories):
+            try:
+                os.makedirs(directory, exist_ok=True)
+                devices[directory] = os.stat(directory).st_dev
+            except OSError as e:
+                devices[directory] = e
+        return devices
+
+    def run(self, ops, journal=None, copy=False, delete_source=False, verify=True):
+        """Carry out (item, src, dst, link_to) operations.
+
+        Yields (item, new_path, exception). With copy, files are copied
+        instead and the sources only removed, after verification, when
+        delete_source is set. Operations with a link_to (a file known to
+        have identical content) make dst a hard link to it instead of
+        moving or copying any data; they run last, once link_to is in place.
+        Files already at dst come straight back, untouched and unjournaled.
+        Results come back in completion order. With a journal, every
+        operation is recorded before any file is touched.
+        """
+        self.reset()
+        jobs = []
+        link_jobs = []
+        for item, src, dst, link_to in ops:
+            if Path(src) == Path(dst):
+                # Already where it belongs: nothing to journal, move or count
+                yield item, Path(src), None
+                continue
+            try:
+                stat = os.stat(src)
+            except OSError as e:
+                yield item, None, e
+                continue
+            op = journal.add(src, dst, stat, link_to) if journal is not None else None
+            job = MoveJob(item, Path(src), Path(dst), stat, op, link_to)
+            (link_jobs if link_to is not None else jobs).append(job)
+        if journal is not None:
+            journal.sync()
+        # Where each planned destination actually ended up
+        final_paths = {}
+
+        directory_devices = self.make_directories({job.dst.parent for job in jobs + link_jobs})
+
+        queues = defaultdict(deque)
+        in_flight = {}
+        device_load = defaultdict(int)
+
+        def dispatch(pool):
+            for devices, queue in queues.items():
+                while (queue and len(in_flight) < self.max_workers
+                       and all(device_load[device] < self.per_device for device in devices)):
+                    job = queue.popleft()
+                    for device in devices:
+                        device_load[device] += 1
+                    if copy:
+                        future = pool.submit(import_file, job.src, job.dst, delete_source, verify)
+                    else:
+                        future = pool.submit(copy_move, job.src, job.dst)
+                    in_flight[future] = job
+
+        def collect(futures):
+            for future in futures:
+                job = in_flight.pop(future)
+                for device in job.devices:
+                    device_load[device] -= 1
+                try:
+                    new_path, checksum = future.result()
+                except Exception as e:
+                    yield self._failed(job, e, journal)
+                else:
+                    self.copied += 1
+                    self.verified += checksum is not None
+                    final_paths[job.dst] = new_path
+                    yield self._done(job, new_path, journal, checksum)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for job in jobs:
+                    dst_device = directory_devices[job.dst.parent]
+                    if isinstance(dst_device, Exception):
+                        yield self._failed(job, dst_device, journal)
+                    else:
+                        needs_copy = copy or job.stat.st_dev != dst_device
+                        if not needs_copy:
+                            try:
+                                new_path = unique_path(job.dst)
+                                os.rename(job.src, new_path)
+                            except OSError as e:
+                                # Some mounts share a device number but still refuse renames
+                                if e.errno == errno.EXDEV:
+                                    needs_copy = True
+                                else:
+                                    yield self._failed(job, e, journal)
+                            else:
+                                final_paths[job.dst] = new_path
+                                yield self._done(job, new_path, journal)
+                        if needs_copy:
+                            job.devices = tuple(sorted({job.stat.st_dev, dst_device}))
+                            queues[job.devices].append(job)
+                            dispatch(pool)
+
+                    if in_flight:
+                        completed = [future for future in in_flight if future.done()]
+                        if completed:
+                            yield from collect(completed)
+                            dispatch(pool)
+
+                while in_flight:
+                    completed, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    yield from collect(completed)
+                    dispatch(pool)
+
+            for job in link_jobs:
+                yield self._link(job, final_paths.get(job.link_to, job.link_to), directory_devices,
+                                 journal, copy, delete_source, verify)
+            if journal is not None:
+                journal.finish()
+        finally:
+            self.finished = time.monotonic()
+            if journal is not None:
+                journal.close()
+
+    def _link(self, job, target, directory_devices, journal, copy, delete_source, verify):
+        if isinstance(directory_devices[job.dst.parent], Exception):
+            return self._failed(job, directory_devices[job.dst.parent], journal)
+        try:
+            new_path = link_into_place(target, job.dst)
+        except OSError:
+            new_path = None
+        if new_path is not None:
+            try:
+                if not copy or delete_source:
+                    os.unlink(job.src)
+            except OSError as e:
+                return self._failed(job, e, journal)
+            self.linked += 1
+            return self._done(job, new_path, journal, linked=True)
+
+        # No hard link possible here: carry the file over like any other
+        try:
+            if copy:
+                new_path, checksum = import_file(job.src, job.dst, delete_source, verify)
+            elif job.stat.st_dev == directory_devices[job.dst.parent]:
+                new_path, checksum = unique_path(job.dst), None
+                os.rename(job.src, new_path)
+            else:
+                new_path, checksum = copy_move(job.src, job.dst)
+        except OSError as e:
+            return self._failed(job, e, journal)
+        return self._done(job, new_path, journal, checksum)
+
+    def _done(self, job, new_path, journal, checksum=None, linked=False):
+        self.files += 1
+        self.bytes += job.stat.st_size
+        if journal is not None:
+            journal.mark_done(job.op, new_path, checksum, linked)
+        return job.item, new_path, None
+
+    def _failed(self, job, error, journal):
+        if journal is not None:
+            journal.mark_failed(job.op, error)
+        return job.item, None, error
@@ -0,0 +1,171 @@
+import mmap
+import struct
+from datetime import datetime, timedelta
+
+from pavo.stats import add_bytes_read
+
+# ISO base media (QuickTime/MP4) containers the box walker understands.
+# Anything else (.mkv, .avi, .wmv, .flv, .webm) goes to ffprobe.
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.3gp'}
+
+MP4_EPOCH = datetime(1904, 1, 1)
+APPLE_CREATION_KEY = 'com.apple.quicktime.creationdate'
+
+
+def iter_boxes(buf, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def find_box(buf, start, end, box_type):
+    for found_type, payload, box_end in iter_boxes(buf, start, end):
+        if found_type == box_type:
+            return payload, box_end
+    return None
+
+
+def _read_mvhd(buf, start, end):
+    if end - start < 12:
+        return None
+    version = buf[start]
+    if version == 1:
+        seconds = struct.unpack_from('>Q', buf, start + 4)[0]
+    else:
+        seconds = struct.unpack_from('>I', buf, start + 4)[0]
+    if seconds == 0:
+        return None
+    try:
+        return MP4_EPOCH + timedelta(seconds=seconds)
+    except OverflowError:
+        return None
+
+
+def _data_box_value(buf, start, end):
+    # ilst items hold a 'data' box: type indicator (4), locale (4), value
+    found = find_box(buf, start, end, b'data')
+    if found is None:
+        return None
+    payload, box_end = found
+    if box_end - payload < 8:
+        return None
+    return bytes(buf[payload + 8:box_end]).decode('utf-8', 'replace').strip('\x00')
+
+
+def _meta_payload_start(buf, start, end):
+    # udta/meta is a full box (version + flags) while QuickTime's moov/meta
+    # is not; a full box starts with four zero bytes before its children.
+    if end - start >= 4 and bytes(buf[start:start + 4]) == b'\x00\x00\x00\x00':
+        return start + 4
+    return start
+
+
+def _read_meta(buf, start, end, tags):
+    start = _meta_payload_start(buf, start, end)
+    keys = []
+    keys_box = find_box(buf, start, end, b'keys')
+    if keys_box is not None:
+        payload, box_end = keys_box
+        if box_end - payload >= 8:
+            count = struct.unpack_from('>I', buf, payload + 4)[0]
+            offset = payload + 8
+            for _ in range(count):
+                if offset + 8 > box_end:
+                    break
+                key_size = struct.unpack_from('>I', buf, offset)[0]
+                if key_size < 8 or offset + key_size > box_end:
+                    break
+                keys.append(bytes(buf[offset + 8:offset + key_size]).decode('utf-8', 'replace'))
+                offset += key_size
+
+    ilst = find_box(buf, start, end, b'ilst')
+    if ilst is None:
+        return
+    for item_type, payload, box_end in iter_boxes(buf, ilst[0], ilst[1]):
+        if item_type == b'\xa9day':
+            key = 'date'
+        elif keys:
+            index = struct.unpack('>I', item_type)[0]
+            if not 1 <= index <= len(keys):
+                continue
+            key = keys[index - 1]
+        else:
+            continue
+        if key in ('date', APPLE_CREATION_KEY) and key not in tags:
+            value = _data_box_value(buf, payload, box_end)
+            if value:
+                tags[key] = value
+
+
+def _read_udta(buf, start, end, tags):
+    for box_type, payload, box_end in iter_boxes(buf, start, end):
+        if box_type == b'\xa9day' and 'date' not in tags:
+            # QuickTime text atom: 2-byte length, 2-byte language, string
+            if box_end - payload >= 4:
+                length = struct.unpack_from('>H', buf, payload)[0]
+                value = bytes(buf[payload + 4:min(payload + 4 + length, box_end)])
+                tags['date'] = value.decode('utf-8', 'replace').strip('\x00')
+        elif box_type == b'meta':
+            _read_meta(buf, payload, box_end, tags)
+
+
+def read_mp4_tags(file_path):
+    """Return creation tags from moov, or None if the file isn't a parsable MP4/MOV.
+
+    Only box headers are touched on the way to moov, so a trailing moov is
+    found by hopping over mdat without reading any sample data.
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+        try:
+            moov = find_box(buf, 0, len(buf), b'moov')
+            if moov is None:
+                return None
+            # Box headers on the way are a few bytes; moov is what gets parsed
+            add_bytes_read(moov[1] - moov[0])
+
+            tags = {}
+            for box_type, payload, box_end in iter_boxes(buf, moov[0], moov[1]):
+                if box_type == b'mvhd':
+                    creation_time = _read_mvhd(buf, payload, box_end)
+                    if creation_time is not None:
+                        tags['creation_time'] = creation_time
+                elif box_type == b'udta':
+                    _read_udta(buf, payload, box_end, tags)
+                elif box_type == b'meta':
+                    _read_meta(buf, payload, box_end, tags)
+            return tags
+        finally:
+            buf.close()
+
+
+def parse_tag_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    value = value.strip()
+    for fmt in ['%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%SZ']:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        # Apple writes local time with an offset, e.g. 2023-05-01T12:34:56+0200;
+        # keep the local wall-clock time the clip was shot at.
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
@@ -0,0 +1,81 @@
+import re
+from datetime import datetime, timezone
+
+# PAVO's own names: <custom name>_<date taken>, plus _N when several files
+# would share a name (see pavo.core.format_new_name and Namespace)
+NAME_DATE_FORMAT = '%d-%m-%y_%H.%M.%S'
+PAVO_NAME = re.compile(r'^.+_(\d\d-\d\d-\d\d_\d\d\.\d\d\.\d\d)(?:_\d+)*\.[^.]+$')
+
+# Names that carry the capture time: (pattern, the time is UTC).
+# Groups are the date as YYYYMMDD and the time as HHMMSS.
+TIMESTAMP_NAMES = [
+    # Pixel: PXL_20230601_083015123.jpg, in UTC
+    (re.compile(r'^PXL_(\d{8})_(\d{6})'), True),
+    # Android and Samsung: IMG_20230601_083015.jpg, VID_..., PANO_..., BURST..._...
+    (re.compile(r'^(?:IMG|VID|PANO|BURST\d*|MVIMG)_(\d{8})_(\d{6})', re.IGNORECASE), False),
+    # Samsung camera: 20230601_083015.jpg
+    (re.compile(r'^(\d{8})_(\d{6})(?:\D|$)'), False),
+    # Screenshot_20230601-083015.png, Screenshot_20230601_083015.png
+    (re.compile(r'^Screenshot_(\d{8})[-_](\d{6})', re.IGNORECASE), False),
+]
+
+# Names with only the date: WhatsApp's IMG-20230601-WA0001.jpg, and
+# IMG_20230601.jpg from some apps
+DATE_NAMES = [
+    re.compile(r'^(?:IMG|VID|AUD|PTT)-(\d{8})-WA\d+', re.IGNORECASE),
+    re.compile(r'^(?:IMG|VID)_(\d{8})(?:\D|$)', re.IGNORECASE),
+]
+
+# GoPro names the clip's chapters GX01xxxx, GX02xxxx, ... (GH for H.264,
+# GOPR/GPnn before the HERO6) and holds no date in them; the low-res copy
+# beside each chapter swaps the X/H for L.
+GOPRO_NAME = re.compile(r'^G([XH])(\d\d\d{4})\.', re.IGNORECASE)
+
+
+def _parse(date, time='000000'):
+    try:
+        return datetime.strptime(date + time, '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+
+
+def parse_pavo_name(name):
+    """The date taken in a name PAVO gave a file, or None."""
+    match = PAVO_NAME.match(name)
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), NAME_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def parse_name_timestamp(name):
+    """The capture time in a camera or phone file name, or None."""
+    for pattern, utc in TIMESTAMP_NAMES:
+        match = pattern.match(name)
+        if match is None:
+            continue
+        dt = _parse(match.group(1), match.group(2))
+        if dt is not None and utc:
+            # The local time it was shot at, as EXIF would have it
+            dt = dt.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        return dt
+    return None
+
+
+def parse_name_date(name):
+    """The capture date (at midnight) in a file name that has no time, or None."""
+    for pattern in DATE_NAMES:
+        match = pattern.match(name)
+        if match is not None:
+            return _parse(match.group(1))
+    return None
+
+
+def gopro_low_res_name(name):
+    """GL01xxxx.LRV for GX01xxxx.MP4 and GH01xxxx.MP4; None for other names."""
+    match = GOPRO_NAME.match(name)
+    if match is None:
+        return None
+    return f"GL{match.group(2)}.LRV"
@@ -0,0 +1,171 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+# Bumped when records change meaning; older readers refuse newer plans
+PLAN_VERSION = 1
+
+PLAN_KINDS = ('rename', 'organize', 'import')
+
+
+def _relative(path, base):
+    # Paths under base are stored relative to it, so a plan still applies
+    # once the folders are mounted somewhere else; others stay absolute
+    path = os.fspath(path)
+    try:
+        relative = os.path.relpath(path, base)
+    except ValueError:
+        # Another drive, on Windows
+        return path
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+        return path
+    return relative
+
+
+class PlanEntry:
+    """One planned file: where it is, what it was when planned, and where it goes."""
+    __slots__ = ('src', 'dst', 'size', 'mtime_ns', 'ino', 'datetime', 'dt_source', 'link_to', 'duplicate_of',
+                 'stale')
+
+    def __init__(self, src, dst, size, mtime_ns, ino, dt, dt_source, link_to=None, duplicate_of=None):
+        self.src = src
+        self.dst = dst
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        self.datetime = dt
+        self.dt_source = dt_source
+        self.link_to = link_to
+        self.duplicate_of = duplicate_of
+        self.stale = None
+
+    def stale_reason(self, relocated=False):
+        """Why the source is no longer the file that was planned, or None.
+
+        One stat per file. Once the folders have moved (another machine,
+        another mount) inode numbers mean nothing and times are only
+        compared to the second, as filesystems keep them to different
+        precisions.
+        """
+        try:
+            stat = os.stat(self.src)
+        except FileNotFoundError:
+            return 'missing'
+        except OSError as e:
+            return str(e)
+        if stat.st_size != self.size:
+            return 'size changed'
+        if relocated:
+            if stat.st_mtime_ns // 1_000_000_000 != self.mtime_ns // 1_000_000_000:
+                return 'modified'
+        elif stat.st_mtime_ns != self.mtime_ns:
+            return 'modified'
+        elif stat.st_ino != self.ino:
+            return 'replaced'
+        return None
+
+
+class PlanFile:
+    """A saved rename, organize or import plan, applied later with 'pavo apply'.
+
+    JSON lines: a header, then one record per file with its size, mtime and
+    inode when planned, the date it was given and where it goes. Sources are
+    stored relative to the source folder and destinations relative to the
+    root (the folder renamed or organized, or the library imported into).
+    """
+
+    def __init__(self, path, kind, source, root, created=None, options=None):
+        self.path = Path(path)
+        self.kind = kind
+        self.source = Path(source)
+        self.root = Path(root)
+        self.created = created
+        self.options = options or {}
+
+    @classmethod
+    def write(cls, path, kind, source, root, items, **options):
+        """Save (src, dst, datetime, dt_source, link_to, duplicate_of) items.
+
+        The file is written beside path and renamed into place, so a plan
+        is never half there. Sources that have gone since planning are left
+        out. Returns the plan and the number of files in it.
+        """
+        if kind not in PLAN_KINDS:
+            raise ValueError(f"unknown plan kind {kind!r}")
+        source = os.path.abspath(source)
+        root = os.path.abspath(root)
+        plan = cls(path, kind, source, root, datetime.now(), options)
+        partial = plan.path.with_name(f".{plan.path.name}.part")
+        count = 0
+        try:
+            with open(partial, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'pavo_plan': PLAN_VERSION, 'kind': kind, 'source': source, 'root': root,
+                                    'created': plan.created.isoformat(), 'options': options}) + '\n')
+                for src, dst, dt, dt_source, link_to, duplicate_of in items:
+                    try:
+                        stat = os.stat(src)
+                    except OSError:
+                        continue
+                    record = {'src': _relative(src, source), 'dst': _relative(dst, root), 'size': stat.st_size,
+                              'mtime_ns': stat.st_mtime_ns, 'ino': stat.st_ino, 'datetime': dt.isoformat(),
+                              'source': dt_source}
+                    if link_to is not None:
+                        record['link_to'] = _relative(link_to, root)
+                    if duplicate_of is not None:
+                        record['duplicate_of'] = _relative(duplicate_of, root)
+                    f.write(json.dumps(record) + '\n')
+                    count += 1
+            os.replace(partial, plan.path)
+        except BaseException:
+            try:
+                os.unlink(partial)
+            except OSError:
+                pass
+            raise
+        return plan, count
+
+    @classmethod
+    def load(cls, path):
+        """The plan's header; entries() reads the files as they're needed."""
+        with open(path, encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+        if not isinstance(header, dict) or 'pavo_plan' not in header:
+            raise ValueError(f"{path} is not a PAVO plan file")
+        if header['pavo_plan'] > PLAN_VERSION or header.get('kind') not in PLAN_KINDS:
+            raise ValueError(f"{path} was written by a newer PAVO")
+        return cls(path, header['kind'], header['source'], header['root'],
+                   datetime.fromisoformat(header['created']), header.get('options'))
+
+    def entries(self, source=None, root=None):
+        """Yield a PlanEntry per file, reading the file as it goes.
+
+        source and root, when given, replace the folders the plan was made
+        in, e.g. the same share mounted on another machine.
+        """
+        source = os.fspath(source if source is not None else self.source)
+        root = os.fspath(root if root is not None else self.root)
+        with open(self.path, encoding='utf-8') as f:
+            f.readline()
+            for line_number, line in enumerate(f, 2):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    link_to = record.get('link_to')
+                    duplicate_of = record.get('duplicate_of')
+                    yield PlanEntry(Path(source, record['src']), Path(root, record['dst']), record['size'],
+                                    record['mtime_ns'], record['ino'], datetime.fromisoformat(record['datetime']),
+                                    record['source'], Path(root, link_to) if link_to is not None else None,
+                                    Path(root, duplicate_of) if duplicate_of is not None else None)
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"{self.path}, line {line_number}: {e}") from None
+
+    def describe(self):
+        created = f"{self.created:%Y-%m-%d %H:%M:%S} " if self.created else ''
+        if self.source != self.root:
+            return f"{created}{self.kind} {self.source} -> {self.root}"
+        return f"{created}{self.kind} {self.root}"
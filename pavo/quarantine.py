@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pavo.cache import get_cache_dir
+
+# Failed reads after which a file is no longer read
+QUARANTINE_AFTER = 2
+
+# Failure kinds: an extractor ran past its time budget, or couldn't read
+# the file (damaged, truncated, I/O error)
+TIMEOUT = 'timeout'
+ERROR = 'error'
+# What a quarantined file counts as when a scan skips it
+QUARANTINED = 'quarantined'
+
+FAILURE_LABELS = {TIMEOUT: 'timed out', ERROR: 'unreadable', QUARANTINED: 'quarantined'}
+
+
+def describe_failures(failures):
+    """'2 timed out, 1 unreadable' for a path -> failure kind mapping."""
+    counts = {}
+    for kind in failures.values():
+        counts[kind] = counts.get(kind, 0) + 1
+    return ', '.join(f"{counts[kind]} {label}" for kind, label in FAILURE_LABELS.items() if kind in counts)
+
+
+class Quarantine:
+    """Files whose dates could not be read, by identity.
+
+    Each failed read is counted; once a file has failed QUARANTINE_AFTER
+    times it is quarantined and later scans give it its file system time
+    without opening it, so a damaged card costs one slow scan, not every
+    scan. Files are known by device and inode rather than path, so one
+    that is renamed, organized or moved within its filesystem stays
+    quarantined; one that has changed (size or mtime) since it last failed
+    starts again from nothing. Quarantined files are held in memory, so
+    checking one is a dict lookup.
+    """
+
+    def __init__(self, path=None, threshold=QUARANTINE_AFTER):
+        self.path = Path(path) if path else get_cache_dir() / 'quarantine.sqlite3'
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS failures (
+                file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                failures INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                last REAL NOT NULL
+            )''')
+        self._conn.commit()
+        # file -> (size, mtime_ns, last known path) of every quarantined file
+        self._quarantined = {file: (size, mtime_ns, path) for file, size, mtime_ns, path in self._conn.execute(
+            'SELECT file, size, mtime_ns, path FROM failures WHERE failures >= ?', (threshold,))}
+
+    @staticmethod
+    def _key(file_path, stat):
+        # Where the filesystem has no inode numbers the path has to do
+        if stat.st_ino:
+            return f"{stat.st_dev}:{stat.st_ino}"
+        return os.path.abspath(file_path)
+
+    def __len__(self):
+        return len(self._quarantined)
+
+    def contains(self, file_path, stat):
+        key = self._key(file_path, stat)
+        entry = self._quarantined.get(key)
+        if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+            return False
+        path = os.path.abspath(file_path)
+        if entry[2] != path:
+            # Moved since it failed; listings show where it is now
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.execute('UPDATE failures SET path = ? WHERE file = ?', (path, key))
+                    self._conn.commit()
+                self._quarantined[key] = entry[:2] + (path,)
+        return True
+
+    def record(self, file_path, stat, kind, extractor=''):
+        """Count a failed read; True if the file is now quarantined."""
+        key = self._key(file_path, stat)
+        identity = (stat.st_size, stat.st_mtime_ns)
+        path = os.path.abspath(file_path)
+        with self._lock:
+            if self._conn is None:
+                return False
+            row = self._conn.execute('SELECT size, mtime_ns, failures FROM failures WHERE file = ?',
+                                     (key,)).fetchone()
+            failures = row[2] + 1 if row is not None and row[:2] == identity else 1
+            self._conn.execute('INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (key, *identity, path, failures, kind, extractor, time.time()))
+            self._conn.commit()
+            if failures >= self.threshold:
+                self._quarantined[key] = identity + (path,)
+                return True
+        return False
+
+    def entries(self):
+        """(path, failures, kind, extractor, last failed) of every file that
+        has failed, quarantined or not, most recent first."""
+        with self._lock:
+            return self._conn.execute('SELECT path, failures, kind, extractor, last FROM failures '
+                                      'ORDER BY last DESC').fetchall()
+
+    def release(self, paths=None):
+        """Forget the failures of paths (of every file when None); returns how many."""
+        with self._lock:
+            if paths is None:
+                released = self._conn.execute('DELETE FROM failures').rowcount
+                self._quarantined.clear()
+            else:
+                released = 0
+                for path in paths:
+                    path = os.path.abspath(path)
+                    keys = [key for key, in self._conn.execute('SELECT file FROM failures WHERE path = ?', (path,))]
+                    try:
+                        keys.append(self._key(path, os.stat(path)))
+                    except OSError:
+                        pass
+                    for key in set(keys):
+                        released += self._conn.execute('DELETE FROM failures WHERE file = ?', (key,)).rowcount
+                        self._quarantined.pop(key, None)
+            self._conn.commit()
+        return released
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,75 @@
+import os
+from fnmatch import fnmatch
+
+from pavo.metadata import SUPPORTED_EXTENSIONS
+
+# Hidden folders (.thumbnails, .Trash-1000, ...) are never worth descending into
+DEFAULT_EXCLUDE = ('.*',)
+
+
+class ScanEntry:
+    # A scanned file with the stat result scandir already fetched, so later
+    # stages don't have to stat it again.
+    __slots__ = ('path', 'name', 'suffix', 'stat')
+
+    def __init__(self, path, name, suffix, stat):
+        self.path = path
+        self.name = name
+        self.suffix = suffix
+        self.stat = stat
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"ScanEntry({self.path!r})"
+
+
+def _matches(name, rel_path, patterns):
+    return any(fnmatch(name, pattern) or fnmatch(rel_path, pattern) for pattern in patterns)
+
+
+def scan(folder, extensions=SUPPORTED_EXTENSIONS, recursive=False, include=None, exclude=DEFAULT_EXCLUDE):
+    """Yield a ScanEntry for every media file under folder as it is found.
+
+    exclude globs prune directories (matched against the directory name or
+    its '/'-separated path relative to folder). include globs, when given,
+    limit which directories' files are yielded, folder itself being '.';
+    traversal still continues through directories that don't match.
+    """
+    root = os.fspath(folder)
+    stack = [(root, '')]
+    while stack:
+        directory, rel_dir = stack.pop()
+        wanted = include is None or _matches(os.path.basename(rel_dir) or '.', rel_dir or '.', include)
+        subdirs = []
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                name = entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                            if not (exclude and _matches(name, rel_path, exclude)):
+                                subdirs.append((entry.path, rel_path))
+                        continue
+                    if not wanted:
+                        continue
+                    # Cheap string checks first; no Path objects for rejected entries
+                    dot = name.rfind('.')
+                    if dot <= 0:
+                        continue
+                    suffix = name[dot:].lower()
+                    if suffix not in extensions or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield ScanEntry(entry.path, name, suffix, stat)
+        # Depth-first, visiting sibling folders in name order
+        subdirs.sort(reverse=True)
+        stack.extend(subdirs)
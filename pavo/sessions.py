@@ -0,0 +1,121 @@
+import numpy as np
+
+TYPE_OTHER = 0
+TYPE_IMAGE = 1
+TYPE_VIDEO = 2
+
+TYPE_FOLDERS = {TYPE_IMAGE: 'Photos', TYPE_VIDEO: 'Videos'}
+
+MICROS_PER_MINUTE = 60_000_000
+
+# Log-spaced gap histogram edges, in minutes: 1 minute up to a week
+HISTOGRAM_EDGES = np.geomspace(1, 7 * 24 * 60, 25)
+
+
+class Grouping:
+    """Group keys for a sorted set of files under one set of options.
+
+    Keys are built on demand from a per-session prefix and the file type, so
+    regrouping a million files costs a few vectorised passes plus one string
+    per session rather than one per file.
+    """
+
+    def __init__(self, session_of, prefixes, type_codes, separate_by_type):
+        self.session_of = session_of
+        self.prefixes = prefixes
+        self.type_codes = type_codes
+        self.separate_by_type = separate_by_type
+
+    def __len__(self):
+        return len(self.session_of)
+
+    @property
+    def session_count(self):
+        return len(self.prefixes)
+
+    def key(self, i):
+        prefix = self.prefixes[self.session_of[i]]
+        if self.separate_by_type:
+            folder = TYPE_FOLDERS.get(int(self.type_codes[i]))
+            if folder:
+                prefix = f"{prefix}/{folder}" if prefix else folder
+        return prefix or 'All_Files'
+
+    def __getitem__(self, i):
+        return self.key(i)
+
+    def __iter__(self):
+        # Each distinct (session, type) key is built once and shared
+        codes = self.session_of * 3
+        if self.separate_by_type:
+            codes = codes + self.type_codes
+        keys = {}
+        for code, first in zip(*np.unique(codes, return_index=True)):
+            keys[int(code)] = self.key(int(first))
+        return map(keys.__getitem__, codes.tolist())
+
+
+class GapIndex:
+    """Sorted capture times with precomputed gaps between neighbouring files.
+
+    Any session threshold then maps to session boundaries with one
+    comparison over the gap array; date splits are a precomputed mask.
+    """
+
+    def __init__(self, datetimes, type_codes):
+        # datetimes must already be sorted ascending
+        self.stamps = np.array(datetimes, dtype='datetime64[us]')
+        self.micros = self.stamps.astype(np.int64)
+        self.days = self.stamps.astype('datetime64[D]')
+        self.gaps = np.diff(self.micros)
+        self.date_changes = self.days[1:] != self.days[:-1]
+        self.type_codes = np.asarray(type_codes, dtype=np.uint8)
+
+    @classmethod
+    def from_files(cls, table):
+        # table is a FileTable sorted by capture time
+        return cls(table.capture_times(), table.type_codes())
+
+    def __len__(self):
+        return len(self.micros)
+
+    def session_starts(self, threshold_minutes, separate_by_date=True, separate_by_session=True):
+        starts = np.zeros(len(self), dtype=bool)
+        if len(starts):
+            starts[0] = True
+        if separate_by_session:
+            starts[1:] |= self.gaps > threshold_minutes * MICROS_PER_MINUTE
+        if separate_by_date:
+            starts[1:] |= self.date_changes
+        return starts
+
+    def group(self, options):
+        starts = self.session_starts(options.time_gap_minutes, options.separate_by_date, options.separate_by_session)
+        session_of = np.cumsum(starts) - 1
+        first_files = np.flatnonzero(starts)
+
+        # Sessions are numbered from 1 within each date
+        session_days = self.days[first_files]
+        numbers = np.arange(len(first_files)) + 1
+        if options.separate_by_date and len(first_files):
+            new_day = np.ones(len(first_files), dtype=bool)
+            new_day[1:] = session_days[1:] != session_days[:-1]
+            day_start = np.maximum.accumulate(np.where(new_day, np.arange(len(first_files)), 0))
+            numbers = numbers - day_start
+
+        prefixes = []
+        for number, first in zip(numbers.tolist(), first_files.tolist()):
+            start = self.stamps[first].item()
+            parts = []
+            if options.separate_by_date:
+                parts.append(start.strftime('%Y-%m-%d'))
+            if options.separate_by_session:
+                parts.append(f"Session{number}_{start.strftime('%H.%M')}")
+            prefixes.append('/'.join(parts))
+
+        return Grouping(session_of, prefixes, self.type_codes, options.separate_by_type)
+
+    def gap_histogram(self, edges=HISTOGRAM_EDGES):
+        """Counts of gaps between consecutive files, bucketed by minutes."""
+        counts, _ = np.histogram(self.gaps / MICROS_PER_MINUTE, bins=edges)
+        return counts, edges
@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+import time
+
+from pavo.mp4meta import parse_tag_datetime
+from pavo.namemeta import gopro_low_res_name
+from pavo.stats import add_bytes_read
+
+# XMP packets are small; anything bigger is not a sidecar worth reading
+XMP_READ_SIZE = 256 * 1024
+
+# Most specific first, as with EXIF
+XMP_DATE_TAGS = ['exif:DateTimeOriginal', 'xmp:CreateDate', 'photoshop:DateCreated']
+XMP_DATE_PATTERNS = [re.compile(rf'{re.escape(tag)}\s*=\s*"([^"]+)"|<{re.escape(tag)}>([^<]+)</{re.escape(tag)}>')
+                     for tag in XMP_DATE_TAGS]
+
+
+# Folder listings are checked against the folder's mtime at most this
+# often, so a scan lists and stats each folder once rather than per file
+LISTING_CHECK_SECONDS = 2.0
+LISTING_CACHE_SIZE = 16
+
+# directory -> (checked at, mtime_ns, names by lower case)
+_listings = {}
+_listings_lock = threading.Lock()
+
+
+def _listing(directory):
+    now = time.monotonic()
+    entry = _listings.get(directory)
+    if entry is not None and now - entry[0] < LISTING_CHECK_SECONDS:
+        return entry[2]
+    try:
+        mtime_ns = os.stat(directory or '.').st_mtime_ns
+        if entry is not None and entry[1] == mtime_ns:
+            names = entry[2]
+        else:
+            names = {name.lower(): name for name in os.listdir(directory or '.')}
+    except OSError:
+        return {}
+    with _listings_lock:
+        _listings.pop(directory, None)
+        while len(_listings) >= LISTING_CACHE_SIZE:
+            # Oldest first; a scan is done with a folder before the next
+            del _listings[next(iter(_listings))]
+        _listings[directory] = (now, mtime_ns, names)
+    return names
+
+
+def find_sidecars(file_path, video=False):
+    """(kind, path) of the sidecars beside file_path, in the order to read them.
+
+    XMP sidecars are IMG_0001.JPG.xmp (darktable) or IMG_0001.xmp
+    (Lightroom). THM thumbnails and LRV low-res copies belong to videos only,
+    including GoPro's GL01xxxx.LRV for GX01xxxx.MP4.
+    """
+    directory, name = os.path.split(os.fspath(file_path))
+    names = _listing(directory)
+    stem = name.rsplit('.', 1)[0]
+    candidates = [('xmp', f"{name}.xmp"), ('xmp', f"{stem}.xmp")]
+    if video:
+        candidates += [('thm', f"{stem}.thm"), ('lrv', f"{stem}.lrv")]
+        low_res = gopro_low_res_name(name)
+        if low_res is not None:
+            candidates.append(('lrv', low_res))
+    found = []
+    for kind, candidate in candidates:
+        actual = names.get(candidate.lower())
+        if actual is not None:
+            found.append((kind, os.path.join(directory, actual)))
+    return found
+
+
+def read_xmp_date(file_path):
+    """The capture time in an XMP sidecar, as local wall-clock time, or None."""
+    with open(file_path, 'rb') as f:
+        data = f.read(XMP_READ_SIZE)
+    add_bytes_read(len(data))
+    text = data.decode('utf-8', errors='replace')
+    for pattern in XMP_DATE_PATTERNS:
+        match = pattern.search(text)
+        if match is not None:
+            dt = parse_tag_datetime(match.group(1) or match.group(2))
+            if dt is not None:
+                return dt
+    return None
@@ -0,0 +1,281 @@
+import cProfile
+import heapq
+import json
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from pavo.cache import get_cache_dir
+
+# Upper bounds (milliseconds) of the latency histogram buckets; anything
+# slower lands in a final overflow bucket
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+SLOWEST_FILES = 20
+
+# Exported runs kept in the stats folder
+KEEP_STATS = 50
+
+_trace = threading.local()
+
+
+# Tracing. Extractors call note_extractor() as they start and
+# add_bytes_read() for what they read, and note_failure() records a file that
+# defeated one; traced() collects all three for one call. Outside traced()
+# these do nothing. Works the same in worker processes,
+# whose traces come back with the results.
+
+def note_extractor(name):
+    steps = getattr(_trace, 'steps', None)
+    if steps is not None:
+        steps.append((name, time.perf_counter()))
+
+
+def add_bytes_read(count):
+    if getattr(_trace, 'steps', None) is not None:
+        _trace.bytes_read += count
+
+
+def note_failure(kind):
+    # Charged to the extractor that ran last
+    steps = getattr(_trace, 'steps', None)
+    if steps is not None:
+        _trace.failures.append((steps[-1][0] if steps else '', kind))
+
+
+def traced(func, *args):
+    """Call func(*args); returns (result, ((extractor, seconds), ...), bytes
+    read, ((extractor, failure kind), ...))."""
+    _trace.steps = []
+    _trace.bytes_read = 0
+    _trace.failures = []
+    try:
+        result = func(*args)
+    finally:
+        ended = time.perf_counter()
+        steps = _trace.steps
+        bytes_read = _trace.bytes_read
+        failures = tuple(_trace.failures)
+        _trace.steps = None
+    # Each extractor runs until the next one takes over
+    timings = tuple((name, (steps[i + 1][1] if i + 1 < len(steps) else ended) - started)
+                    for i, (name, started) in enumerate(steps))
+    return result, timings, bytes_read, failures
+
+
+class Histogram:
+    __slots__ = ('counts', 'calls', 'seconds')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        self.calls += 1
+        self.seconds += seconds
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            'calls': self.calls,
+            'seconds': round(self.seconds, 6),
+            'mean_ms': round(self.seconds * 1000 / self.calls, 3) if self.calls else None,
+            'histogram_ms': dict(zip(labels, self.counts)),
+        }
+
+
+def get_stats_dir():
+    stats_dir = get_cache_dir() / 'stats'
+    stats_dir.mkdir(parents=True, exist_ok=True)
+    return stats_dir
+
+
+class RunStats:
+    """Where the time went in one scan or apply.
+
+    Collects wall and CPU time per stage, per-extractor call counts and
+    latency histograms, how often each date source (and the caches)
+    answered, bytes read, files that couldn't be read, and the slowest
+    files. With profile, every stage
+    also runs under cProfile on the thread that entered it.
+    """
+
+    def __init__(self, label, profile=False, slowest=SLOWEST_FILES):
+        self.label = label
+        self.started = datetime.now()
+        self.profile = profile
+        self.slowest_count = slowest
+        self.stages = {}
+        self.extractors = {}
+        self.latency = Histogram()
+        self.sources = Counter()
+        self.lookups = Counter()
+        # (kind, extractor) -> files; see pavo.quarantine
+        self.failures = Counter()
+        self.files = 0
+        self.bytes_read = 0
+        self.slowest = []
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._profile_depth = Counter()
+
+    # Stages
+
+    @contextmanager
+    def stage(self, name):
+        profiler = self._start_profile() if self.profile else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+            if profiler is not None:
+                self._stop_profile(profiler)
+
+    def add_stage(self, name, seconds, cpu_seconds=0.0):
+        # CPU time is the whole process's, so it includes worker threads
+        # (but not worker processes) busy during the stage
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'cpu_seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['cpu_seconds'] += cpu_seconds
+
+    def _start_profile(self):
+        thread = threading.get_ident()
+        with self._lock:
+            profiler = self._profiles.get(thread)
+            if profiler is None:
+                profiler = self._profiles[thread] = cProfile.Profile()
+            self._profile_depth[thread] += 1
+            if self._profile_depth[thread] == 1:
+                profiler.enable()
+        return profiler
+
+    def _stop_profile(self, profiler):
+        thread = threading.get_ident()
+        with self._lock:
+            self._profile_depth[thread] -= 1
+            if self._profile_depth[thread] == 0:
+                profiler.disable()
+
+    # Extraction
+
+    def record_lookup(self, kind, dt_source):
+        """A file answered by the session index or the metadata cache."""
+        with self._lock:
+            self.files += 1
+            self.lookups[kind] += 1
+            self.sources[dt_source] += 1
+
+    def record_extraction(self, path, dt_source, timings, bytes_read=0):
+        """A file that was read; timings as returned by traced()."""
+        total = sum(seconds for _, seconds in timings)
+        with self._lock:
+            self.files += 1
+            self.lookups['extracted'] += 1
+            self.sources[dt_source] += 1
+            self.bytes_read += bytes_read
+            self.latency.add(total)
+            for name, seconds in timings:
+                histogram = self.extractors.get(name)
+                if histogram is None:
+                    histogram = self.extractors[name] = Histogram()
+                histogram.add(seconds)
+            entry = (total, os.fspath(path), '+'.join(name for name, _ in timings))
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, entry)
+            elif total > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def record_failure(self, kind, extractor=''):
+        """A file whose date couldn't be read, or that was quarantined."""
+        with self._lock:
+            self.failures[(kind, extractor)] += 1
+
+    # Reporting
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'label': self.label,
+                'started': self.started.isoformat(timespec='seconds'),
+                'files': self.files,
+                'bytes_read': self.bytes_read,
+                'stages': {name: {'calls': stage['calls'], 'seconds': round(stage['seconds'], 6),
+                                  'cpu_seconds': round(stage['cpu_seconds'], 6)}
+                           for name, stage in self.stages.items()},
+                'lookups': dict(self.lookups),
+                'sources': {source: {'files': count, 'share': round(count / self.files, 4)}
+                            for source, count in self.sources.most_common()},
+                'extractors': {name: histogram.to_dict() for name, histogram in self.extractors.items()},
+                'latency': self.latency.to_dict(),
+                'failures': [{'kind': kind, 'extractor': extractor, 'files': count}
+                             for (kind, extractor), count in self.failures.most_common()],
+                'slowest': [{'path': path, 'seconds': round(seconds, 6), 'extractors': extractors}
+                            for seconds, path, extractors in sorted(self.slowest, reverse=True)],
+            }
+
+    def summary(self):
+        """The stats as lines of text, for the stats panel and --stats."""
+        data = self.to_dict()
+        lines = [f"{data['label']} at {data['started']}: {data['files']} files, "
+                 f"{data['bytes_read'] / 1e6:.1f} MB read", '', "Stages:"]
+        for name, stage in data['stages'].items():
+            lines.append(f"  {name:<16}{stage['seconds']:>9.3f}s  {stage['cpu_seconds']:>9.3f}s cpu"
+                         f"  x{stage['calls']}")
+        if data['lookups']:
+            lines += ['', "Answered by: " + ", ".join(f"{kind} {count}" for kind, count in data['lookups'].items())]
+        if data['sources']:
+            lines += ['', "Date sources:"]
+            lines += [f"  {source:<16}{entry['files']:>9}  {entry['share']:>7.1%}"
+                      for source, entry in data['sources'].items()]
+        if data['extractors']:
+            lines += ['', "Extractors:"]
+            for name, entry in data['extractors'].items():
+                lines.append(f"  {name:<16}{entry['calls']:>9} calls  {entry['seconds']:>9.3f}s"
+                             f"  {entry['mean_ms']:>8.2f} ms mean")
+            lines += ['', "Latency per file (ms):"]
+            lines += [f"  {bucket:<10}{count:>9}" for bucket, count in data['latency']['histogram_ms'].items() if count]
+        if data['failures']:
+            lines += ['', "Unreadable files:"]
+            lines += [f"  {entry['kind']:<16}{entry['files']:>9}  {entry['extractor']}" for entry in data['failures']]
+        if data['slowest']:
+            lines += ['', "Slowest files:"]
+            lines += [f"  {entry['seconds'] * 1000:>9.1f} ms  {entry['extractors']:<18} {entry['path']}"
+                      for entry in data['slowest']]
+        return lines
+
+    def save(self, path=None):
+        """Write the stats as JSON (by default into the stats folder).
+
+        With profiling on, the merged profile is written beside it as .prof,
+        for pstats or snakeviz. Returns the JSON path.
+        """
+        if path is None:
+            path = get_stats_dir() / f"{self.started:%Y%m%d-%H%M%S-%f}-{self.label}.json"
+            prune_stats()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if self._profiles:
+            profile_path = os.path.splitext(os.fspath(path))[0] + '.prof'
+            pstats.Stats(*self._profiles.values()).dump_stats(profile_path)
+        return path
+
+
+def prune_stats(keep=KEEP_STATS):
+    paths = sorted(get_stats_dir().glob('*.json'))
+    for path in paths[:-keep]:
+        for stale in (path, path.with_suffix('.prof')):
+            try:
+                stale.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,342 @@
+import base64
+import io
+import os
+import queue
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import ExifTags, Image
+
+from pavo.cache import get_cache_dir
+from pavo.metadata import VIDEO_EXTENSIONS
+from pavo.sidecarmeta import find_sidecars
+
+THUMBNAIL_SIZE = (80, 60)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 4
+
+# Where in a clip the keyframe is taken from (the first second is often black)
+VIDEO_SEEK_SECONDS = 1
+FFMPEG_TIMEOUT = 20
+
+# IFD1 tags locating the JPEG thumbnail cameras embed in EXIF
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+TAG_ORIENTATION = 0x0112
+
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def embedded_thumbnail(img):
+    """The JPEG thumbnail stored in an image's EXIF block, as bytes, or None."""
+    exif_data = img.info.get('exif')
+    if not exif_data:
+        return None
+    try:
+        ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+    except Exception:
+        return None
+    offset = ifd1.get(TAG_THUMBNAIL_OFFSET)
+    length = ifd1.get(TAG_THUMBNAIL_LENGTH)
+    if not offset or not length:
+        return None
+    # Offsets count from the TIFF header, after the 'Exif\0\0' marker
+    if exif_data.startswith(b'Exif\x00\x00'):
+        exif_data = exif_data[6:]
+    data = exif_data[offset:offset + length]
+    if len(data) != length or not data.startswith(b'\xff\xd8'):
+        return None
+    return data
+
+
+def _fit(img, size, orientation):
+    # Scale into size as displayed, i.e. after the EXIF orientation is applied
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    box = (size[1], size[0]) if orientation in (5, 6, 7, 8) else size
+    img.thumbnail(box, reducing_gap=2.0)
+    img = img.convert('RGB')
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+
+def image_thumbnail(path, size=THUMBNAIL_SIZE):
+    """A thumbnail of an image file, decoding as little of it as possible.
+
+    JPEGs use the thumbnail embedded in their EXIF when it's big enough,
+    and are otherwise decoded with draft(), which scales by 1/2, 1/4 or 1/8
+    in the DCT and never builds the full-resolution image.
+    """
+    with Image.open(path) as img:
+        try:
+            orientation = img.getexif().get(TAG_ORIENTATION)
+        except Exception:
+            orientation = None
+        if img.format == 'JPEG':
+            data = embedded_thumbnail(img)
+            if data is not None:
+                try:
+                    with Image.open(io.BytesIO(data)) as embedded:
+                        if embedded.width >= size[0] or embedded.height >= size[1]:
+                            return _fit(embedded, size, orientation)
+                except Exception:
+                    pass
+            img.draft('RGB', size if orientation not in (5, 6, 7, 8) else (size[1], size[0]))
+        return _fit(img, size, orientation)
+
+
+def ffmpeg_keyframe(path, size=THUMBNAIL_SIZE):
+    """One keyframe of a video, decoded and scaled by ffmpeg, or None."""
+    width, height = size
+    for seek in (VIDEO_SEEK_SECONDS, 0):
+        command = ['ffmpeg', '-v', 'quiet', '-skip_frame', 'nokey']
+        if seek:
+            command += ['-ss', str(seek)]
+        command += ['-i', os.fspath(path), '-frames:v', '1',
+                    '-vf', f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+                    '-f', 'image2pipe', '-c:v', 'mjpeg', '-']
+        try:
+            result = subprocess.run(command, capture_output=True, timeout=FFMPEG_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode == 0 and result.stdout:
+            img = Image.open(io.BytesIO(result.stdout))
+            return img.convert('RGB')
+        # Clips shorter than the seek give nothing; try the first keyframe
+    return None
+
+
+def video_thumbnail(path, size=THUMBNAIL_SIZE):
+    # A camera's .THM sidecar is already a small JPEG of the clip
+    for kind, sidecar in find_sidecars(path, video=True):
+        if kind == 'thm':
+            try:
+                return image_thumbnail(sidecar, size)
+            except Exception:
+                pass
+    return ffmpeg_keyframe(path, size)
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    """JPEG bytes of a thumbnail fitting size, or b'' when none can be made."""
+    try:
+        if Path(path).suffix.lower() in VIDEO_EXTENSIONS:
+            img = video_thumbnail(path, size)
+        else:
+            img = image_thumbnail(path, size)
+    except Exception:
+        img = None
+    if img is None:
+        return b''
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def photo_image_data(data):
+    """Base64 PNG of JPEG thumbnail bytes, as tk.PhotoImage(data=...) takes it."""
+    with Image.open(io.BytesIO(data)) as img:
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class ThumbnailCache:
+    """Thumbnails on disk, keyed by path and size and checked against the
+    file's size, mtime and inode, so edited or replaced files get new ones.
+
+    Files no thumbnail could be made for are stored empty, so they aren't
+    retried on every scroll. Once the cache holds more than max_bytes the
+    least recently used thumbnails are dropped.
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 1024 * 1024, flush_every=200):
+        self.path = Path(path) if path else get_cache_dir() / 'thumbnails.sqlite3'
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._pending_writes = []
+        self._pending_touches = []
+        self._written_bytes = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                path TEXT NOT NULL,
+                box TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                bytes INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (path, box)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS thumbnails_accessed ON thumbnails (accessed)')
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def lookup(self, file_path, stat, box):
+        key = self._key(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, ino, data FROM thumbnails WHERE path = ? AND box = ?',
+                (key, box)).fetchone()
+            if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pending_touches.append((time.time(), key, box))
+            if len(self._pending_touches) >= self.flush_every:
+                self._flush_locked()
+        return row[3]
+
+    def store(self, file_path, stat, box, data):
+        with self._lock:
+            self._pending_writes.append((self._key(file_path), box, stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                                         data, len(data), time.time()))
+            self._written_bytes += len(data)
+            if len(self._pending_writes) >= self.flush_every:
+                self._flush_locked()
+            # Checking the total is a query, so only do it every so often
+            if self._written_bytes > self.max_bytes // 10:
+                self._evict_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._conn is None:
+            return
+        if self._pending_writes:
+            self._conn.executemany('INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   self._pending_writes)
+            self._pending_writes = []
+        if self._pending_touches:
+            self._conn.executemany('UPDATE thumbnails SET accessed = ? WHERE path = ? AND box = ?',
+                                   self._pending_touches)
+            self._pending_touches = []
+        self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self):
+        # Least recently used first, down to 90% of max_bytes so the next
+        # few stores don't each trigger another eviction
+        self._flush_locked()
+        self._written_bytes = 0
+        total = self._conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM thumbnails').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - self.max_bytes * 9 // 10
+        doomed = []
+        for rowid, size in self._conn.execute('SELECT rowid, bytes FROM thumbnails ORDER BY accessed'):
+            doomed.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany('DELETE FROM thumbnails WHERE rowid = ?', doomed)
+        self._conn.commit()
+        return len(doomed)
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.evict()
+        self._conn.close()
+        self._conn = None
+
+
+class ThumbnailLoader:
+    """Makes thumbnails on a few worker threads, only for files still wanted.
+
+    request() replaces the wanted set with the rows on screen. Files that
+    were queued but have since scrolled away are dropped when a worker gets
+    to them, so scrolling through a long list only decodes where it stops.
+    Finished thumbnails are collected with results() as (path, data), data
+    being base64 PNG for tk.PhotoImage or None when the file has none.
+    """
+
+    def __init__(self, cache=None, size=THUMBNAIL_SIZE, max_workers=None):
+        self.cache = cache
+        self.size = size
+        self.box = f"{size[0]}x{size[1]}"
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or min(THUMBNAIL_WORKERS, os.cpu_count() or 1),
+                                        thread_name_prefix='pavo-thumbnail')
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._queued = set()
+        self._results = queue.Queue()
+
+    def request(self, paths):
+        paths = [os.fspath(path) for path in paths]
+        with self._lock:
+            self._wanted = set(paths)
+            new = [path for path in paths if path not in self._queued]
+            self._queued.update(new)
+        for path in new:
+            self._pool.submit(self._load, path)
+
+    def _load(self, path):
+        with self._lock:
+            if path not in self._wanted:
+                self._queued.discard(path)
+                return
+        data = self.thumbnail(path)
+        try:
+            image_data = photo_image_data(data) if data else None
+        except Exception:
+            image_data = None
+        with self._lock:
+            self._queued.discard(path)
+        self._results.put((path, image_data))
+
+    def thumbnail(self, path):
+        """JPEG bytes of path's thumbnail (b'' for none), from the cache when it has them."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return b''
+        if self.cache is not None:
+            data = self.cache.lookup(path, stat, self.box)
+            if data is not None:
+                return data
+        data = make_thumbnail(path, self.size)
+        if self.cache is not None:
+            self.cache.store(path, stat, self.box, data)
+        return data
+
+    def results(self):
+        finished = []
+        try:
+            while True:
+                finished.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return finished
+
+    def shutdown(self):
+        # Queued files are dropped; only the ones being decoded are waited for
+        self._pool.shutdown(wait=True, cancel_futures=True)
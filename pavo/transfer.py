@@ -0,0 +1,151 @@
+import errno
+import hashlib
+import mmap
+import os
+import shutil
+
+# Bytes handed to the kernel (or read into the buffer) per call
+COPY_CHUNK = 8 * 1024 * 1024
+
+# Errors meaning "this copy call doesn't work for these two files", after
+# which the next method down is tried
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+
+
+class VerificationError(OSError):
+    pass
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+
+def _kernel_copy(copy_call, src_fd, dst_fd, view, hasher, size):
+    # Copies with the kernel moving the data; the checksum is taken from the
+    # source's mapping, whose pages the copy has just brought into the cache
+    offset = 0
+    while offset < size:
+        copied = copy_call(src_fd, dst_fd, min(COPY_CHUNK, size - offset))
+        if copied == 0:
+            break
+        if hasher is not None:
+            hasher.update(view[offset:offset + copied])
+        offset += copied
+    return offset
+
+
+def _buffered_copy(fsrc, fdst, hasher):
+    buffer = bytearray(COPY_CHUNK)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        n = fsrc.readinto(buffer)
+        if not n:
+            return total
+        if hasher is not None:
+            hasher.update(view[:n])
+        fdst.write(view[:n])
+        total += n
+
+
+def _copy_file_range(src_fd, dst_fd, count):
+    return os.copy_file_range(src_fd, dst_fd, count)
+
+
+def _sendfile(src_fd, dst_fd, count):
+    return os.sendfile(dst_fd, src_fd, None, count)
+
+
+def copy_data(fsrc, fdst, size, hasher=None):
+    """Copy an open file's contents, fastest method first.
+
+    copy_file_range lets the filesystem clone or copy server-side, sendfile
+    keeps the data in the kernel, and a large buffer is the portable
+    fallback. Returns the number of bytes copied.
+    """
+    src_fd = fsrc.fileno()
+    dst_fd = fdst.fileno()
+    view = None
+    mapping = None
+    try:
+        if hasher is not None and size:
+            mapping = mmap.mmap(src_fd, 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapping)
+        for name, copy_call in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile)):
+            if not hasattr(os, name):
+                continue
+            try:
+                copied = _kernel_copy(copy_call, src_fd, dst_fd, view, hasher, size)
+            except OSError as e:
+                # Only safe to fall back if nothing was written yet
+                if e.errno not in UNSUPPORTED_ERRORS or os.lseek(dst_fd, 0, os.SEEK_CUR) != 0:
+                    raise
+                continue
+            # Some filesystems report end of file early; read the rest
+            if copied < size:
+                copied += _buffered_copy(fsrc, fdst, hasher)
+            return copied
+        return _buffered_copy(fsrc, fdst, hasher)
+    finally:
+        if view is not None:
+            view.release()
+        if mapping is not None:
+            mapping.close()
+
+
+def file_digest(path, drop_cache=False):
+    """BLAKE2b digest of a file's contents. With drop_cache its pages are
+    first dropped from the page cache where the OS allows, so a file just
+    written and synced is read back from the disk."""
+    hasher = new_hasher()
+    buffer = bytearray(COPY_CHUNK)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.digest()
+
+
+def copy_file(src, dst, verify=True, read_back=False):
+    """Copy src to dst with its timestamps, returning the content checksum.
+
+    With verify, a BLAKE2b checksum of the source is computed while the
+    data is copied, in the same pass, and the copy is flushed to disk; the
+    source is checked not to have changed underneath it. read_back also
+    reads the copy back from the disk and compares its checksum, for when
+    the source is about to be deleted. Any mismatch raises
+    VerificationError and removes the copy. Without verify, returns None.
+    """
+    hasher = new_hasher() if verify else None
+    with open(src, 'rb') as fsrc:
+        # 'x' never replaces an existing file; everything after this point
+        # removes the partial copy if it fails
+        fdst = open(dst, 'xb')
+        try:
+            with fdst:
+                before = os.fstat(fsrc.fileno())
+                copied = copy_data(fsrc, fdst, before.st_size, hasher)
+                if verify:
+                    fdst.flush()
+                    os.fsync(fdst.fileno())
+                    after = os.stat(src)
+                    written = os.fstat(fdst.fileno()).st_size
+                    if copied != before.st_size or written != before.st_size:
+                        raise VerificationError(f"{os.path.basename(src)}: copied {written} of {before.st_size} bytes")
+                    if after.st_size != before.st_size or after.st_mtime_ns != before.st_mtime_ns:
+                        raise VerificationError(f"{os.path.basename(src)}: file changed while it was being copied")
+                    if read_back and file_digest(dst, drop_cache=True) != hasher.digest():
+                        raise VerificationError(f"{os.path.basename(src)}: copy differs from the original")
+            shutil.copystat(src, dst)
+        except BaseException:
+            try:
+                os.unlink(dst)
+            except OSError:
+                pass
+            raise
+    return hasher.hexdigest() if hasher is not None else None
@@ -0,0 +1,286 @@
+import time
+import tkinter as tk
+from collections.abc import Sequence
+from tkinter import ttk
+
+# Rough pixel height of the Treeview heading row
+HEADING_HEIGHT = 25
+
+
+class VirtualTable(ttk.Frame):
+    """A Treeview that keeps its rows in Python and only shows a window.
+
+    Only the rows that fit on screen (plus a small margin) exist as Tk items;
+    scrolling rewrites their values in place. Large row sets can be added in
+    chunks from after() callbacks so they appear while work is still running.
+    """
+
+    def __init__(self, parent, columns, height=15, margin=2, chunk_size=5000, chunk_delay=20):
+        super().__init__(parent)
+        self.columns = [key for key, _, _ in columns]
+        self.headings = {key: heading for key, heading, _ in columns}
+        self.margin = margin
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+
+        self.rows = []
+        self.view = []
+        self.offset = 0
+        self.visible = height
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_func = None
+        # Returns the image for a row index when the image column is shown
+        self.image_func = None
+
+        self._pending_rows = []
+        self._flush_scheduled = False
+        self._refresh_scheduled = False
+        self._view_dirty = False
+        self._selected_row = None
+        # A pavo.stats.RunStats that redraw times are added to, when set
+        self.stats = None
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show='headings', height=height, selectmode='browse')
+        for key, heading, width in columns:
+            self.tree.heading(key, text=heading, command=lambda k=key: self.sort_by(k))
+            self.tree.column(key, width=width)
+
+        self.v_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        h_scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscrollcommand=h_scrollbar.set)
+
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+
+        self.tree.bind('<Configure>', self._on_configure)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll_event(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_event(3))
+        self.tree.bind('<Prior>', lambda e: self._scroll_event(-self.visible))
+        self.tree.bind('<Next>', lambda e: self._scroll_event(self.visible))
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+
+    def show_images(self, image_func, width=0, row_height=None):
+        """Show image_func(row index) in a column before the others, or hide it with None.
+
+        Only rows on screen are asked for, whenever the table redraws.
+        """
+        self.image_func = image_func
+        if image_func is None:
+            self.tree.configure(show='headings', style='Treeview')
+            for iid in self.tree.get_children():
+                self.tree.item(iid, image='')
+        else:
+            style = f"Images{row_height}.Treeview"
+            ttk.Style().configure(style, rowheight=row_height)
+            self.tree.configure(show='tree headings', style=style)
+            self.tree.column('#0', width=width, minwidth=width, stretch=False)
+        self._set_visible(self.tree.winfo_height())
+        self.refresh()
+
+    # Row management
+
+    def __len__(self):
+        return len(self.rows)
+
+    def set_rows(self, rows, keep_position=False):
+        # Sequences (including lazy ones that build rows on demand) are used
+        # as they are; anything else is materialised into a list
+        self._pending_rows = []
+        self.rows = rows if isinstance(rows, Sequence) else list(rows)
+        if not keep_position:
+            self._selected_row = None
+            self.offset = 0
+        self._rebuild_view()
+        self.refresh()
+
+    def append_rows(self, rows):
+        self._pending_rows.extend(rows)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.after(self.chunk_delay, self._flush_pending)
+
+    def _flush_pending(self):
+        self._flush_scheduled = False
+        chunk = self._pending_rows[:self.chunk_size]
+        del self._pending_rows[:self.chunk_size]
+        start = len(self.rows)
+        self.rows.extend(chunk)
+        if self.filter_func is None and self.sort_column is None:
+            self.view.extend(range(start, len(self.rows)))
+        else:
+            self._view_dirty = True
+        self.schedule_refresh()
+        if self._pending_rows:
+            self._flush_scheduled = True
+            self.after(self.chunk_delay, self._flush_pending)
+
+    def update_row(self, index, values):
+        self.rows[index] = values
+        if self.filter_func is not None:
+            self._view_dirty = True
+        self.schedule_refresh()
+
+    def clear(self):
+        self.set_rows([])
+
+    # Sorting and filtering
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        for key in self.columns:
+            text = self.headings[key]
+            if key == column:
+                text += ' ▼' if self.sort_reverse else ' ▲'
+            self.tree.heading(key, text=text)
+        self._rebuild_view()
+        self.refresh()
+
+    def resort(self):
+        if self.sort_column is not None or self.filter_func is not None:
+            self._rebuild_view()
+            self.refresh()
+
+    def set_filter(self, filter_func):
+        self.filter_func = filter_func
+        self.offset = 0
+        self._rebuild_view()
+        self.refresh()
+
+    def _rebuild_view(self):
+        self._view_dirty = False
+        rows = self.rows
+        if self.filter_func is None:
+            view = list(range(len(rows)))
+        else:
+            view = [i for i, row in enumerate(rows) if self.filter_func(row)]
+        if self.sort_column is not None:
+            col = self.columns.index(self.sort_column)
+            view.sort(key=lambda i: str(rows[i][col]), reverse=self.sort_reverse)
+        self.view = view
+
+    # Display
+
+    def visible_rows(self):
+        end = min(len(self.view), self.offset + self.visible + self.margin)
+        return [self.view[i] for i in range(self.offset, end)]
+
+    def selected_row(self):
+        return self._selected_row
+
+    def _on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            position = self.offset + int(selection[0])
+            if position < len(self.view):
+                self._selected_row = self.view[position]
+
+    def schedule_refresh(self):
+        if not self._refresh_scheduled:
+            self._refresh_scheduled = True
+            self.after_idle(self.refresh)
+
+    def refresh(self):
+        if self.stats is None:
+            self._refresh()
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self._refresh()
+        self.stats.add_stage('table_refresh', time.perf_counter() - wall, time.process_time() - cpu)
+
+    def _refresh(self):
+        self._refresh_scheduled = False
+        if self._view_dirty:
+            self._rebuild_view()
+
+        total = len(self.view)
+        max_offset = max(0, total - self.visible)
+        self.offset = max(0, min(self.offset, max_offset))
+
+        # Items are named by their slot in the window, not by row, so
+        # scrolling only rewrites values and never inserts or deletes.
+        slots = self.visible + self.margin
+        existing = set(self.tree.get_children())
+        for slot in range(slots):
+            iid = str(slot)
+            position = self.offset + slot
+            if position < total:
+                row = self.view[position]
+                options = {'values': self.rows[row]}
+                if self.image_func is not None:
+                    options['image'] = self.image_func(row)
+                if iid in existing:
+                    self.tree.item(iid, **options)
+                else:
+                    self.tree.insert('', 'end', iid=iid, **options)
+            elif iid in existing:
+                self.tree.delete(iid)
+        for iid in existing:
+            if int(iid) >= slots:
+                self.tree.delete(iid)
+
+        # Keep the selection on the same row rather than the same slot
+        selected = None
+        if self._selected_row is not None:
+            for slot in range(min(slots, total - self.offset)):
+                if self.view[self.offset + slot] == self._selected_row:
+                    selected = str(slot)
+                    break
+        if selected is None:
+            if self.tree.selection():
+                self.tree.selection_set(())
+        elif self.tree.selection() != (selected,):
+            self.tree.selection_set(selected)
+
+        if total:
+            self.v_scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+        else:
+            self.v_scrollbar.set(0.0, 1.0)
+        self.event_generate('<<TableRefreshed>>')
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.refresh()
+
+    def yview(self, *args):
+        total = len(self.view)
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible
+            self.offset += amount
+        self.refresh()
+
+    def _scroll_event(self, rows):
+        self.scroll(rows)
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        return self._scroll_event(-3 if event.delta > 0 else 3)
+
+    def _on_configure(self, event):
+        if self._set_visible(event.height):
+            self.refresh()
+
+    def _set_visible(self, height):
+        # True when the number of rows that fit in height has changed
+        if height <= 1:
+            return False
+        row_height = ttk.Style().lookup(self.tree.cget('style') or 'Treeview', 'rowheight') or 20
+        visible = max(1, (height - HEADING_HEIGHT) // int(row_height))
+        if visible == self.visible:
+            return False
+        self.visible = visible
+        return True
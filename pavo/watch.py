@@ -0,0 +1,409 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+from pavo import core
+from pavo.dedupe import DuplicateFinder
+from pavo.filetable import FileTable
+from pavo.journal import Journal, prune_journals
+from pavo.library import SessionIndex
+from pavo.metadata import SUPPORTED_EXTENSIONS
+from pavo.mover import MoveScheduler
+from pavo.quarantine import describe_failures
+from pavo.scanner import DEFAULT_EXCLUDE, scan
+
+# A file is ready once its size and mtime stop changing and it hasn't been
+# written to for this long
+SETTLE_SECONDS = 2.0
+
+# Ready files are batched until none have arrived for DEBOUNCE_SECONDS,
+# the batch is MAX_BATCH files, or its oldest file has waited MAX_WAIT_SECONDS
+DEBOUNCE_SECONDS = 2.0
+MAX_BATCH = 2000
+MAX_WAIT_SECONDS = 30.0
+
+# How often the loop wakes to check pending files, and how often the
+# polling watcher rescans
+TICK_SECONDS = 0.5
+POLL_INTERVAL = 2.0
+
+# Old journals are pruned when watching starts and then this often, rather
+# than re-read for every batch
+PRUNE_SECONDS = 3600.0
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+
+def _excluded(name, exclude):
+    return any(fnmatch(name, pattern) for pattern in exclude)
+
+
+def _is_media(name):
+    dot = name.rfind('.')
+    return dot > 0 and name[dot:].lower() in SUPPORTED_EXTENSIONS
+
+
+# Watchers
+
+class PollingWatcher:
+    """Finds new and changed files by rescanning the folder every few seconds.
+
+    Works everywhere, including network shares where inotify sees nothing.
+    Only the files currently in the folder are remembered.
+    """
+
+    def __init__(self, root, exclude=DEFAULT_EXCLUDE, interval=POLL_INTERVAL):
+        self.root = os.fspath(root)
+        self.exclude = exclude
+        self.interval = interval
+        self._snapshot = {}
+        self._next_poll = 0.0
+
+    def initial(self):
+        return self._poll()
+
+    def changes(self, timeout):
+        now = time.monotonic()
+        if now < self._next_poll:
+            time.sleep(min(timeout, self._next_poll - now))
+            if time.monotonic() < self._next_poll:
+                return []
+        return self._poll()
+
+    def _poll(self):
+        self._next_poll = time.monotonic() + self.interval
+        snapshot = {entry.path: (entry.stat.st_size, entry.stat.st_mtime_ns)
+                    for entry in scan(self.root, recursive=True, exclude=self.exclude)}
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        self._snapshot = {}
+
+
+class InotifyWatcher:
+    """Linux inotify through ctypes, watching every folder under root.
+
+    New folders are watched as they appear and scanned once, so files
+    written before the watch was in place aren't missed. If the kernel's
+    event queue overflows, the whole tree is rescanned.
+    """
+
+    def __init__(self, root, exclude=DEFAULT_EXCLUDE):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        self.root = os.fspath(root)
+        self.exclude = exclude
+        self._directories = {}
+
+    def initial(self):
+        return self._watch_tree(self.root)
+
+    def _watch_tree(self, top):
+        # Watch top and every folder below it, returning the media files found
+        found = []
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "inotify watch limit reached (fs.inotify.max_user_watches)")
+                continue
+            self._directories[wd] = directory
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _excluded(entry.name, self.exclude):
+                                stack.append(entry.path)
+                        elif _is_media(entry.name) and entry.is_file():
+                            found.append(entry.path)
+            except OSError:
+                continue
+        return found
+
+    def changes(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, EVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.extend(self._watch_tree(self.root))
+                    continue
+                if mask & IN_IGNORED:
+                    self._directories.pop(wd, None)
+                    continue
+                directory = self._directories.get(wd)
+                if directory is None or not name:
+                    continue
+                name = os.fsdecode(name)
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not _excluded(name, self.exclude):
+                        changed.extend(self._watch_tree(path))
+                elif _is_media(name):
+                    changed.append(path)
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._directories = {}
+
+
+def make_watcher(root, exclude=DEFAULT_EXCLUDE, poll=False):
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, exclude)
+        except (OSError, AttributeError):
+            # No inotify in this libc or kernel
+            pass
+    return PollingWatcher(root, exclude)
+
+
+# Settling and batching
+
+class Settler:
+    """Holds files until they've stopped being written."""
+
+    def __init__(self, settle_seconds=SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path):
+        # A file seen again starts over; it's still being written
+        self._pending[path] = None
+
+    def ready(self):
+        """Files whose size and mtime were the same at the last two checks,
+        and that haven't been modified for settle_seconds."""
+        ready = []
+        now = time.time()
+        for path, last in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if state == last and now - stat.st_mtime >= self.settle_seconds:
+                del self._pending[path]
+                ready.append(path)
+            else:
+                self._pending[path] = state
+        return ready
+
+
+class Batcher:
+    """Collects ready files into debounced batches."""
+
+    def __init__(self, debounce_seconds=DEBOUNCE_SECONDS, max_batch=MAX_BATCH, max_wait=MAX_WAIT_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._files = []
+        self._first = None
+        self._last = None
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, paths, now):
+        if not paths:
+            return
+        if not self._files:
+            self._first = now
+        self._files.extend(paths)
+        self._last = now
+
+    def take(self, now):
+        if not self._files:
+            return []
+        if (now - self._last < self.debounce_seconds and len(self._files) < self.max_batch
+                and now - self._first < self.max_wait):
+            return []
+        batch = self._files[:self.max_batch]
+        del self._files[:self.max_batch]
+        self._first = self._last = now if self._files else None
+        return batch
+
+
+# The daemon
+
+class WatchDaemon:
+    """Organizes files into a library as they arrive in a drop folder.
+
+    Files are picked up once writes have settled, gathered into debounced
+    batches, and only the batch's files are read; they then join existing
+    session folders or start new ones, and are moved (and optionally
+    renamed) with a journal per batch, so every batch can be undone like an
+    organize. Memory stays flat: only files still in the drop folder and a
+    bounded window of library days are tracked.
+    """
+
+    def __init__(self, folder, destination, options, engine, custom_name=None, duplicate_action='keep',
+                 poll=False, settle_seconds=SETTLE_SECONDS, debounce_seconds=DEBOUNCE_SECONDS,
+                 exclude=DEFAULT_EXCLUDE, report=None, catalog=None):
+        self.folder = Path(folder).resolve()
+        self.destination = Path(destination).resolve()
+        if self.destination == self.folder or self.folder in self.destination.parents:
+            raise ValueError("The library folder can't be the watched folder or inside it")
+        self.options = options
+        self.engine = engine
+        self.custom_name = custom_name
+        self.duplicate_action = duplicate_action
+        self.watcher = make_watcher(self.folder, exclude, poll)
+        self.settler = Settler(settle_seconds)
+        self.batcher = Batcher(debounce_seconds)
+        self.catalog = catalog
+        self.sessions = SessionIndex(self.destination, options, engine, catalog)
+        self.scheduler = MoveScheduler()
+        self.report = report or (lambda message: None)
+        self.files_done = 0
+        self.batches = 0
+        self._stop = threading.Event()
+
+    @property
+    def mode(self):
+        return 'inotify' if isinstance(self.watcher, InotifyWatcher) else 'polling'
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        next_prune = 0.0
+        try:
+            for path in self.watcher.initial():
+                self.settler.add(path)
+            while not self._stop.is_set():
+                if time.monotonic() >= next_prune:
+                    prune_journals()
+                    next_prune = time.monotonic() + PRUNE_SECONDS
+                for path in self.watcher.changes(TICK_SECONDS):
+                    self.settler.add(path)
+                now = time.monotonic()
+                if len(self.settler):
+                    self.batcher.add(self.settler.ready(), now)
+                batch = self.batcher.take(now)
+                if batch:
+                    self.process_batch(batch)
+        finally:
+            self.watcher.close()
+
+    def _find_duplicates(self, table):
+        # Only the library days the batch lands in are compared against, so a
+        # batch costs the same however big the library grows
+        existing = []
+        days = {table.datetime(i).date() if self.options.separate_by_date else None for i in range(len(table))}
+        for day in days:
+            directory = self.sessions.day_folder(day)
+            if os.path.isdir(directory):
+                existing.extend((Path(entry.path), entry.stat.st_size) for entry in scan(directory, recursive=True))
+        candidates = []
+        for file_path in table.paths():
+            try:
+                candidates.append((file_path, os.stat(file_path).st_size))
+            except OSError:
+                candidates.append((file_path, 0))
+        return DuplicateFinder().find(candidates, existing)
+
+    def process_batch(self, paths):
+        """Read, group and move one batch; returns the number of errors."""
+        started = time.monotonic()
+        failures = self.engine.failures if self.engine is not None else {}
+        # Only this batch's files are reported, and the daemon's memory stays flat
+        failures.clear()
+        table = FileTable.from_extracted(core.extract_datetimes([Path(path) for path in paths], self.engine))
+        if not len(table):
+            return 0
+        table.sort_by_capture()
+        grouping = self.sessions.assign(table)
+
+        duplicates = self._find_duplicates(table) if self.duplicate_action != 'keep' else None
+        skip = duplicates if self.duplicate_action == 'skip' and duplicates else ()
+        renamed = core.resolve_destination_names(table, grouping, self.destination,
+                                                 custom_name=self.custom_name, skip=skip)
+        plan = core.plan_from_grouping(table, grouping, self.destination, renamed, self.custom_name,
+                                       duplicates, self.duplicate_action)
+
+        journal = Journal.create('organize', self.destination, prune=False, source=str(self.folder), watch=True)
+        ops = ((item, item['file_info']['path'], item['destination'], item.get('link_to')) for item in plan)
+        cache = self.engine.cache if self.engine is not None else None
+        errors = []
+        moved = 0
+        folders = set()
+        catalogued = []
+        moves = []
+        for item, new_path, error in self.scheduler.run(ops, journal):
+            if error:
+                errors.append(f"{item['file_info']['path'].name}: {error}")
+                continue
+            moved += 1
+            folders.add(new_path.parent)
+            catalogued.append((new_path, item['file_info']['datetime'], item['file_info']['dt_source']))
+            moves.append((item['file_info']['path'], new_path))
+        if cache is not None:
+            # Keeps the library's dates answerable from the cache
+            cache.moved(moves)
+        if self.catalog is not None:
+            self.catalog.record(self.destination, catalogued)
+
+        self.batches += 1
+        self.files_done += moved
+        skipped = len(skip)
+        message = (f"Batch {self.batches}: moved {moved} files into {len(folders)} folders "
+                   f"in {time.monotonic() - started:.1f}s")
+        if skipped:
+            message += f", {skipped} duplicates left in place"
+        if failures:
+            message += f", {len(failures)} without readable metadata ({describe_failures(failures)})"
+        if errors:
+            message += f", {len(errors)} failed"
+        self.report(message)
+        for error in errors[:10]:
+            self.report(f"  {error}")
+        return len(errors)
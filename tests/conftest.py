@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Journals, caches and the quarantine list stay inside the test's folder
+    path = tmp_path / 'cache'
+    path.mkdir()
+    monkeypatch.setenv('PAVO_CACHE_DIR', str(path))
+    return path
@@ -0,0 +1,55 @@
+import hashlib
+import os
+from collections import Counter
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import compare, parse_size, run_benchmark
+from pavo.metadata import get_metadata_datetime
+
+
+def digest_tree(root):
+    hasher = hashlib.sha256()
+    for folder, _, names in sorted(os.walk(root)):
+        for name in sorted(names):
+            path = os.path.join(folder, name)
+            hasher.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as f:
+                hasher.update(f.read())
+            hasher.update(str(os.stat(path).st_mtime_ns).encode())
+    return hasher.hexdigest()
+
+
+def test_corpus_is_reproducible(tmp_path):
+    first = generate_corpus(tmp_path / 'a', 200, seed=3)
+    second = generate_corpus(tmp_path / 'b', 200, seed=3)
+    assert first == second and first['kinds']['burst']
+    assert digest_tree(tmp_path / 'a') == digest_tree(tmp_path / 'b')
+    generate_corpus(tmp_path / 'c', 200, seed=4)
+    assert digest_tree(tmp_path / 'a') != digest_tree(tmp_path / 'c')
+
+
+def test_corpus_dates_read_back(tmp_path):
+    corpus = generate_corpus(tmp_path, 100)
+    sources = Counter()
+    for folder, _, names in os.walk(tmp_path):
+        for name in names:
+            sources[get_metadata_datetime(os.path.join(folder, name))[1]] += 1
+    kinds = corpus['kinds']
+    assert sources['EXIF'] == kinds['jpeg'] + kinds['burst']
+    assert sources['Metadata'] == kinds['mp4'] + kinds['mov']
+
+
+def test_every_stage_is_timed(tmp_path):
+    run = run_benchmark(parse_size('60'))
+    assert run['files'] == 60
+    assert {'scan', 'extract', 'rename_apply', 'organize_apply'} <= set(run['stages'])
+    assert all(stage['seconds'] >= 0 for stage in run['stages'].values())
+    assert os.environ['PAVO_CACHE_DIR'] == str(tmp_path / 'cache')
+
+
+def test_compare_flags_slower_stages():
+    def results(seconds):
+        return {'runs': [{'files': 1000, 'stages': {'extract': {'seconds': seconds}}}]}
+    assert compare(results(1.0), results(1.0)) == 0
+    assert compare(results(2.0), results(1.0)) == 1
+    assert compare(results(0.5), results(1.0)) == 0
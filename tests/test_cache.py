@@ -0,0 +1,84 @@
+import os
+from datetime import datetime
+
+from pavo.cache import MetadataCache
+
+DT = datetime(2023, 6, 1, 8, 30, 15, 120000)
+
+
+def make_file(folder, name, content=b'photo'):
+    path = folder / name
+    path.write_bytes(content)
+    return path
+
+
+def test_dates_survive_reopening(tmp_path):
+    path = make_file(tmp_path, 'IMG_0001.jpg')
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.store(path, os.stat(path), DT, 'EXIF')
+    cache.close()
+
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    assert cache.lookup(path, os.stat(path)) == (DT, 'EXIF')
+    assert (cache.hits, cache.misses) == (1, 0)
+    cache.close()
+
+
+def test_changed_file_misses(tmp_path):
+    path = make_file(tmp_path, 'IMG_0001.jpg')
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.store(path, os.stat(path), DT, 'EXIF')
+    cache.flush()
+    path.write_bytes(b'edited photo')
+    assert cache.lookup(path, os.stat(path)) is None
+    assert cache.hit_rate() == 0.0
+    cache.close()
+
+
+def test_guesses_are_not_cached(tmp_path):
+    path = make_file(tmp_path, 'IMG_0001.jpg')
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.store(path, os.stat(path), DT, 'Current Time')
+    cache.store(path, os.stat(path), None, None)
+    cache.flush()
+    assert cache.lookup(path, os.stat(path)) is None
+    cache.close()
+
+
+def test_entries_follow_renames(tmp_path):
+    paths = [make_file(tmp_path, f"IMG_{n}.jpg", bytes([n])) for n in range(3)]
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    for path in paths:
+        cache.store(path, os.stat(path), DT, 'EXIF')
+    moves = [(path, path.with_name(f"Trip_{n}.jpg")) for n, path in enumerate(paths)]
+    for old, new in moves:
+        old.rename(new)
+    cache.rename(*moves[0])
+    cache.moved(moves[1:])
+    for old, new in moves:
+        assert cache.lookup(new, os.stat(new)) == (DT, 'EXIF')
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    paths = [make_file(tmp_path, f"IMG_{n}.jpg", bytes([n])) for n in range(5)]
+    cache = MetadataCache(tmp_path / 'cache.sqlite3', max_entries=3)
+    for path in paths:
+        cache.store(path, os.stat(path), DT, 'EXIF')
+    cache.flush()
+    # The first file is looked at again, so it outlives the ones after it
+    assert cache.lookup(paths[0], os.stat(paths[0])) is not None
+    assert cache.evict() == 2
+    kept = [path for path in paths if cache.lookup(path, os.stat(path)) is not None]
+    assert paths[0] in kept and len(kept) == 3
+    cache.close()
+
+
+def test_forgotten_file_misses(tmp_path):
+    path = make_file(tmp_path, 'IMG_0001.jpg')
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.store(path, os.stat(path), DT, 'EXIF')
+    cache.flush()
+    cache.forget(path)
+    assert cache.lookup(path, os.stat(path)) is None
+    cache.close()
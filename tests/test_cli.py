@@ -0,0 +1,97 @@
+import os
+
+from PIL import Image
+
+from pavo import cli
+from pavo.cache import MetadataCache
+
+
+def make_photos(folder, count):
+    folder.mkdir(parents=True, exist_ok=True)
+    for n in range(count):
+        image = Image.new('RGB', (8, 8))
+        exif = image.getexif()
+        exif[0x0132] = f"2023:06:01 08:30:{n:02}"
+        image.save(folder / f"IMG_{n:04}.jpg", exif=exif)
+
+
+def test_rename_keeps_dates_cached(tmp_path):
+    folder = tmp_path / 'card'
+    make_photos(folder, 3)
+    assert cli.main(['rename', str(folder), '--name', 'Trip', '--processes', '1', '-q']) == 0
+    renamed = sorted(folder.iterdir())
+    assert [path.name for path in renamed] != ['IMG_0000.jpg', 'IMG_0001.jpg', 'IMG_0002.jpg']
+
+    cache = MetadataCache()
+    try:
+        dates = [cache.lookup(path, os.stat(path)) for path in renamed]
+        assert sorted(dt.second for dt, _ in dates) == [0, 1, 2]
+    finally:
+        cache.close()
+
+
+def test_undo_after_renaming_twice(tmp_path, capsys):
+    folder = tmp_path / 'card'
+    make_photos(folder, 3)
+    originals = sorted(path.name for path in folder.iterdir())
+    for _ in range(2):
+        assert cli.main(['rename', str(folder), '--name', 'Trip', '--processes', '1', '-q']) == 0
+    renamed = sorted(path.name for path in folder.iterdir())
+
+    # The second run left every name as it was; undo goes back past it
+    assert cli.main(['undo', '-q']) == 0
+    assert sorted(path.name for path in folder.iterdir()) == originals
+    assert cli.main(['undo', '-q']) == 0
+    assert 'Nothing to undo' in capsys.readouterr().err
+    assert sorted(path.name for path in folder.iterdir()) == originals
+    assert renamed != originals
+
+
+def test_dry_runs_report_once(tmp_path, capsys):
+    folder = tmp_path / 'card'
+    make_photos(folder, 3)
+    for argv in (['organize', str(folder)], ['import', str(folder), str(tmp_path / 'library')]):
+        assert cli.main(argv + ['--dry-run', '--processes', '1']) == 0
+        err = capsys.readouterr().err
+        assert err.count('Planned:') == 1
+        assert 'Planned: 3 files in ' in err
+    assert sorted(path.name for path in folder.iterdir()) == ['IMG_0000.jpg', 'IMG_0001.jpg', 'IMG_0002.jpg']
+
+
+def test_include_takes_root_files(tmp_path, capsys):
+    folder = tmp_path / 'card'
+    make_photos(folder, 1)
+    make_photos(folder / 'DCIM', 1)
+    assert cli.main(['organize', str(folder), '-r', '--include', '*', '--dry-run', '-q', '--processes', '1']) == 0
+    planned = sorted(line.split('\t')[0] for line in capsys.readouterr().out.splitlines())
+    assert planned == ['IMG_0000.jpg', 'IMG_0000.jpg']
+
+
+def tree(folder):
+    return sorted(str(path.relative_to(folder)) for path in folder.rglob('*') if path.is_file())
+
+
+def test_organize_moves_files_and_undoes(tmp_path):
+    folder = tmp_path / 'card'
+    make_photos(folder, 2)
+    assert cli.main(['organize', str(folder), '--processes', '1', '-q']) == 0
+    assert tree(folder) == ['2023-06-01/Session1_08.30/Photos/IMG_0000.jpg',
+                            '2023-06-01/Session1_08.30/Photos/IMG_0001.jpg']
+    assert cli.main(['undo', '-q']) == 0
+    assert tree(folder) == ['IMG_0000.jpg', 'IMG_0001.jpg']
+
+
+def test_import_copies_into_library(tmp_path):
+    folder = tmp_path / 'card'
+    library = tmp_path / 'library'
+    make_photos(folder, 2)
+    argv = ['import', str(folder), str(library), '--name', 'Trip', '--no-session', '--no-type', '--processes', '1', '-q']
+    assert cli.main(argv) == 0
+    assert tree(library) == ['2023-06-01/Trip_01-06-23_08.30.00.jpg', '2023-06-01/Trip_01-06-23_08.30.01.jpg']
+    assert tree(folder) == ['IMG_0000.jpg', 'IMG_0001.jpg']
+    assert (library / '2023-06-01' / 'Trip_01-06-23_08.30.01.jpg').read_bytes() == (folder / 'IMG_0001.jpg').read_bytes()
+
+    assert cli.main(argv[:-3] + ['--delete-source', '--processes', '1', '-q']) == 0
+    # The second import doesn't overwrite the first
+    assert tree(library)[1::2] == ['2023-06-01/Trip_01-06-23_08.30.00_1.jpg', '2023-06-01/Trip_01-06-23_08.30.01_1.jpg']
+    assert tree(folder) == []
@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from pavo import core
+from pavo.core import Namespace, apply_renames, format_new_name, plan_renames
+from pavo.filetable import FileTable
+from pavo.journal import Journal
+from pavo.mover import MoveScheduler
+
+
+def touch(folder, *names):
+    for name in names:
+        (folder / name).write_bytes(name.encode())
+
+
+def test_namespace_skips_names_on_disk(tmp_path):
+    touch(tmp_path, 'Trip.jpg', 'Trip_1.jpg', 'Trip_3.jpg')
+    namespace = Namespace()
+    assert namespace.claim(tmp_path, 'Trip.jpg') == 'Trip_2.jpg'
+    assert namespace.claim(tmp_path, 'Trip.jpg') == 'Trip_4.jpg'
+    assert namespace.claim(tmp_path, 'Other.jpg') == 'Other.jpg'
+    assert namespace.claim(tmp_path, 'Other.jpg') == 'Other_1.jpg'
+
+
+def test_namespace_leaves_a_file_its_own_name(tmp_path):
+    touch(tmp_path, 'Trip.jpg', 'Trip_1.jpg')
+    namespace = Namespace()
+    assert namespace.claim(tmp_path, 'Trip.jpg', own_name='Trip.jpg') == 'Trip.jpg'
+    assert namespace.claim(tmp_path, 'Trip.jpg', own_name='Trip_1.jpg') == 'Trip_1.jpg'
+
+
+def test_namespace_folds_case_where_the_volume_does(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, 'CASE_INSENSITIVE_NAMES', True)
+    touch(tmp_path, 'TRIP.JPG')
+    assert Namespace().claim(tmp_path, 'Trip.jpg') == 'Trip_1.jpg'
+
+
+def test_burst_is_named_in_capture_order(tmp_path, monkeypatch):
+    folder = tmp_path / 'card'
+    folder.mkdir()
+    names = [f"GOPR{n:04}.jpg" for n in range(30)]
+    touch(folder, *names)
+    # Listed in reverse, with sub-seconds giving the real order
+    shots = [(folder / name, datetime(2023, 6, 1, 8, 30, 15, n * 30_000), 'EXIF') for n, name in enumerate(names)]
+    table = FileTable.from_extracted(shots[::-1])
+    listed = []
+    listdir = core.os.listdir
+    monkeypatch.setattr(core.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+    new_names = plan_renames(table, 'Burst')
+    assert len(listed) == 1
+    stem = format_new_name('Burst', shots[0][1], '')
+    by_shot = {table.name(i): new_name for i, new_name in enumerate(new_names)}
+    assert [by_shot[name] for name in names] == [f"{stem}.jpg"] + [f"{stem}_{n}.jpg" for n in range(1, 30)]
+
+
+def test_rename_never_overwrites_a_file_already_there(tmp_path):
+    folder = tmp_path / 'card'
+    folder.mkdir()
+    dt = datetime(2023, 6, 1, 8, 30, 15)
+    taken = format_new_name('Trip', dt, '.jpg')
+    touch(folder, taken, 'IMG_0001.jpg', 'IMG_0002.jpg')
+    table = FileTable.from_extracted([(folder / 'IMG_0001.jpg', dt, 'EXIF'),
+                                      (folder / 'IMG_0002.jpg', dt, 'EXIF')])
+    new_names = plan_renames(table, 'Trip')
+    stem = taken[:-len('.jpg')]
+    assert sorted(new_names) == [f"{stem}_1.jpg", f"{stem}_2.jpg"]
+
+    results = list(apply_renames(table, new_names))
+    assert [error for _, _, error in results] == [None, None]
+    assert (folder / taken).read_bytes() == taken.encode()
+    assert sorted(path.read_bytes() for path in folder.iterdir()) == sorted(
+        [taken.encode(), b'IMG_0001.jpg', b'IMG_0002.jpg'])
+
+
+def test_files_already_named_are_left_out(tmp_path):
+    folder = tmp_path / 'card'
+    folder.mkdir()
+    dt = datetime(2023, 6, 1, 8, 30, 15)
+    done = format_new_name('Trip', dt, '.jpg')
+    touch(folder, done, 'IMG_0002.jpg')
+    table = FileTable.from_extracted([(folder / done, dt, 'EXIF'), (folder / 'IMG_0002.jpg', dt, 'EXIF')])
+    new_names = plan_renames(table, 'Trip')
+    assert new_names[0] is None
+    assert new_names[1] == done[:-len('.jpg')] + '_1.jpg'
+    assert [i for i, _, _ in core.rename_ops(table, new_names)] == [1]
+
+
+def test_scheduler_leaves_files_in_place_unjournaled(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    touch(library, 'IMG_0001.jpg')
+    src = tmp_path / 'IMG_0002.jpg'
+    src.write_bytes(b'new')
+    journal = Journal.create('organize', library)
+    scheduler = MoveScheduler()
+    ops = [('kept', library / 'IMG_0001.jpg', library / 'IMG_0001.jpg', None),
+           ('moved', src, library / 'IMG_0002.jpg', None)]
+    results = {item: (new_path, error) for item, new_path, error in scheduler.run(ops, journal)}
+    assert results == {'kept': (library / 'IMG_0001.jpg', None), 'moved': (library / 'IMG_0002.jpg', None)}
+    assert scheduler.files == 1
+    assert [op.src for op in Journal.load(journal.path).done] == [src]
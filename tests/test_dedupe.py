@@ -0,0 +1,84 @@
+import os
+import shutil
+
+from PIL import Image
+
+from pavo import cli, dedupe
+from pavo.dedupe import DuplicateFinder
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path, len(content)
+
+
+def test_only_ties_are_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe, 'PARTIAL_SIZE', 16)
+    middle = b'a' * 16 + b'%s' + b'z' * 16
+    candidates = [
+        write(tmp_path / 'clip.mp4', middle % b'1'),
+        write(tmp_path / 'copy of clip.mp4', middle % b'1'),
+        # Same size and ends, so only a full read tells it apart
+        write(tmp_path / 'other.mp4', middle % b'2'),
+        write(tmp_path / 'longer.mp4', middle % b'22'),
+        write(tmp_path / 'empty.mp4', b''),
+        write(tmp_path / 'empty copy.mp4', b''),
+    ]
+    finder = DuplicateFinder()
+    assert finder.find(candidates) == {1: tmp_path / 'clip.mp4'}
+    assert (finder.partial_hashed, finder.full_hashed) == (3, 3)
+
+
+def test_different_ends_skip_the_full_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe, 'PARTIAL_SIZE', 16)
+    candidates = [write(tmp_path / f"{n}.mp4", bytes([n]) * 100) for n in range(3)]
+    finder = DuplicateFinder()
+    assert finder.find(candidates) == {}
+    assert (finder.partial_hashed, finder.full_hashed) == (3, 0)
+
+
+def test_library_copy_is_kept(tmp_path):
+    kept = write(tmp_path / 'library' / 'IMG_0001.jpg', b'photo')
+    candidates = [write(tmp_path / 'card' / 'a.jpg', b'photo'), write(tmp_path / 'card' / 'b.jpg', b'photo')]
+    assert DuplicateFinder().find(candidates, [kept]) == {0: kept[0], 1: kept[0]}
+
+
+def make_card(folder):
+    folder.mkdir(parents=True)
+    for n in range(2):
+        image = Image.new('RGB', (8, 8), (n, 0, 0))
+        exif = image.getexif()
+        exif[0x0132] = f"2023:06:01 08:30:{n:02}"
+        image.save(folder / f"IMG_{n:04}.jpg", exif=exif)
+
+
+def files(folder):
+    return sorted(path for path in folder.rglob('*') if path.is_file())
+
+
+def test_repeated_import_skips_or_links(tmp_path):
+    card = tmp_path / 'card'
+    library = tmp_path / 'library'
+    make_card(card)
+    options = ['--processes', '1', '-q']
+    assert cli.main(['import', str(card), str(library)] + options) == 0
+    first = files(library)
+
+    assert cli.main(['import', str(card), str(library), '--duplicates', 'skip'] + options) == 0
+    assert files(library) == first
+
+    assert cli.main(['import', str(card), str(library), '--duplicates', 'link'] + options) == 0
+    linked = [path for path in files(library) if path not in first]
+    assert len(linked) == 2
+    assert sorted(os.stat(path).st_ino for path in linked) == sorted(os.stat(path).st_ino for path in first)
+
+
+def test_duplicates_in_one_dump_are_linked(tmp_path):
+    card = tmp_path / 'card'
+    make_card(card)
+    shutil.copy2(card / 'IMG_0000.jpg', card / 'IMG_0000 copy.jpg')
+    assert cli.main(['organize', str(card), '--duplicates', 'link', '--processes', '1', '-q']) == 0
+    organized = files(card)
+    assert len(organized) == 3
+    assert len({os.stat(path).st_ino for path in organized}) == 2
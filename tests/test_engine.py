@@ -0,0 +1,234 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from pavo import engine as engine_module
+from pavo import layout
+from pavo import metadata
+from pavo.cache import MetadataCache
+from pavo.engine import ExtractionEngine
+from pavo.metadata import COST_HEADER, ExtractorPolicy, register_extractor
+from pavo.quarantine import QUARANTINED, TIMEOUT, Quarantine
+
+POLICY = ExtractorPolicy(use=['slow'])
+
+
+@pytest.fixture
+def slow_extractor(monkeypatch):
+    """Registers a 'slow' source taking a set time per file, and counts its calls."""
+    monkeypatch.setattr(engine_module, 'DEADLINE_CHECK_SECONDS', 0.05)
+    release = threading.Event()
+    calls = []
+
+    def install(seconds, timeout):
+        def extract(file_path):
+            calls.append(file_path)
+            release.wait(seconds)
+            return None, None
+        register_extractor('slow', extract, COST_HEADER, timeout=timeout)
+        return calls
+
+    yield install
+    # Let stuck readers go before the next test
+    release.set()
+    metadata.EXTRACTORS.pop('slow', None)
+    metadata._chains.clear()
+
+
+def make_files(folder, count):
+    paths = []
+    for n in range(count):
+        path = folder / f"img_{n:03}.jpg"
+        path.write_bytes(b'\xff\xd8')
+        paths.append(path)
+    return paths
+
+
+def run(engine, files):
+    try:
+        return list(engine.run(files, POLICY))
+    finally:
+        engine.shutdown()
+
+
+def test_slow_batch_is_not_taken_for_stuck(tmp_path, monkeypatch, slow_extractor):
+    # Each file is well within its budget, but a batch of them isn't within one file's
+    monkeypatch.setattr(engine_module, 'MIN_IMAGES_FOR_PROCESSES', 1)
+    monkeypatch.setattr(engine_module, 'IMAGE_BATCH_SIZE', 8)
+    calls = slow_extractor(0.05, timeout=0.2)
+    files = make_files(tmp_path, 16)
+    engine = ExtractionEngine(max_threads=2, max_processes=1, read_order='name')
+    # Threads stand in for the process pool, which wouldn't see 'slow'
+    pool = ThreadPoolExecutor(max_workers=1)
+    engine._get_process_pool = lambda: pool
+    try:
+        results = run(engine, files)
+    finally:
+        pool.shutdown()
+    assert len(results) == len(files)
+    assert engine.failures == {}
+    assert sorted(calls) == sorted(files)
+
+
+def test_stuck_file_is_timed_out(tmp_path, slow_extractor):
+    slow_extractor(10, timeout=0.2)
+    files = make_files(tmp_path, 1)
+    engine = ExtractionEngine(max_threads=2, max_processes=1, read_order='name')
+    started = time.monotonic()
+    results = run(engine, files)
+    assert time.monotonic() - started < 5
+    assert [path for _, path, _, _ in results] == files
+    # It still gets the file system's date
+    assert results[0][3] == 'File System'
+    assert engine.failures == {str(files[0]): TIMEOUT}
+
+
+def test_stuck_file_is_quarantined_after_two_failures(tmp_path, slow_extractor):
+    calls = slow_extractor(10, timeout=0.2)
+    folder = tmp_path / 'card'
+    folder.mkdir()
+    files = make_files(folder, 1)
+    store = tmp_path / 'quarantine.sqlite3'
+    for expected_calls, kind in ((1, TIMEOUT), (2, TIMEOUT), (2, QUARANTINED)):
+        engine = ExtractionEngine(max_threads=2, max_processes=1, read_order='name',
+                                  quarantine=Quarantine(store))
+        run(engine, files)
+        assert len(calls) == expected_calls
+        assert engine.failures == {str(files[0]): kind}
+
+
+@pytest.mark.parametrize('read_order, extents, one_reader', [
+    ('name', True, False),
+    ('auto', False, False),
+    ('auto', True, True),
+    ('physical', False, True),
+])
+def test_read_order(tmp_path, monkeypatch, read_order, extents, one_reader):
+    # Every disk claims to spin, as virtual ones do
+    monkeypatch.setattr(engine_module, 'is_rotational', lambda device: True)
+    monkeypatch.setattr(layout, 'physical_offset', lambda path: 0 if extents else None)
+    files = make_files(tmp_path, 5)
+    engine = ExtractionEngine(max_threads=2, max_processes=1, read_order=read_order)
+    results = list(engine.run(files, ExtractorPolicy(use=['exif'])))
+    assert bool(engine._device_readers) == one_reader
+    engine.shutdown()
+    assert sorted(path for _, path, _, _ in results) == files
+
+
+def test_default_read_order_is_name():
+    assert ExtractionEngine().read_order == 'name'
+
+
+def test_broken_process_pool_is_shut_down(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_module, 'MIN_IMAGES_FOR_PROCESSES', 1)
+    files = make_files(tmp_path, 4)
+
+    class BrokenPool(ThreadPoolExecutor):
+        shut_down = False
+
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_exception(engine_module.BrokenProcessPool())
+            return future
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            BrokenPool.shut_down = True
+            super().shutdown(wait, cancel_futures=cancel_futures)
+
+    engine = ExtractionEngine(max_threads=2, max_processes=2, read_order='name')
+    engine._process_pool = BrokenPool(max_workers=1)
+    results = list(engine.run(files, POLICY))
+    # Let go during the run, not only when the engine is
+    assert BrokenPool.shut_down and engine._process_pool is None
+    engine.shutdown()
+    # and read on threads instead
+    assert sorted(path for _, path, _, _ in results) == files
+
+
+def make_photos(folder, count):
+    paths = []
+    for n in range(count):
+        image = Image.new('RGB', (8, 8))
+        exif = image.getexif()
+        exif[0x0132] = f"2023:06:01 08:{n // 60:02}:{n % 60:02}"
+        path = folder / f"IMG_{n:04}.jpg"
+        image.save(path, exif=exif)
+        paths.append(path)
+    return paths
+
+
+def test_run_dates_every_file_once(tmp_path):
+    files = make_photos(tmp_path, 20)
+    engine = ExtractionEngine(max_threads=4, max_processes=1)
+    results = list(engine.run(files))
+    engine.shutdown()
+    assert sorted(index for index, _, _, _ in results) == list(range(20))
+    for index, path, dt, dt_source in results:
+        assert path == files[index] and dt_source == 'EXIF'
+        assert (dt.minute, dt.second) == divmod(index, 60)
+
+
+def test_images_are_read_in_worker_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_module, 'MIN_IMAGES_FOR_PROCESSES', 4)
+    monkeypatch.setattr(engine_module, 'IMAGE_BATCH_SIZE', 4)
+    files = make_photos(tmp_path, 12)
+    engine = ExtractionEngine(max_threads=2, max_processes=2)
+    results = list(engine.run(files))
+    assert engine._process_pool is not None
+    engine.shutdown()
+    assert sorted(path for _, path, _, _ in results) == files
+    assert {dt_source for _, _, _, dt_source in results} == {'EXIF'}
+
+
+def test_cache_answers_a_second_run(tmp_path):
+    (tmp_path / 'card').mkdir()
+    files = make_photos(tmp_path / 'card', 5)
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    engine = ExtractionEngine(max_threads=2, max_processes=1, cache=cache)
+    first = list(engine.run(files))
+    second = list(engine.run(files))
+    engine.shutdown()
+    assert cache.hits == 5
+    assert sorted(first, key=lambda item: item[0]) == sorted(second, key=lambda item: item[0])
+
+
+def job_messages(engine, job_id):
+    messages = []
+    while True:
+        message = engine.results.get(timeout=10)
+        assert message[0] == job_id
+        messages.append(message)
+        if message[1] == 'done':
+            return messages
+
+
+def test_background_job_posts_batches_then_done(tmp_path):
+    files = make_photos(tmp_path, 10)
+    engine = ExtractionEngine(max_threads=2, max_processes=1, progress_interval=0)
+    try:
+        job_id = engine.start(files)
+        messages = job_messages(engine, job_id)
+    finally:
+        engine.shutdown()
+    batches = [message for message in messages if message[1] == 'batch']
+    assert sorted(item[1] for batch in batches for item in batch[2]) == files
+    assert messages[-1] == (job_id, 'done', 10, 10, False)
+
+
+def test_background_job_can_be_cancelled(tmp_path, slow_extractor):
+    slow_extractor(0.05, timeout=5)
+    files = make_files(tmp_path, 40)
+    engine = ExtractionEngine(max_threads=1, max_processes=1, progress_interval=0)
+    try:
+        job_id = engine.start(files, POLICY)
+        engine.cancel()
+        _, _, done, total, cancelled = job_messages(engine, job_id)[-1]
+        # and the engine takes another job straight away
+        next_job = engine.start(files[:1], POLICY)
+        assert job_messages(engine, next_job)[-1][2:] == (1, 1, False)
+    finally:
+        engine.shutdown()
+    assert cancelled and done < total == 40
@@ -0,0 +1,71 @@
+import struct
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+from pavo import exifmeta
+from pavo.exifmeta import (TAG_DATETIME, TAG_DATETIME_DIGITIZED, TAG_DATETIME_ORIGINAL, TAG_EXIF_IFD,
+                           TAG_OFFSET_TIME_ORIGINAL, TAG_SUBSEC_TIME_ORIGINAL, ExifFormatError, read_exif_date)
+from pavo.metadata import get_image_datetime
+
+
+def make_photo(path, ifd0=None, exif_ifd=None):
+    image = Image.new('RGB', (8, 8))
+    exif = image.getexif()
+    exif.update(ifd0 or {})
+    if exif_ifd:
+        exif.get_ifd(TAG_EXIF_IFD).update(exif_ifd)
+    image.save(path, exif=exif)
+    return path
+
+
+def test_original_date_wins_whatever_the_order(tmp_path):
+    path = make_photo(tmp_path / 'IMG_0001.jpg', {TAG_DATETIME: '2024:01:02 10:00:00'}, {
+        TAG_DATETIME_DIGITIZED: '2023:06:01 09:00:00',
+        TAG_DATETIME_ORIGINAL: '2023:06:01 08:30:15',
+        TAG_SUBSEC_TIME_ORIGINAL: '12',
+        TAG_OFFSET_TIME_ORIGINAL: '+02:00',
+    })
+    assert read_exif_date(path) == (datetime(2023, 6, 1, 8, 30, 15, 120000), '12', '+02:00', TAG_DATETIME_ORIGINAL)
+
+
+def test_modify_date_is_the_last_resort(tmp_path):
+    path = make_photo(tmp_path / 'IMG_0001.jpg', {TAG_DATETIME: '2023:06:01 08:30:15'})
+    exif_date = read_exif_date(path)
+    assert (exif_date.datetime, exif_date.tag) == (datetime(2023, 6, 1, 8, 30, 15), TAG_DATETIME)
+
+
+def test_tiff_with_exif_after_the_image_data(tmp_path):
+    # Big-endian, with the Exif IFD well past the first read
+    exif_offset = exifmeta.HEADER_READ_SIZE + 1000
+    date = b'2023:06:01 08:30:15\x00'
+    ifd0 = struct.pack('>H', 1) + struct.pack('>HHII', TAG_EXIF_IFD, 4, 1, exif_offset) + bytes(4)
+    exif_ifd = (struct.pack('>H', 1) + struct.pack('>HHII', TAG_DATETIME_ORIGINAL, 2, len(date), exif_offset + 18)
+                + bytes(4) + date)
+    header = b'MM\x00*' + struct.pack('>I', 8) + ifd0
+    path = tmp_path / 'scan.tif'
+    path.write_bytes(header + bytes(exif_offset - len(header)) + exif_ifd)
+    assert read_exif_date(path).datetime == datetime(2023, 6, 1, 8, 30, 15)
+
+
+def test_exif_past_the_first_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(exifmeta, 'HEADER_READ_SIZE', 64)
+    path = make_photo(tmp_path / 'IMG_0001.jpg', {0x010E: 'x' * 500},
+                      {TAG_DATETIME_ORIGINAL: '2023:06:01 08:30:15'})
+    assert read_exif_date(path).datetime == datetime(2023, 6, 1, 8, 30, 15)
+
+
+def test_photo_without_exif(tmp_path):
+    path = tmp_path / 'IMG_0001.jpg'
+    Image.new('RGB', (8, 8)).save(path)
+    assert read_exif_date(path) is None
+    assert get_image_datetime(path) == (None, None)
+
+
+def test_other_formats_fall_back_to_pil(tmp_path):
+    path = tmp_path / 'IMG_0001.png'
+    Image.new('RGB', (8, 8)).save(path)
+    with pytest.raises(ExifFormatError):
+        read_exif_date(path)
+    assert get_image_datetime(path) == (None, None)
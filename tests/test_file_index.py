@@ -0,0 +1,61 @@
+import os
+from datetime import datetime
+
+from PIL import Image
+
+from pavo.engine import ExtractionEngine
+from pavo.file_index import FileIndex
+from pavo.stats import RunStats
+
+DT = datetime(2023, 6, 1, 8, 30, 15)
+
+
+class NoInodeStat:
+    # What scandir reports on Windows
+    def __init__(self, stat):
+        self.st_dev = stat.st_dev
+        self.st_ino = 0
+        self.st_size = stat.st_size
+        self.st_mtime_ns = stat.st_mtime_ns
+
+
+def test_renamed_file_is_found(tmp_path):
+    path = tmp_path / 'IMG_0001.jpg'
+    path.write_bytes(b'photo')
+    index = FileIndex()
+    index.store(path, os.stat(path), DT, 'EXIF')
+    renamed = path.rename(tmp_path / 'Trip.jpg')
+    assert index.lookup(renamed, os.stat(renamed)) == (DT, 'EXIF')
+
+    renamed.write_bytes(b'edited photo')
+    assert index.lookup(renamed, os.stat(renamed)) is None
+
+
+def test_rename_is_followed_without_inodes(tmp_path):
+    path = tmp_path / 'IMG_0001.jpg'
+    path.write_bytes(b'photo')
+    index = FileIndex()
+    index.store(path, NoInodeStat(os.stat(path)), DT, 'EXIF')
+    renamed = path.rename(tmp_path / 'Trip.jpg')
+    assert index.lookup(renamed, NoInodeStat(os.stat(renamed))) is None
+    index.rename(path, renamed)
+    assert index.lookup(renamed, NoInodeStat(os.stat(renamed))) == (DT, 'EXIF')
+    assert len(index) == 1
+
+
+def test_second_preview_reads_nothing(tmp_path):
+    paths = []
+    for n in range(3):
+        image = Image.new('RGB', (8, 8))
+        exif = image.getexif()
+        exif[0x0132] = f"2023:06:01 08:30:{n:02}"
+        image.save(tmp_path / f"IMG_{n}.jpg", exif=exif)
+        paths.append(tmp_path / f"IMG_{n}.jpg")
+    index = FileIndex()
+    stats = RunStats('preview')
+    engine = ExtractionEngine(max_threads=2, max_processes=1, index=index, stats=stats)
+    first = sorted(engine.run(paths), key=lambda item: item[0])
+    second = sorted(engine.run(paths), key=lambda item: item[0])
+    engine.shutdown()
+    assert first == second
+    assert stats.lookups == {'extracted': 3, 'index': 3}
@@ -0,0 +1,52 @@
+from datetime import datetime
+from pathlib import Path
+
+from pavo.filetable import FileTable
+from pavo.sessions import TYPE_IMAGE, TYPE_VIDEO
+
+DT = datetime(2023, 6, 1, 8, 30, 15)
+
+
+def test_rows_read_like_dicts(tmp_path):
+    table = FileTable.from_extracted([(tmp_path / 'a' / 'IMG_0001.JPG', DT, 'EXIF'),
+                                      (tmp_path / 'a' / 'clip.mov', DT.replace(microsecond=5), 'Metadata'),
+                                      (tmp_path / 'b' / 'notes.psd', DT, 'Plugin')])
+    assert table.directories == [str(tmp_path / 'a'), str(tmp_path / 'b')]
+    row = table[1]
+    assert row['path'] == tmp_path / 'a' / 'clip.mov'
+    assert (row['datetime'], row['dt_source']) == (DT.replace(microsecond=5), 'Metadata')
+    assert (row['is_image'], row['is_video']) == (False, True)
+    assert table.type_codes().tolist() == [TYPE_IMAGE, TYPE_VIDEO, 0]
+    # A source registered elsewhere gets a code of its own
+    assert table.dt_source(2) == 'Plugin' and table.indices_with_source('Plugin') == [2]
+
+
+def test_dates_filled_in_later():
+    table = FileTable.from_paths([Path('IMG_0001.jpg')])
+    assert table.directory(0) == '.' and table.datetime(0) is None and table.dt_source(0) is None
+    table.set_date(0, DT, 'File System')
+    assert table.datetime(0) == DT and table.capture_times().tolist() == [DT]
+
+
+def test_same_second_shots_sort_by_subsecond_then_frame_then_name():
+    names_and_times = [
+        ('IMG_0010.jpg', DT),
+        ('IMG_0002 copy.jpg', DT),
+        ('IMG_0002.jpg', DT),
+        ('IMG_0011.jpg', DT.replace(microsecond=500)),
+        ('IMG_0001.jpg', DT.replace(second=16)),
+        ('IMG_0099.jpg', DT.replace(second=14)),
+    ]
+    table = FileTable.from_extracted((name, dt, 'EXIF') for name, dt in names_and_times)
+    table.sort_by_capture()
+    assert table.names == ['IMG_0099.jpg', 'IMG_0002 copy.jpg', 'IMG_0002.jpg', 'IMG_0010.jpg', 'IMG_0011.jpg',
+                           'IMG_0001.jpg']
+    # Every column moved with the names
+    assert [table.datetime(i) for i in range(len(table))] == sorted(dt for _, dt in names_and_times)
+
+
+def test_memory_per_file_is_small(tmp_path):
+    count = 10_000
+    table = FileTable.from_extracted((tmp_path / 'DCIM' / f"IMG_{n:05}.JPG", DT, 'EXIF') for n in range(count))
+    # Mostly the name strings themselves
+    assert table.memory_usage() / count < 100
@@ -0,0 +1,163 @@
+import os
+
+import pytest
+
+from pavo import core
+from pavo.journal import Journal, latest_undoable_journal
+
+
+def make_file(path, content=b'photo'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def crashed_run(kind, root, ops, **options):
+    """A journal of (src, dst, link_to) ops recorded but never carried out."""
+    journal = Journal.create(kind, root, **options)
+    for src, dst, link_to in ops:
+        journal.add(src, dst, os.stat(src), link_to)
+    journal.sync()
+    journal.close()
+    return journal.path
+
+
+def resume(path):
+    journal = Journal.load(path)
+    results = list(core.resume_journal(journal))
+    assert [error for _, _, error in results] == [None] * len(results)
+    reloaded = Journal.load(path)
+    assert reloaded.complete
+    return {op.dst: op for op in reloaded.done}
+
+
+def test_resume_rename(tmp_path):
+    src = make_file(tmp_path / 'IMG_0001.jpg')
+    dst = tmp_path / '2024-05-01 Trip.jpg'
+    done = resume(crashed_run('rename', tmp_path, [(src, dst, None)]))
+    assert done[dst].done == dst
+    assert dst.read_bytes() == b'photo' and not src.exists()
+
+
+def test_resume_organize(tmp_path):
+    src = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    dst = tmp_path / 'library' / '2024' / 'IMG_0001.jpg'
+    done = resume(crashed_run('organize', tmp_path / 'library', [(src, dst, None)]))
+    assert done[dst].done == dst and not done[dst].linked
+    assert dst.exists() and not src.exists()
+
+
+def test_resume_import_keeps_source(tmp_path):
+    src = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    dst = tmp_path / 'library' / '2024' / 'IMG_0001.jpg'
+    done = resume(crashed_run('import', tmp_path / 'library', [(src, dst, None)], delete_source=False,
+                              verify=True))
+    assert done[dst].done == dst and done[dst].checksum
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_resume_recognises_finished_move(tmp_path):
+    src = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    dst = tmp_path / 'library' / 'IMG_0001.jpg'
+    path = crashed_run('organize', tmp_path / 'library', [(src, dst, None)])
+    # Moved, but the crash came before it was marked done
+    dst.parent.mkdir()
+    os.rename(src, dst)
+    done = resume(path)
+    assert done[dst].done == dst
+    assert not (tmp_path / 'library' / 'IMG_0001_1.jpg').exists()
+
+
+@pytest.mark.parametrize('kind, removes_source', [('organize', True), ('import', False)])
+def test_resume_link(tmp_path, kind, removes_source):
+    original = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    duplicate = make_file(tmp_path / 'card' / 'copy of IMG_0001.jpg')
+    library = tmp_path / 'library'
+    original_dst = library / 'IMG_0001.jpg'
+    duplicate_dst = library / 'IMG_0001 copy.jpg'
+    # The duplicate comes first in the journal, but is linked once its original is in place
+    path = crashed_run(kind, library, [(duplicate, duplicate_dst, original_dst), (original, original_dst, None)],
+                       delete_source=False, verify=True)
+    done = resume(path)
+    assert done[duplicate_dst].linked
+    assert os.path.samefile(duplicate_dst, original_dst)
+    assert duplicate.exists() != removes_source
+
+
+def test_resume_recognises_finished_link(tmp_path):
+    original = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    duplicate = make_file(tmp_path / 'card' / 'copy of IMG_0001.jpg')
+    library = tmp_path / 'library'
+    original_dst = library / 'IMG_0001.jpg'
+    duplicate_dst = library / 'IMG_0001 copy.jpg'
+    path = crashed_run('organize', library, [(original, original_dst, None), (duplicate, duplicate_dst, original_dst)])
+    # The original was moved and the link made; the crash came before the
+    # duplicate's source was removed
+    library.mkdir()
+    os.rename(original, original_dst)
+    os.link(original_dst, duplicate_dst)
+    done = resume(path)
+    assert done[duplicate_dst].done == duplicate_dst and done[duplicate_dst].linked
+    assert not duplicate.exists()
+    assert sorted(p.name for p in library.iterdir()) == ['IMG_0001 copy.jpg', 'IMG_0001.jpg']
+
+    # and the run undoes like one that finished
+    journal = Journal.load(path)
+    assert [error for _, error in core.undo_journal(journal)] == [None, None]
+    assert original.exists() and duplicate.exists()
+
+
+def test_unchanged_files_are_not_undone(tmp_path):
+    first = make_file(tmp_path / 'IMG_0001.jpg')
+    renamed = tmp_path / 'Trip.jpg'
+    earlier = crashed_run('rename', tmp_path, [(first, renamed, None)])
+    resume(earlier)
+    # A later run that left the file's name as it was
+    journal = Journal.create('rename', tmp_path)
+    op = journal.add(renamed, renamed, os.stat(renamed))
+    journal.mark_done(op, renamed)
+    journal.finish()
+
+    assert Journal.load(journal.path).undoable == []
+    latest = latest_undoable_journal()
+    assert latest.path == earlier
+    assert [error for _, error in core.undo_journal(latest)] == [None]
+    assert first.exists() and latest_undoable_journal() is None
+
+
+def test_undo_leaves_changed_and_taken_files(tmp_path):
+    library = tmp_path / 'library'
+    srcs = [make_file(tmp_path / 'card' / f"IMG_{n}.jpg", bytes([n])) for n in range(3)]
+    dsts = [library / '2024' / src.name for src in srcs]
+    path = crashed_run('organize', library, zip(srcs, dsts, [None] * 3))
+    resume(path)
+    # One file edited since, one original name taken again
+    dsts[0].write_bytes(b'edited')
+    make_file(srcs[1], b'new photo')
+
+    results = list(core.undo_journal(Journal.load(path)))
+    errors = {op.src.name: error for op, error in results}
+    assert errors['IMG_2.jpg'] is None
+    assert 'changed since' in errors['IMG_0.jpg'] and 'taken' in errors['IMG_1.jpg']
+    assert srcs[2].read_bytes() == b'\x02' and dsts[0].exists() and dsts[1].exists()
+    # and a later undo only has those two left
+    assert len(Journal.load(path).undoable) == 2
+
+
+def test_undo_removes_import_copies_and_empty_folders(tmp_path):
+    src = make_file(tmp_path / 'card' / 'IMG_0001.jpg')
+    library = tmp_path / 'library'
+    dst = library / '2024' / 'June' / 'IMG_0001.jpg'
+    path = crashed_run('import', library, [(src, dst, None)], delete_source=False, verify=True)
+    resume(path)
+    assert [error for _, error in core.undo_journal(Journal.load(path))] == [None]
+    assert src.exists() and list(library.iterdir()) == []
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    src = make_file(tmp_path / 'IMG_0001.jpg')
+    path = crashed_run('rename', tmp_path, [(src, tmp_path / 'Trip.jpg', None)])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "done", "id"')
+    journal = Journal.load(path)
+    assert len(journal.pending) == 1 and not journal.complete
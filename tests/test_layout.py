@@ -0,0 +1,124 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from pavo import layout
+
+
+def make_files(inodes):
+    return [(f"IMG_{n}.jpg", SimpleNamespace(st_ino=inode), n) for n, inode in enumerate(inodes)]
+
+
+def names(files):
+    return [path for path, _, _ in files]
+
+
+@pytest.fixture
+def offsets(monkeypatch):
+    """Stands in for FIEMAP with a {path: offset} map, and records the lookups."""
+    lookups = []
+
+    def install(known):
+        def physical_offset(path):
+            lookups.append(path)
+            return known.get(path)
+        monkeypatch.setattr(layout, 'physical_offset', physical_offset)
+        return lookups
+
+    return install
+
+
+def test_sorted_by_first_extent(offsets):
+    files = make_files([30, 10, 20])
+    lookups = offsets({'IMG_0.jpg': 500, 'IMG_1.jpg': 900, 'IMG_2.jpg': 100})
+    assert names(layout.sort_by_layout(files)) == ['IMG_2.jpg', 'IMG_0.jpg', 'IMG_1.jpg']
+    # Looked up in inode order
+    assert lookups == ['IMG_1.jpg', 'IMG_2.jpg', 'IMG_0.jpg']
+
+
+def test_files_without_extents_go_last_in_inode_order(offsets):
+    files = make_files([40, 30, 20, 10])
+    offsets({'IMG_0.jpg': 200, 'IMG_2.jpg': 100})
+    assert names(layout.sort_by_layout(files)) == ['IMG_2.jpg', 'IMG_0.jpg', 'IMG_3.jpg', 'IMG_1.jpg']
+
+
+def test_inode_order_without_extents(offsets):
+    files = make_files([3, 1, 2])
+    lookups = offsets({})
+    assert names(layout.sort_by_layout(files, extents=False)) == ['IMG_1.jpg', 'IMG_2.jpg', 'IMG_0.jpg']
+    assert lookups == []
+
+
+def test_extent_lookups_stop_when_none_are_mapped(offsets):
+    count = layout.FIEMAP_PROBE * 3
+    files = make_files(range(count, 0, -1))
+    lookups = offsets({})
+    assert names(layout.sort_by_layout(files)) == names(files[::-1])
+    assert len(lookups) == layout.FIEMAP_PROBE
+
+
+def test_maps_extents_probes_the_first_files(offsets):
+    paths = [f"IMG_{n}.jpg" for n in range(layout.FIEMAP_PROBE + 1)]
+    offsets({paths[-1]: 100})
+    assert not layout.maps_extents(paths)
+    offsets({paths[3]: 100})
+    assert layout.maps_extents(paths)
+
+
+def test_physical_offset_of_missing_file(tmp_path):
+    assert layout.physical_offset(tmp_path / 'missing.jpg') is None
+
+
+def test_physical_offset_of_real_file(tmp_path):
+    path = tmp_path / 'IMG_0001.jpg'
+    path.write_bytes(b'\xff\xd8' * 8192)
+    # tmpfs and friends can't say; filesystems that can give a byte offset
+    offset = layout.physical_offset(path)
+    assert offset is None or offset >= 0
+
+
+@pytest.fixture
+def sys_block(tmp_path, monkeypatch):
+    """A /sys/block stand-in: a disk and its partition, with the disk's
+    rotational setting."""
+    monkeypatch.setattr(layout, '_rotational', {})
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    disk = tmp_path / 'sys' / 'block' / 'sdb'
+    partition = disk / 'sdb1'
+    (disk / 'queue').mkdir(parents=True)
+    partition.mkdir()
+    (partition / 'partition').write_text('1\n')
+    devices = {}
+
+    def install(rotational, device):
+        (disk / 'queue' / 'rotational').write_text(f"{rotational}\n")
+        devices['path'] = {'disk': disk, 'partition': partition}.get(device, tmp_path / 'missing')
+        return devices
+
+    monkeypatch.setattr(layout.os.path, 'realpath', lambda path: str(devices['path']))
+    return install
+
+
+@pytest.mark.parametrize('rotational, device, expected', [
+    (1, 'disk', True),
+    (0, 'disk', False),
+    (1, 'partition', True),
+    (1, 'none', None),
+])
+def test_is_rotational(sys_block, rotational, device, expected):
+    sys_block(rotational, device)
+    assert layout.is_rotational(2065) is expected
+
+
+def test_is_rotational_is_remembered(sys_block):
+    sys_block(1, 'disk')
+    assert layout.is_rotational(2065) is True
+    sys_block(0, 'disk')
+    assert layout.is_rotational(2065) is True
+
+
+def test_is_rotational_unknown_off_linux(monkeypatch):
+    monkeypatch.setattr(layout, '_rotational', {})
+    monkeypatch.setattr(sys, 'platform', 'win32')
+    assert layout.is_rotational(2065) is None
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from PIL import Image
+
+from pavo import cli
+from pavo.core import OrganizeOptions
+from pavo.filetable import FileTable
+from pavo.library import LibraryCatalog, SessionIndex, parse_date
+from pavo.sessions import TYPE_IMAGE, TYPE_VIDEO
+
+
+def at(hour, minute=0):
+    return datetime(2023, 6, 1, hour, minute)
+
+
+def test_catalog_answers_by_date(tmp_path):
+    library = tmp_path / 'library'
+    session = library / '2023-06-01' / 'Session1_08.30'
+    catalog = LibraryCatalog(tmp_path / 'catalog.sqlite3')
+    assert catalog.record(library, [
+        (session / 'Photos' / 'IMG_0001.jpg', at(8, 30), 'EXIF'),
+        (session / 'Videos' / 'clip.mp4', at(9), 'Metadata'),
+        (library / '2023-06-02' / 'Session1_10.00' / 'IMG_0002.jpg', datetime(2023, 6, 2, 10), 'EXIF'),
+        # Not in the library, or with no date: left out
+        (tmp_path / 'card' / 'IMG_0003.jpg', at(9), 'EXIF'),
+        (session / 'Photos' / 'IMG_0004.jpg', None, None),
+    ]) == 3
+
+    day = (parse_date('2023-06-01'), parse_date('2023-06-01', end=True))
+    assert catalog.sessions(library, *day) == [('2023-06-01/Session1_08.30', at(8, 30), at(9), 2)]
+    assert [(path, code) for path, _, code, _, _ in catalog.files(*day, file_type=TYPE_VIDEO)] == [
+        (str(session / 'Videos' / 'clip.mp4'), TYPE_VIDEO)]
+
+    catalog.moved([(session / 'Photos' / 'IMG_0001.jpg', session / 'Photos' / 'Trip.jpg')])
+    assert [path for path, *_ in catalog.files(*day, file_type=TYPE_IMAGE)] == [str(session / 'Photos' / 'Trip.jpg')]
+    assert catalog.forget_library(library, keep=[session / 'Videos' / 'clip.mp4']) == 2
+    assert catalog.libraries() == [(str(library), 1, at(9), at(9))]
+    catalog.close()
+
+
+def test_new_files_join_the_sessions_they_fall_into(tmp_path):
+    library = tmp_path / 'library'
+    catalog = LibraryCatalog(tmp_path / 'catalog.sqlite3')
+    catalog.record(library, [(library / '2023-06-01' / 'Session1_08.30' / 'IMG_0001.jpg', at(8, 30), 'EXIF'),
+                             (library / '2023-06-01' / 'Session3_14.00' / 'IMG_0002.jpg', at(14), 'EXIF')])
+    for folder in ('Session1_08.30', 'Session3_14.00'):
+        (library / '2023-06-01' / folder).mkdir(parents=True)
+    table = FileTable.from_extracted([('IMG_0003.jpg', at(9), 'EXIF'), ('IMG_0004.jpg', at(20), 'EXIF'),
+                                      ('IMG_0005.jpg', datetime(2023, 6, 2, 7), 'EXIF')])
+    grouping = SessionIndex(library, OrganizeOptions(), catalog=catalog).assign(table)
+    assert list(grouping) == ['2023-06-01/Session1_08.30/Photos', '2023-06-01/Session4_20.00/Photos',
+                              '2023-06-02/Session1_07.00/Photos']
+    catalog.close()
+
+
+def make_card(folder, *times):
+    folder.mkdir()
+    for n, taken in enumerate(times):
+        image = Image.new('RGB', (8, 8), (n, len(times), 0))
+        exif = image.getexif()
+        exif[0x0132] = taken.strftime('%Y:%m:%d %H:%M:%S')
+        image.save(folder / f"IMG_{n:04}.jpg", exif=exif)
+
+
+def test_card_dumps_share_the_day_sessions(tmp_path, capsys):
+    library = tmp_path / 'library'
+    cards = [(at(8, 30),), (at(9), at(9, 10)), (at(15),)]
+    for n, times in enumerate(cards):
+        make_card(tmp_path / f"card{n}", *times)
+        assert cli.main(['import', str(tmp_path / f"card{n}"), str(library), '--processes', '1', '-q']) == 0
+    assert sorted(path.name for path in (library / '2023-06-01').iterdir()) == ['Session1_08.30',
+                                                                                 'Session2_15.00']
+    capsys.readouterr()
+    assert cli.main(['library', str(library), '--from', '2023-06-01', '--to', '2023-06-01', '--sessions']) == 0
+    sessions = [line.split('\t') for line in capsys.readouterr().out.splitlines()]
+    assert [(session.rsplit('/', 1)[1], count) for session, _, _, count in sessions] == [
+        ('Session1_08.30', '3'), ('Session2_15.00', '1')]
@@ -0,0 +1,100 @@
+import json
+import os
+import struct
+from datetime import datetime
+
+from PIL import Image
+
+from pavo import sidecarmeta
+from pavo.metadata import (DEFAULT_POLICY, EXTRACTORS, POLICY_FILE, ExtractorPolicy, find_policy, free_chain,
+                           get_metadata_datetime, metadata_policy)
+from pavo.sidecarmeta import find_sidecars
+
+
+def names(chain):
+    return [name for name, _ in chain]
+
+
+def test_only_name_parsing_runs_ahead_of_the_cache():
+    free, rest = free_chain(DEFAULT_POLICY.chain('.jpg'))
+    assert names(free) == ['pavo_name', 'filename']
+    assert names(rest)[:2] == ['filename_date', 'sidecar']
+    assert 'filename_date' not in names(metadata_policy().chain('.jpg'))
+
+
+def test_sidecars_only_looked_for_where_they_exist():
+    assert 'sidecar' in names(DEFAULT_POLICY.chain('.jpg'))
+    assert 'sidecar' in names(DEFAULT_POLICY.chain('.mp4'))
+    assert 'sidecar' not in names(DEFAULT_POLICY.chain('.png'))
+
+
+def test_sidecar_folder_listed_once(tmp_path, monkeypatch):
+    for n in range(20):
+        (tmp_path / f"IMG_{n:04}.JPG").write_bytes(b'')
+    (tmp_path / 'IMG_0003.JPG.xmp').write_text('<x xmp:CreateDate="2023-06-01T08:30:15"/>')
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(sidecarmeta.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+
+    found = {n: find_sidecars(tmp_path / f"IMG_{n:04}.JPG") for n in range(20)}
+    assert len(listed) == 1
+    assert found[3] == [('xmp', str(tmp_path / 'IMG_0003.JPG.xmp'))]
+    assert sum(map(len, found.values())) == 1
+
+
+def test_sidecar_date(tmp_path):
+    photo = tmp_path / 'IMG_0001.JPG'
+    photo.write_bytes(b'')
+    (tmp_path / 'IMG_0001.xmp').write_text('<x xmp:CreateDate="2023-06-01T08:30:15"/>')
+    dt, dt_source = get_metadata_datetime(photo)
+    assert (dt.isoformat(), dt_source) == ('2023-06-01T08:30:15', 'Sidecar')
+
+
+def test_chain_runs_cheapest_first():
+    assert names(DEFAULT_POLICY.chain('.mp4')) == ['pavo_name', 'filename', 'filename_date', 'sidecar', 'mp4',
+                                                   'ffprobe']
+    assert names(DEFAULT_POLICY.chain('.mkv')) == ['pavo_name', 'filename', 'filename_date', 'ffprobe']
+
+
+def test_phone_names_are_dated_without_opening_the_file(tmp_path):
+    # Nothing on disk to open
+    for name in ('PXL_20230601_083015123.jpg', 'IMG_20230601_083015.jpg', 'VID_20230601_083015.mp4'):
+        dt, dt_source = get_metadata_datetime(tmp_path / name)
+        assert (dt, dt_source) == (datetime(2023, 6, 1, 8, 30, 15), 'Filename')
+
+
+def test_folder_policy_can_distrust_names(tmp_path):
+    folder = tmp_path / 'scans' / '2023'
+    folder.mkdir(parents=True)
+    (tmp_path / 'scans' / POLICY_FILE).write_text(json.dumps({'extractors': {'distrust': ['filename']}}))
+    photo = folder / 'IMG_20230601_083015.jpg'
+    image = Image.new('RGB', (8, 8))
+    exif = image.getexif()
+    exif[0x0132] = '2001:02:03 04:05:06'
+    image.save(photo, exif=exif)
+
+    known = {}
+    policy = find_policy(folder, known)
+    assert policy == ExtractorPolicy(distrust=['filename'])
+    assert known[str(folder)] is known[str(tmp_path / 'scans')] is policy
+    assert get_metadata_datetime(photo, policy) == (datetime(2001, 2, 3, 4, 5, 6), 'EXIF')
+    assert get_metadata_datetime(photo) == (datetime(2023, 6, 1, 8, 30, 15), 'Filename')
+    # Only the names left: the distrusted answer is still better than none
+    assert get_metadata_datetime(photo, ExtractorPolicy(use=['filename'], distrust=['filename']))[1] == 'Filename'
+
+
+def test_broken_policy_file_gives_the_default(tmp_path):
+    (tmp_path / POLICY_FILE).write_text('{not json')
+    assert find_policy(tmp_path) == DEFAULT_POLICY
+
+
+def test_mp4_that_was_read_skips_ffprobe(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(EXTRACTORS['ffprobe'], 'func', lambda path: calls.append(path) or (None, None))
+    clip = tmp_path / 'clip.mp4'
+    # A movie header with no creation time
+    clip.write_bytes(struct.pack('>I4s', 8, b'moov'))
+    assert get_metadata_datetime(clip) == (None, None) and calls == []
+    # but a file the box parser can't follow still goes to ffprobe
+    clip.write_bytes(b'not an mp4 at all')
+    assert get_metadata_datetime(clip) == (None, None) and calls == [clip]
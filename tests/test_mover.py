@@ -0,0 +1,86 @@
+import errno
+import os
+import threading
+import time
+
+from pavo import mover
+from pavo.journal import Journal
+from pavo.mover import MoveScheduler
+
+
+def make_files(folder, count):
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for n in range(count):
+        path = folder / f"IMG_{n:04}.jpg"
+        path.write_bytes(bytes([n]) * 100)
+        paths.append(path)
+    return paths
+
+
+def test_same_device_moves_are_renames(tmp_path, monkeypatch):
+    srcs = make_files(tmp_path / 'card', 6)
+    library = tmp_path / 'library'
+    library.mkdir()
+    ops = [(n, src, library / str(n % 2) / src.name, None) for n, src in enumerate(srcs)]
+    made = []
+    makedirs = os.makedirs
+    monkeypatch.setattr(mover.os, 'makedirs', lambda path, **kw: made.append(path) or makedirs(path, **kw))
+    scheduler = MoveScheduler()
+    results = list(scheduler.run(ops))
+    assert sorted(made) == [library / '0', library / '1']
+    assert [error for _, _, error in results] == [None] * 6
+    assert (scheduler.files, scheduler.copied, scheduler.bytes) == (6, 0, 600)
+    assert not any(src.exists() for src in srcs)
+
+
+def test_refused_rename_falls_back_to_copy(tmp_path, monkeypatch):
+    src, = make_files(tmp_path / 'card', 1)
+    dst = tmp_path / 'library' / src.name
+    rename = os.rename
+
+    def cross_device(old, new):
+        # Only the move itself; the copy's own rename into place works
+        if os.fspath(old) == os.fspath(src):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(old, new)
+    monkeypatch.setattr(mover.os, 'rename', cross_device)
+
+    journal = Journal.create('organize', tmp_path / 'library')
+    scheduler = MoveScheduler()
+    assert list(scheduler.run([('a', src, dst, None)], journal)) == [('a', dst, None)]
+    assert scheduler.copied == 1 and not src.exists()
+    assert dst.read_bytes() == b'\x00' * 100
+    op, = Journal.load(journal.path).done
+    assert op.done == dst and op.checksum
+
+
+def test_copies_between_devices_are_limited_per_device(tmp_path, monkeypatch):
+    srcs = make_files(tmp_path / 'card', 8)
+    library = tmp_path / 'library'
+    scheduler = MoveScheduler(max_workers=8, per_device=2)
+    make_directories = scheduler.make_directories
+    # The library claims to be on another device
+    monkeypatch.setattr(scheduler, 'make_directories',
+                        lambda directories: {d: dev + 1 for d, dev in make_directories(directories).items()})
+    running = []
+    peak = []
+    lock = threading.Lock()
+    copy_move = mover.copy_move
+
+    def slow_copy_move(src, dst):
+        with lock:
+            running.append(src)
+            peak.append(len(running))
+        time.sleep(0.02)
+        try:
+            return copy_move(src, dst)
+        finally:
+            with lock:
+                running.remove(src)
+    monkeypatch.setattr(mover, 'copy_move', slow_copy_move)
+
+    results = list(scheduler.run([(src, src, library / src.name, None) for src in srcs]))
+    assert [error for _, _, error in results] == [None] * 8
+    assert max(peak) == 2 and scheduler.copied == 8
+    assert sorted(path.name for path in library.iterdir()) == [src.name for src in srcs]
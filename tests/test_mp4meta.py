@@ -0,0 +1,78 @@
+import struct
+from datetime import datetime
+
+import pytest
+
+from pavo.metadata import UnsupportedFile, get_mp4_datetime
+from pavo.mp4meta import APPLE_CREATION_KEY, MP4_EPOCH, parse_tag_datetime, read_mp4_tags
+
+SHOT = datetime(2023, 6, 1, 8, 30, 15)
+
+
+def box(box_type, *children):
+    payload = b''.join(children)
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def mvhd(dt, version=0):
+    seconds = int((dt - MP4_EPOCH).total_seconds())
+    if version == 1:
+        return box(b'mvhd', bytes([1, 0, 0, 0]), struct.pack('>QQ', seconds, seconds))
+    return box(b'mvhd', bytes(4), struct.pack('>II', seconds, seconds))
+
+
+def apple_meta(value):
+    key = APPLE_CREATION_KEY.encode()
+    keys = box(b'keys', bytes(4), struct.pack('>I', 1), struct.pack('>I4s', 8 + len(key), b'mdta') + key)
+    item = box(struct.pack('>I', 1), box(b'data', struct.pack('>II', 1, 0), value.encode()))
+    return box(b'meta', box(b'hdlr', bytes(25)), keys, box(b'ilst', item))
+
+
+def write(path, *boxes):
+    path.write_bytes(box(b'ftyp', b'isom') + b''.join(boxes))
+    return path
+
+
+def test_trailing_moov_is_found_without_reading_mdat(tmp_path):
+    # mdat's payload isn't a box stream; a walker reading it would get lost
+    path = write(tmp_path / 'clip.mp4', box(b'mdat', b'\xff' * 100_000), box(b'moov', mvhd(SHOT)))
+    assert read_mp4_tags(path) == {'creation_time': SHOT}
+    assert get_mp4_datetime(path) == (SHOT, 'Metadata')
+
+
+def test_64_bit_mvhd(tmp_path):
+    path = write(tmp_path / 'clip.mov', box(b'moov', mvhd(SHOT, version=1)))
+    assert read_mp4_tags(path) == {'creation_time': SHOT}
+
+
+def test_apple_creation_date(tmp_path):
+    # Phones leave mvhd at zero, or in UTC, and keep local time in the keys
+    path = write(tmp_path / 'IMG_0001.MOV',
+                 box(b'moov', box(b'mvhd', bytes(12)), apple_meta('2023-06-01T08:30:15+0200')))
+    tags = read_mp4_tags(path)
+    assert tags == {APPLE_CREATION_KEY: '2023-06-01T08:30:15+0200'}
+    assert get_mp4_datetime(path) == (SHOT, 'Metadata')
+
+
+def test_quicktime_date_atom(tmp_path):
+    value = b'2023-06-01 08:30:15'
+    day = box(b'\xa9day', struct.pack('>HH', len(value), 0), value)
+    path = write(tmp_path / 'clip.mov', box(b'moov', box(b'udta', day)))
+    assert read_mp4_tags(path) == {'date': '2023-06-01 08:30:15'}
+    assert get_mp4_datetime(path) == (SHOT, 'Metadata')
+
+
+def test_other_files_go_to_ffprobe(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'\x1aE\xdf\xa3 matroska, misnamed')
+    assert read_mp4_tags(path) is None
+    with pytest.raises(UnsupportedFile):
+        get_mp4_datetime(path)
+    empty = tmp_path / 'empty.mp4'
+    empty.write_bytes(b'')
+    assert read_mp4_tags(empty) is None
+
+
+@pytest.mark.parametrize('value', ['2023-06-01T08:30:15.000000Z', '2023-06-01 08:30:15', '2023-06-01T08:30:15-0700'])
+def test_tag_dates_keep_wall_clock_time(value):
+    assert parse_tag_datetime(value) == SHOT
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from PIL import Image
+
+from pavo import core
+from pavo.core import format_new_name
+from pavo.namemeta import gopro_low_res_name, parse_name_date, parse_name_timestamp, parse_pavo_name
+
+DT = datetime(2023, 6, 1, 8, 30, 15)
+
+
+def test_pavo_names_round_trip():
+    name = format_new_name('Beach_Trip 2023', DT, '.jpg')
+    assert parse_pavo_name(name) == DT
+    assert parse_pavo_name(name.replace('.jpg', '_12.jpg')) == DT
+    assert parse_pavo_name('Trip_31-02-23_08.30.15.jpg') is None
+    assert parse_pavo_name('IMG_0001.jpg') is None
+
+
+def test_camera_and_phone_names():
+    utc = DT.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert parse_name_timestamp('PXL_20230601_083015123.jpg') == utc
+    assert parse_name_timestamp('20230601_083015.mp4') == DT
+    assert parse_name_timestamp('Screenshot_20230601-083015.png') == DT
+    assert parse_name_timestamp('IMG_20231301_083015.jpg') is None
+    assert parse_name_date('IMG-20230601-WA0001.jpg') == datetime(2023, 6, 1)
+    assert gopro_low_res_name('GX010123.MP4') == 'GL010123.LRV'
+    assert gopro_low_res_name('GOPR0123.MP4') is None
+
+
+def make_renamed(folder, name, taken):
+    image = Image.new('RGB', (8, 8))
+    exif = image.getexif()
+    exif[0x0132] = taken
+    image.save(folder / name, exif=exif)
+
+
+def test_renamed_folder_is_dated_from_names_and_checked(tmp_path):
+    folder = tmp_path / 'card'
+    folder.mkdir()
+    make_renamed(folder, format_new_name('Trip', DT, '.jpg'), '2023:06:01 08:30:15')
+    make_renamed(folder, format_new_name('Trip', DT, '_1.jpg'), '2023:06:01 08:30:15')
+    # Renamed by hand to the wrong time
+    make_renamed(folder, format_new_name('Trip', datetime(2023, 6, 1, 9, 0), '.jpg'), '2023:06:01 08:45:00')
+
+    table = core.analyze_folder(folder)
+    assert {table.dt_source(i) for i in range(len(table))} == {'Filename'}
+    assert core.verify_name_dates(table) == (3, 1)
+    assert core.use_metadata_dates(table) == 1
+    assert sorted(table.datetime(i).minute for i in range(len(table))) == [30, 30, 45]
+    assert {table.dt_source(i) for i in range(len(table))} == {'EXIF'}
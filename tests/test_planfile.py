@@ -0,0 +1,129 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+from pavo import cli, core
+from pavo.cache import MetadataCache
+from pavo.planfile import PlanFile
+
+DT = datetime(2023, 6, 1, 8, 30, 15)
+
+
+def make_plan(tmp_path, names=('IMG_0001.jpg',)):
+    source = tmp_path / 'card'
+    source.mkdir()
+    items = []
+    for name in names:
+        (source / name).write_bytes(name.encode())
+        items.append((source / name, source / '2023' / name, DT, 'EXIF', None, None))
+    plan, count = PlanFile.write(tmp_path / 'plan.jsonl', 'organize', source, source, items)
+    assert count == len(names)
+    return PlanFile.load(plan.path), source
+
+
+def stale_reasons(plan, **folders):
+    relocated = bool(folders)
+    return [entry.stale_reason(relocated) for entry in plan.entries(**folders)]
+
+
+def test_untouched_files_are_fresh(tmp_path):
+    plan, _ = make_plan(tmp_path)
+    assert stale_reasons(plan) == [None]
+
+
+def test_touched_file_is_stale(tmp_path):
+    plan, source = make_plan(tmp_path)
+    stat = os.stat(source / 'IMG_0001.jpg')
+    os.utime(source / 'IMG_0001.jpg', ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    assert stale_reasons(plan) == ['modified']
+
+
+def test_rewritten_file_is_stale(tmp_path):
+    plan, source = make_plan(tmp_path)
+    (source / 'IMG_0001.jpg').write_bytes(b'edited in place')
+    assert stale_reasons(plan) == ['size changed']
+
+
+def test_replaced_file_is_stale(tmp_path):
+    plan, source = make_plan(tmp_path)
+    path = source / 'IMG_0001.jpg'
+    stat = os.stat(path)
+    # Same size and time, but another file
+    replacement = source / 'replacement'
+    replacement.write_bytes(path.read_bytes())
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, path)
+    assert stale_reasons(plan) == ['replaced']
+
+
+def test_deleted_file_is_stale(tmp_path):
+    plan, source = make_plan(tmp_path)
+    (source / 'IMG_0001.jpg').unlink()
+    assert stale_reasons(plan) == ['missing']
+
+
+def test_relocated_folder_still_applies(tmp_path):
+    plan, source = make_plan(tmp_path, ('IMG_0001.jpg', 'IMG_0002.jpg'))
+    # The card copied elsewhere: new inodes, and times kept only to the second
+    moved = tmp_path / 'mounted' / 'card'
+    shutil.copytree(source, moved)
+    for name in ('IMG_0001.jpg', 'IMG_0002.jpg'):
+        stat = os.stat(source / name)
+        os.utime(moved / name, ns=(stat.st_atime_ns, stat.st_mtime_ns // 1_000_000_000 * 1_000_000_000))
+    assert stale_reasons(plan, source=moved, root=moved) == [None, None]
+
+    stat = os.stat(moved / 'IMG_0002.jpg')
+    os.utime(moved / 'IMG_0002.jpg', ns=(stat.st_atime_ns, stat.st_mtime_ns + 60_000_000_000))
+    assert stale_reasons(plan, source=moved, root=moved) == [None, 'modified']
+
+
+def test_apply_leaves_stale_files_alone(tmp_path):
+    plan, source = make_plan(tmp_path, ('IMG_0001.jpg', 'IMG_0002.jpg'))
+    (source / 'IMG_0002.jpg').unlink()
+    results = list(core.apply_plan(plan.kind, plan.entries()))
+    applied = {entry.src.name: (new_path, error) for entry, new_path, error in results}
+    assert applied['IMG_0001.jpg'] == (source / '2023' / 'IMG_0001.jpg', None)
+    assert applied['IMG_0002.jpg'] == (None, 'IMG_0002.jpg: missing since the plan was made')
+    assert (source / '2023' / 'IMG_0001.jpg').exists()
+
+
+def test_import_planned_here_applies_on_another_mount(tmp_path):
+    card = tmp_path / 'card'
+    card.mkdir()
+    for n in range(2):
+        image = Image.new('RGB', (8, 8), (n, 0, 0))
+        exif = image.getexif()
+        exif[0x0132] = f"2023:06:01 08:30:{n:02}"
+        image.save(card / f"IMG_{n:04}.jpg", exif=exif)
+    plan_path = tmp_path / 'plan.jsonl'
+    assert cli.main(['import', str(card), str(tmp_path / 'library'), '--no-session', '--save-plan', str(plan_path),
+                     '--processes', '1', '-q']) == 0
+    assert not (tmp_path / 'library').exists()
+    assert all(not os.path.isabs(json.loads(line)['src']) for line in plan_path.read_text().splitlines()[1:])
+
+    # The card read on the file server, into its own library folder
+    mounted = tmp_path / 'server' / 'card'
+    shutil.copytree(card, mounted)
+    library = tmp_path / 'server' / 'library'
+    assert cli.main(['apply', str(plan_path), '--source', str(mounted), '--root', str(library), '-q']) == 0
+    copies = sorted(library.rglob('*.jpg'))
+    assert [path.relative_to(library).as_posix() for path in copies] == [
+        '2023-06-01/Photos/IMG_0000.jpg', '2023-06-01/Photos/IMG_0001.jpg']
+    # with the planned dates, without reading them again
+    cache = MetadataCache()
+    try:
+        assert [cache.lookup(path, os.stat(path)) for path in copies] == [
+            (DT.replace(second=n), 'EXIF') for n in (0, 1)]
+    finally:
+        cache.close()
+
+
+def test_newer_plans_are_refused(tmp_path):
+    path = tmp_path / 'plan.jsonl'
+    path.write_text(json.dumps({'pavo_plan': 99, 'kind': 'rename'}) + '\n')
+    with pytest.raises(ValueError, match='newer'):
+        PlanFile.load(path)
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from pavo import cli
+from pavo.metadata import get_ffprobe_tags
+from pavo.quarantine import ERROR, QUARANTINED, TIMEOUT, Quarantine, describe_failures
+
+
+def fail_twice(quarantine, path):
+    for _ in range(2):
+        quarantine.record(path, os.stat(path), TIMEOUT, 'ffprobe')
+
+
+def test_quarantine_follows_renamed_file(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'broken')
+    quarantine = Quarantine(tmp_path / 'quarantine.sqlite3')
+    fail_twice(quarantine, path)
+
+    moved = tmp_path / 'organized' / '2024' / 'clip.mp4'
+    moved.parent.mkdir(parents=True)
+    path.rename(moved)
+    assert quarantine.contains(moved, os.stat(moved))
+    assert [entry[0] for entry in quarantine.entries()] == [str(moved)]
+    quarantine.close()
+
+    # and the new path is what's remembered
+    quarantine = Quarantine(tmp_path / 'quarantine.sqlite3')
+    assert quarantine.contains(moved, os.stat(moved))
+    assert quarantine.release([moved]) == 1
+    assert not quarantine.contains(moved, os.stat(moved))
+    quarantine.close()
+
+
+def test_changed_file_starts_again(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'broken')
+    quarantine = Quarantine(tmp_path / 'quarantine.sqlite3')
+    fail_twice(quarantine, path)
+    path.write_bytes(b'repaired file')
+    assert not quarantine.contains(path, os.stat(path))
+    assert not quarantine.record(path, os.stat(path), TIMEOUT)
+    quarantine.close()
+
+
+def test_release_by_path_of_deleted_file(tmp_path):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'broken')
+    quarantine = Quarantine(tmp_path / 'quarantine.sqlite3')
+    fail_twice(quarantine, path)
+    path.unlink()
+    assert quarantine.release([path]) == 1
+    assert quarantine.entries() == []
+    quarantine.close()
+
+
+def test_failures_are_counted_by_kind():
+    failures = {'a.mp4': TIMEOUT, 'b.mp4': ERROR, 'c.mp4': TIMEOUT, 'd.mp4': QUARANTINED}
+    assert describe_failures(failures) == '2 timed out, 1 unreadable, 1 quarantined'
+    assert describe_failures({}) == ''
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="needs a shell script for ffprobe")
+def test_stuck_ffprobe_is_killed(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    ffprobe = bin_dir / 'ffprobe'
+    ffprobe.write_text(f"#!/bin/sh\nexec {sys.executable} -c 'import time; time.sleep(30)'\n")
+    ffprobe.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir))
+    clip = tmp_path / 'clip.mp4'
+    clip.write_bytes(b'broken')
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        get_ffprobe_tags(clip, timeout=0.2)
+    assert time.monotonic() - started < 5
+
+
+def test_cli_lists_and_releases(tmp_path, capsys):
+    broken = tmp_path / 'broken.mp4'
+    flaky = tmp_path / 'flaky.mp4'
+    for path in (broken, flaky):
+        path.write_bytes(b'broken')
+    quarantine = Quarantine()
+    fail_twice(quarantine, broken)
+    quarantine.record(flaky, os.stat(flaky), ERROR, 'mp4')
+    quarantine.close()
+
+    assert cli.main(['quarantine']) == 0
+    listed = {line.split('\t')[0]: line.split('\t')[1:4] for line in capsys.readouterr().out.splitlines()}
+    assert listed == {str(broken): ['quarantined', '2 x timeout', 'ffprobe'],
+                      str(flaky): ['failed', '1 x error', 'mp4']}
+
+    assert cli.main(['quarantine', '--release', str(broken)]) == 0
+    assert 'Released 1 files' in capsys.readouterr().err
+    assert cli.main(['quarantine']) == 0
+    assert [line.split('\t')[0] for line in capsys.readouterr().out.splitlines()] == [str(flaky)]
+
+
+def test_preview_reports_failure_counts(capsys):
+    engine = SimpleNamespace(failures={'a.mp4': TIMEOUT, 'b.mp4': TIMEOUT, 'c.jpg': ERROR})
+    cli.report_failures(engine)
+    assert "Dates of 3 files could not be read from their metadata (2 timed out, 1 unreadable)" \
+        in capsys.readouterr().err
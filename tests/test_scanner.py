@@ -0,0 +1,41 @@
+import os
+
+from pavo.scanner import scan
+
+
+def make_tree(root, *paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(b'')
+
+
+def scanned(root, **options):
+    return sorted(entry.path[len(str(root)) + 1:] for entry in scan(root, recursive=True, **options))
+
+
+def test_include_matches_folders(tmp_path):
+    make_tree(tmp_path, 'a.jpg', 'DCIM/100CANON/b.jpg', 'DCIM/101CANON/c.mp4', 'Other/d.jpg')
+    assert scanned(tmp_path, include=['1*CANON']) == ['DCIM/100CANON/b.jpg', 'DCIM/101CANON/c.mp4']
+    assert scanned(tmp_path, include=['DCIM/100*']) == ['DCIM/100CANON/b.jpg']
+
+
+def test_include_can_take_root_files(tmp_path):
+    make_tree(tmp_path, 'a.jpg', 'DCIM/100CANON/b.jpg', 'Other/d.jpg')
+    assert scanned(tmp_path, include=['*']) == ['DCIM/100CANON/b.jpg', 'Other/d.jpg', 'a.jpg']
+    assert scanned(tmp_path, include=['.', 'Other']) == ['Other/d.jpg', 'a.jpg']
+
+
+def test_exclude_prunes_and_skips_hidden(tmp_path):
+    make_tree(tmp_path, 'a.jpg', '.thumbnails/t.jpg', 'Other/d.jpg', 'notes.txt')
+    assert scanned(tmp_path) == ['Other/d.jpg', 'a.jpg']
+    assert scanned(tmp_path, exclude=['Other']) == ['.thumbnails/t.jpg', 'a.jpg']
+
+
+def test_top_folder_only_unless_recursive(tmp_path):
+    make_tree(tmp_path, 'b.JPG', 'a.mp4', 'IMG.', 'jpg', 'DCIM/100GOPRO/GOPR0001.MP4')
+    entries = list(scan(tmp_path))
+    assert sorted(entry.name for entry in entries) == ['a.mp4', 'b.JPG']
+    assert {entry.suffix for entry in entries} == {'.jpg', '.mp4'}
+    # The stat came with the listing
+    assert all(entry.stat.st_ino == os.stat(entry).st_ino for entry in entries)
+    assert scanned(tmp_path) == ['DCIM/100GOPRO/GOPR0001.MP4', 'a.mp4', 'b.JPG']
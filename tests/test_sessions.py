@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from pavo.core import OrganizeOptions
+from pavo.sessions import TYPE_IMAGE, TYPE_VIDEO, GapIndex
+
+TIMES = [
+    datetime(2023, 6, 1, 8, 30),
+    datetime(2023, 6, 1, 8, 45),
+    datetime(2023, 6, 1, 11, 0),
+    datetime(2023, 6, 1, 23, 50),
+    datetime(2023, 6, 2, 0, 10),
+]
+TYPES = [TYPE_IMAGE, TYPE_VIDEO, TYPE_IMAGE, TYPE_IMAGE, TYPE_IMAGE]
+
+
+def test_threshold_moves_session_boundaries():
+    index = GapIndex(TIMES, TYPES)
+    assert index.session_starts(60, separate_by_date=False).tolist() == [True, False, True, True, False]
+    assert index.session_starts(180, separate_by_date=False).tolist() == [True, False, False, True, False]
+    assert index.session_starts(180).tolist() == [True, False, False, True, True]
+    assert index.session_starts(180, separate_by_session=False).tolist() == [True, False, False, False, True]
+
+
+def test_group_keys():
+    grouping = GapIndex(TIMES, TYPES).group(OrganizeOptions(time_gap_minutes=60))
+    assert grouping.session_count == 4
+    assert list(grouping) == [
+        '2023-06-01/Session1_08.30/Photos',
+        '2023-06-01/Session1_08.30/Videos',
+        '2023-06-01/Session2_11.00/Photos',
+        '2023-06-01/Session3_23.50/Photos',
+        # A new date starts its sessions from 1 again
+        '2023-06-02/Session1_00.10/Photos',
+    ]
+    assert list(grouping) == [grouping[i] for i in range(len(grouping))]
+
+
+def test_no_separation_is_one_folder():
+    options = OrganizeOptions(separate_by_date=False, separate_by_session=False, separate_by_type=False)
+    assert set(GapIndex(TIMES, TYPES).group(options)) == {'All_Files'}
+    assert list(GapIndex([], []).group(OrganizeOptions())) == []
+
+
+def test_gap_histogram():
+    counts, edges = GapIndex(TIMES, TYPES).gap_histogram()
+    assert counts.sum() == 4 and len(edges) == len(counts) + 1
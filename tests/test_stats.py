@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+from pavo import stats
+from pavo.stats import RunStats, add_bytes_read, note_extractor, note_failure, traced
+
+
+def two_extractors(path):
+    note_extractor('exif')
+    add_bytes_read(100)
+    note_failure('error')
+    note_extractor('pil')
+    add_bytes_read(4000)
+    time.sleep(0.01)
+    return path
+
+
+def test_traced_splits_time_between_extractors():
+    result, timings, bytes_read, failures = traced(two_extractors, 'IMG_0001.jpg')
+    assert result == 'IMG_0001.jpg'
+    assert [name for name, _ in timings] == ['exif', 'pil']
+    assert timings[1][1] >= 0.01 > timings[0][1]
+    assert (bytes_read, failures) == (4100, (('exif', 'error'),))
+    # Outside traced() the notes go nowhere
+    note_extractor('exif')
+    add_bytes_read(1)
+    assert traced(lambda: None)[1:] == ((), 0, ())
+
+
+def test_run_stats_report(tmp_path):
+    run = RunStats('scan', slowest=2)
+    with run.stage('extract'):
+        pass
+    for n, seconds in enumerate([0.001, 0.2, 0.05]):
+        run.record_extraction(f"IMG_{n}.jpg", 'EXIF', (('exif', seconds),), bytes_read=1000)
+    run.record_lookup('cache', 'Metadata')
+    run.record_failure('timeout', 'ffprobe')
+
+    data = run.to_dict()
+    assert data['files'] == 4 and data['bytes_read'] == 3000
+    assert data['stages']['extract']['calls'] == 1
+    assert data['lookups'] == {'extracted': 3, 'cache': 1}
+    assert data['sources'] == {'EXIF': {'files': 3, 'share': 0.75}, 'Metadata': {'files': 1, 'share': 0.25}}
+    assert data['extractors']['exif']['calls'] == 3
+    assert data['latency']['histogram_ms']['<=1'] == 1
+    assert [entry['path'] for entry in data['slowest']] == ['IMG_1.jpg', 'IMG_2.jpg']
+    assert data['failures'] == [{'kind': 'timeout', 'extractor': 'ffprobe', 'files': 1}]
+    assert any('Slowest files:' == line for line in run.summary())
+
+    path = run.save(tmp_path / 'stats.json')
+    assert json.loads(path.read_text()) == data
+
+
+def test_profiles_are_saved_beside_the_stats_and_pruned_with_them():
+    paths = []
+    for _ in range(3):
+        run = RunStats('apply', profile=True)
+        with run.stage('apply'):
+            sum(range(1000))
+        paths.append(run.save())
+    assert all(path.parent == stats.get_stats_dir() and path.with_suffix('.prof').exists() for path in paths)
+    stats.prune_stats(keep=2)
+    assert sorted(os.listdir(stats.get_stats_dir())) == sorted(
+        name for path in paths[1:] for name in (path.name, path.with_suffix('.prof').name))
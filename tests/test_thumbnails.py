@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+import time
+
+from PIL import Image, JpegImagePlugin
+
+from pavo import thumbnails
+from pavo.thumbnails import TAG_ORIENTATION, ThumbnailCache, ThumbnailLoader, image_thumbnail, make_thumbnail
+
+
+def make_jpeg(path, size=(1600, 1200), orientation=None):
+    image = Image.new('RGB', size, (200, 30, 30))
+    exif = image.getexif()
+    if orientation:
+        exif[TAG_ORIENTATION] = orientation
+    image.save(path, 'JPEG', exif=exif)
+    return path
+
+
+def test_jpegs_are_decoded_scaled_down(tmp_path, monkeypatch):
+    drafts = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft',
+                        lambda self, mode, size: drafts.append(size) or draft(self, mode, size))
+    thumbnail = image_thumbnail(make_jpeg(tmp_path / 'IMG_0001.jpg'))
+    assert drafts[0] == (80, 60)
+    assert thumbnail.size == (80, 60)
+
+
+def test_rotated_photos_are_shown_upright(tmp_path):
+    thumbnail = image_thumbnail(make_jpeg(tmp_path / 'IMG_0001.jpg', (1600, 1200), orientation=6))
+    assert thumbnail.size == (45, 60)
+
+
+def test_videos_use_their_thm_sidecar(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, 'ffmpeg_keyframe', lambda path, size: None)
+    for folder in ('bare', 'camera'):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / 'MVI_0001.MP4').write_bytes(b'not decodable')
+    assert make_thumbnail(tmp_path / 'bare' / 'MVI_0001.MP4') == b''
+    make_jpeg(tmp_path / 'camera' / 'MVI_0001.THM', (160, 120))
+    clip = tmp_path / 'camera' / 'MVI_0001.MP4'
+    with Image.open(io.BytesIO(make_thumbnail(clip))) as thumbnail:
+        assert thumbnail.size == (80, 60)
+
+
+def test_cache_checks_the_file_and_evicts_oldest(tmp_path):
+    paths = [make_jpeg(tmp_path / f"IMG_{n}.jpg", (16, 12)) for n in range(3)]
+    cache = ThumbnailCache(tmp_path / 'thumbnails.sqlite3', max_bytes=2500)
+    for path in paths:
+        cache.store(path, os.stat(path), '80x60', b'x' * 1000)
+    # The third went over max_bytes, and the first made room
+    assert cache.lookup(paths[0], os.stat(paths[0]), '80x60') is None
+    assert cache.lookup(paths[2], os.stat(paths[2]), '80x60') == b'x' * 1000
+    assert cache.lookup(paths[2], os.stat(paths[2]), '160x120') is None
+    make_jpeg(paths[1], (20, 12))
+    assert cache.lookup(paths[1], os.stat(paths[1]), '80x60') is None
+    cache.close()
+
+
+def test_files_scrolled_past_are_never_decoded(tmp_path, monkeypatch):
+    paths = [os.fspath(make_jpeg(tmp_path / f"IMG_{n}.jpg", (16, 12))) for n in range(3)]
+    release = threading.Event()
+    made = []
+
+    def slow_thumbnail(path, size):
+        made.append(path)
+        release.wait(5)
+        return b''
+    monkeypatch.setattr(thumbnails, 'make_thumbnail', slow_thumbnail)
+    loader = ThumbnailLoader(max_workers=1)
+    try:
+        loader.request(paths[:2])
+        # The user scrolls on while the first is still being made
+        while not made:
+            time.sleep(0.01)
+        loader.request(paths[2:])
+        release.set()
+        results = []
+        deadline = time.monotonic() + 5
+        while len(results) < 2 and time.monotonic() < deadline:
+            results += loader.results()
+            time.sleep(0.01)
+    finally:
+        loader.shutdown()
+    assert made == [paths[0], paths[2]]
+    assert results == [(paths[0], None), (paths[2], None)]
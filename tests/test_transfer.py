@@ -0,0 +1,78 @@
+import errno
+import os
+
+import pytest
+
+from pavo import transfer
+from pavo.mover import import_file
+from pavo.transfer import VerificationError, copy_file, file_digest
+
+
+def corrupting_copy(copy_data):
+    # Copies as usual, then flips a byte of the destination, as a bad card
+    # reader or cable would
+    def copy(fsrc, fdst, size, hasher=None):
+        copied = copy_data(fsrc, fdst, size, hasher)
+        fdst.flush()
+        byte = os.pread(fsrc.fileno(), 1, size // 2)
+        os.pwrite(fdst.fileno(), bytes([byte[0] ^ 0xFF]), size // 2)
+        return copied
+    return copy
+
+
+def test_copy_is_verified_against_source(tmp_path):
+    src = tmp_path / 'a.jpg'
+    src.write_bytes(os.urandom(100_000))
+    checksum = copy_file(src, tmp_path / 'b.jpg')
+    assert (tmp_path / 'b.jpg').read_bytes() == src.read_bytes()
+    assert bytes.fromhex(checksum) == file_digest(src)
+
+
+@pytest.mark.parametrize('unsupported', [['_copy_file_range'], ['_copy_file_range', '_sendfile']])
+def test_copy_falls_back_where_kernel_copies_are_refused(tmp_path, monkeypatch, unsupported):
+    def refuse(src_fd, dst_fd, count):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    for name in unsupported:
+        monkeypatch.setattr(transfer, name, refuse)
+    src = tmp_path / 'a.jpg'
+    src.write_bytes(os.urandom(3 * 1024 * 1024 + 5))
+    monkeypatch.setattr(transfer, 'COPY_CHUNK', 1024 * 1024)
+    checksum = copy_file(src, tmp_path / 'b.jpg')
+    assert (tmp_path / 'b.jpg').read_bytes() == src.read_bytes()
+    assert bytes.fromhex(checksum) == file_digest(src)
+    assert os.stat(tmp_path / 'b.jpg').st_mtime_ns == os.stat(src).st_mtime_ns
+
+
+def test_corrupted_destination_fails_verification(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, 'copy_data', corrupting_copy(transfer.copy_data))
+    src = tmp_path / 'a.jpg'
+    src.write_bytes(os.urandom(100_000))
+    with pytest.raises(VerificationError):
+        copy_file(src, tmp_path / 'b.jpg', read_back=True)
+    assert not (tmp_path / 'b.jpg').exists()
+
+
+def test_copy_is_read_once_unless_source_is_deleted(tmp_path, monkeypatch):
+    read_back = []
+    monkeypatch.setattr(transfer, 'file_digest', lambda path, drop_cache=False: read_back.append(path))
+    src = tmp_path / 'a.jpg'
+    src.write_bytes(os.urandom(100_000))
+    library = tmp_path / 'library'
+    library.mkdir()
+    import_file(src, library / 'a.jpg', delete_source=False, verify=True)
+    assert read_back == []
+    with pytest.raises(VerificationError):
+        import_file(src, library / 'b.jpg', delete_source=True)
+    assert len(read_back) == 1 and src.exists()
+
+
+def test_import_keeps_source_when_copy_is_corrupted(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, 'copy_data', corrupting_copy(transfer.copy_data))
+    src = tmp_path / 'a.jpg'
+    src.write_bytes(os.urandom(100_000))
+    library = tmp_path / 'library'
+    library.mkdir()
+    with pytest.raises(VerificationError):
+        import_file(src, library / 'a.jpg', delete_source=True)
+    assert src.exists()
+    assert os.listdir(library) == []
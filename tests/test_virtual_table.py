@@ -0,0 +1,63 @@
+import tkinter as tk
+
+import pytest
+
+from pavo.virtual_table import VirtualTable
+
+COLUMNS = [('name', "Name", 200), ('source', "Source", 100)]
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+def make_rows(count):
+    return [(f"IMG_{n:06}.jpg", 'File System' if n % 10 == 0 else 'EXIF') for n in range(count)]
+
+
+def shown(table):
+    return [table.tree.item(iid, 'values')[0] for iid in table.tree.get_children()]
+
+
+def test_only_the_window_is_in_tk(root):
+    table = VirtualTable(root, COLUMNS, height=10, margin=2)
+    table.set_rows(make_rows(100_000))
+    assert len(table.tree.get_children()) == 12
+    table.scroll(50_000)
+    assert shown(table)[0] == 'IMG_050000.jpg'
+    assert len(table.tree.get_children()) == 12
+    table.clear()
+    assert table.tree.get_children() == ()
+
+
+def test_sort_and_filter(root):
+    table = VirtualTable(root, COLUMNS, height=10)
+    table.set_rows(make_rows(1000))
+    table.set_filter(lambda row: row[1] == 'File System')
+    assert len(table.view) == 100
+    assert shown(table)[:2] == ['IMG_000000.jpg', 'IMG_000010.jpg']
+    table.sort_by('name')
+    table.sort_by('name')
+    assert shown(table)[0] == 'IMG_000990.jpg'
+    table.set_filter(None)
+    assert len(table.view) == 1000 and shown(table)[0] == 'IMG_000999.jpg'
+
+
+def test_rows_are_added_in_chunks(root):
+    table = VirtualTable(root, COLUMNS, height=10, chunk_size=100, chunk_delay=20)
+    table.append_rows(make_rows(250))
+    assert len(table) == 0
+    sizes = []
+    while len(table) < 250:
+        root.after(5)
+        root.update()
+        sizes.append(len(table))
+    # and show up while the rest are still waiting
+    assert {100, 200} <= set(sizes) and shown(table)[0] == 'IMG_000000.jpg'
@@ -0,0 +1,147 @@
+import os
+import time
+
+from PIL import Image
+
+from pavo import watch
+from pavo.cache import MetadataCache
+from pavo.core import OrganizeOptions
+from pavo.engine import ExtractionEngine
+from pavo.journal import latest_undoable_journal
+from pavo.quarantine import ERROR
+
+
+def make_photo(path, taken):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = Image.new('RGB', (8, 8))
+    exif = image.getexif()
+    exif[0x0132] = taken
+    image.save(path, exif=exif)
+    return path
+
+
+def make_daemon(tmp_path, monkeypatch, cache=None):
+    pruned = []
+    monkeypatch.setattr(watch, 'prune_journals', lambda: pruned.append(True))
+    engine = ExtractionEngine(max_threads=2, max_processes=1, cache=cache)
+    daemon = watch.WatchDaemon(tmp_path / 'drop', tmp_path / 'library', OrganizeOptions(), engine, poll=True)
+    return daemon, engine, pruned
+
+
+def test_batch_is_moved_journaled_and_cached(tmp_path, monkeypatch):
+    drop = tmp_path / 'drop'
+    paths = [make_photo(drop / f"IMG_{n:04}.jpg", f"2023:06:01 08:30:{n:02}") for n in range(3)]
+    daemon, engine, pruned = make_daemon(tmp_path, monkeypatch, MetadataCache())
+    try:
+        assert daemon.process_batch([str(path) for path in paths]) == 0
+        moved = sorted(path for path in (tmp_path / 'library').rglob('*.jpg'))
+        assert len(moved) == 3 and not any(path.exists() for path in paths)
+        # The dates moved with the files
+        for path in moved:
+            assert engine.cache.lookup(path, os.stat(path)) is not None
+    finally:
+        engine.shutdown()
+    # Batches don't prune journals; the watch loop does, now and then
+    assert pruned == []
+
+    journal = latest_undoable_journal()
+    assert len(journal.undoable) == 3 and journal.options['watch']
+
+
+def test_failures_are_reported_per_batch(tmp_path, monkeypatch):
+    drop = tmp_path / 'drop'
+    broken = drop / 'IMG_0001.jpg'
+    broken.parent.mkdir(parents=True)
+    broken.write_bytes(b'\xff\xd8 not really a jpeg')
+    good = make_photo(drop / 'IMG_0002.jpg', '2023:06:01 08:30:00')
+    reports = []
+    daemon, engine, _ = make_daemon(tmp_path, monkeypatch)
+    daemon.report = reports.append
+    try:
+        daemon.process_batch([str(broken)])
+        assert engine.failures == {str(broken): ERROR}
+        assert 'without readable metadata' in reports[-1]
+        daemon.process_batch([str(good)])
+        assert engine.failures == {}
+        assert 'without readable metadata' not in reports[-1]
+    finally:
+        engine.shutdown()
+
+
+def test_watch_loop_prunes_journals_once(tmp_path, monkeypatch):
+    (tmp_path / 'drop').mkdir()
+    daemon, engine, pruned = make_daemon(tmp_path, monkeypatch)
+    ticks = []
+
+    def changes(timeout):
+        ticks.append(timeout)
+        if len(ticks) == 3:
+            daemon.stop()
+        return []
+    daemon.watcher.changes = changes
+    try:
+        daemon.run()
+    finally:
+        engine.shutdown()
+    assert len(ticks) == 3 and pruned == [True]
+
+
+def test_files_settle_once_left_alone(tmp_path):
+    path = tmp_path / 'IMG_0001.jpg'
+    path.write_bytes(b'half')
+    settler = watch.Settler(settle_seconds=60)
+    settler.add(str(path))
+    assert settler.ready() == []
+    # Still recent, so not yet
+    assert settler.ready() == []
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    # Changed since the last check
+    assert settler.ready() == []
+    assert settler.ready() == [str(path)] and len(settler) == 0
+
+    settler.add(str(tmp_path / 'gone.jpg'))
+    assert settler.ready() == [] and len(settler) == 0
+
+
+def test_batches_wait_for_a_quiet_spell():
+    batcher = watch.Batcher(debounce_seconds=2, max_batch=4, max_wait=10)
+    batcher.add(['a', 'b'], now=0)
+    assert batcher.take(now=1) == []
+    batcher.add(['c'], now=1.5)
+    assert batcher.take(now=3) == []
+    assert batcher.take(now=3.5) == ['a', 'b', 'c']
+
+    # A full batch goes straight away; the rest waits for quiet again
+    batcher.add(['d', 'e', 'f', 'g', 'h'], now=5)
+    assert batcher.take(now=5) == ['d', 'e', 'f', 'g']
+    assert batcher.take(now=6) == []
+    assert batcher.take(now=7) == ['h'] and len(batcher) == 0
+
+
+def test_steady_trickle_goes_out_after_max_wait():
+    batcher = watch.Batcher(debounce_seconds=2, max_batch=100, max_wait=10)
+    for now in range(12):
+        batcher.add([now], now=now)
+        batch = batcher.take(now)
+        if batch:
+            break
+    assert now == 10 and batch == list(range(11))
+
+
+def test_watchers_see_new_files(tmp_path):
+    for name, make in (('poll', lambda drop: watch.PollingWatcher(drop, interval=0)), ('native', watch.make_watcher)):
+        drop = tmp_path / name
+        make_photo(drop / 'IMG_0001.jpg', '2023:06:01 08:30:00')
+        watcher = make(drop)
+        try:
+            assert watcher.initial() == [str(drop / 'IMG_0001.jpg')]
+            new = make_photo(drop / 'DCIM' / 'IMG_0002.jpg', '2023:06:01 08:30:00')
+            (drop / 'notes.txt').write_text('not media')
+            changes = []
+            deadline = time.monotonic() + 5
+            while str(new) not in changes and time.monotonic() < deadline:
+                changes += watcher.changes(0.1)
+            assert set(changes) == {str(new)}
+        finally:
+            watcher.close()